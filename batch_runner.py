@@ -0,0 +1,316 @@
+# Batch runner for what-if studies: runs the cost model and the skipping
+# simulation for every scenario of a manifest on one pool of processes.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from mip import OptimizationStatus
+from cost_model import build_cost_model
+from find_skipping_coeff import random_simulation
+from input_reader import BaseLoopInputData
+from instrumentation import optimize_model
+from simulation_results import write_checkpoint, read_checkpoint
+
+# settings of a scenario that the manifest does not give
+DEFAULT_SCENARIO = {'seed': 0, 'neighbourhood': 10, 'num_simulation': 100000, \
+                    'trigger_points': 'zero', 'cost_tolerance': None}
+# arrays of an input that are shared with the workers
+SHARED_ARRAYS = ['demand_schedule_array', 'production_times_array', \
+                 'inventory_cost_array', 'changeover_cost_array', \
+                 'initial_inventories_array', 'trigger_points_array']
+# columns of the results table
+RESULT_COLUMNS = ['name', 'input', 'seed', 'neighbourhood', 'num_simulation', \
+                  'trigger_points', 'cost_tolerance', 'status', \
+                  'cost_model_lambda', 'lambda', 'avg_baseloop', \
+                  'num_kept', 'cost_model_time', 'simulation_time', \
+                  'total_time', 'error']
+
+# inputs attached by each worker, keyed by (input path, seed)
+worker_inputs = {}
+
+
+def load_manifest(manifest_filename):
+    '''
+    Reads the scenarios of a json manifest. The manifest holds a list of
+    scenarios under "scenarios", and optionally settings shared by all of them
+    under "defaults" and lists of values under "grid". Each scenario is run
+    for every combination of the grid values. A scenario has a "name", an
+    "input" csv path relative to the manifest, and the settings of
+    DEFAULT_SCENARIO. trigger_points is "zero", "input" for the trigger points
+    of the csv, or a list.
+
+    PARAMETERS:
+    manifest_filename := the path of the json manifest
+
+    RETURN:
+    A list of scenario dictionaries
+    '''
+    with open(manifest_filename, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_filename))
+    defaults = dict(DEFAULT_SCENARIO, **manifest.get('defaults', {}))
+    grid = manifest.get('grid', {})
+    grid_keys = sorted(grid)
+
+    scenarios = []
+    for k, base_scenario in enumerate(manifest['scenarios']):
+        base_scenario = dict(defaults, **base_scenario)
+        base_scenario.setdefault('name', 'scenario{}'.format(k))
+        base_scenario['input'] = os.path.join(manifest_dir, base_scenario['input'])
+        for values in itertools.product(*[grid[key] for key in grid_keys]):
+            scenario = dict(base_scenario, **dict(zip(grid_keys, values)))
+            if grid_keys:
+                scenario['name'] = base_scenario['name'] + ''.join(\
+                    '-{}={}'.format(key, value) for key, value in \
+                    zip(grid_keys, values))
+            scenarios.append(scenario)
+    return scenarios
+
+
+def share_input(csv_input):
+    '''
+    Copies the arrays of an input into one block of shared memory
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData
+
+    RETURN:
+    A tuple of the SharedMemory block and a descriptor the workers attach to
+    the block with
+    '''
+    arrays = [np.ascontiguousarray(getattr(csv_input, name), dtype=float) \
+              for name in SHARED_ARRAYS]
+    size = sum(array.nbytes for array in arrays)
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = []
+    offset = 0
+    for name, array in zip(SHARED_ARRAYS, arrays):
+        np.ndarray(array.shape, dtype=float, buffer=block.buf, offset=offset)[...] = array
+        layout.append((name, array.shape, offset))
+        offset += array.nbytes
+    descriptor = {'block_name': block.name, 'layout': layout, \
+                  'total_time': csv_input.total_time, \
+                  'cost_tolerance': csv_input.cost_tolerance}
+    return block, descriptor
+
+
+def attach_inputs(descriptors):
+    '''
+    Initializes a worker: attaches the shared inputs once, as read-only
+    arrays, for all the scenarios the worker runs
+
+    PARAMETERS:
+    descriptors := a dictionary of the descriptors of share_input, keyed by
+                   (input path, seed)
+
+    RETURN:
+    None
+    '''
+    for key, descriptor in descriptors.items():
+        block = shared_memory.SharedMemory(name=descriptor['block_name'])
+        arrays = {'block': block, 'total_time': descriptor['total_time'], \
+                  'cost_tolerance': descriptor['cost_tolerance']}
+        for name, shape, offset in descriptor['layout']:
+            array = np.ndarray(shape, dtype=float, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        worker_inputs[key] = arrays
+
+
+def run_scenario(scenario):
+    '''
+    Runs one scenario as find_skipping_coeff.main does: solves the cost model
+    and runs the random simulation around its Lambdas
+
+    PARAMETERS:
+    scenario := a scenario dictionary of load_manifest
+
+    RETURN:
+    A dictionary with the RESULT_COLUMNS of the scenario
+    '''
+    start = time.perf_counter()
+    result = {column: None for column in RESULT_COLUMNS}
+    result.update({key: scenario[key] for key in ('name', 'input', 'seed', \
+                   'neighbourhood', 'num_simulation', 'trigger_points')})
+    try:
+        data = worker_inputs[(scenario['input'], scenario['seed'])]
+        demand_schedule = data['demand_schedule_array']
+        num_periods, num_items = demand_schedule.shape
+        cost_tolerance = scenario['cost_tolerance']
+        if cost_tolerance is None:
+            cost_tolerance = data['cost_tolerance']
+        result['cost_tolerance'] = cost_tolerance
+        if scenario['trigger_points'] == 'zero':
+            trigger_points = np.zeros(num_items)
+        elif scenario['trigger_points'] == 'input':
+            trigger_points = data['trigger_points_array']
+        else:
+            trigger_points = np.asarray(scenario['trigger_points'], dtype=float)
+
+        demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+        model, Lambda = build_cost_model(num_items, num_periods, \
+                                         data['production_times_array'], \
+                                         data['total_time'], \
+                                         data['initial_inventories_array'], \
+                                         demand_schedule, cost_tolerance, \
+                                         data['changeover_cost_array'], \
+                                         data['inventory_cost_array'], \
+                                         demand_schedule_init)
+        model.verbose = 0
+        status = optimize_model(model, 'optimize_cost_model')
+        result['cost_model_time'] = time.perf_counter() - start
+        if status not in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE):
+            result['status'] = 'no cost model solution'
+            return result
+        cost_model_lambda = [Lambda[i].x for i in range(num_items)]
+        result['cost_model_lambda'] = cost_model_lambda
+
+        simulation_start = time.perf_counter()
+        feasible_results = random_simulation(num_items, num_periods, \
+                           data['initial_inventories_array'], \
+                           data['inventory_cost_array'], \
+                           data['changeover_cost_array'], trigger_points, \
+                           demand_schedule, data['production_times_array'], \
+                           cost_tolerance, data['total_time'], \
+                           scenario['num_simulation'], cost_model_lambda, \
+                           scenario['neighbourhood'], \
+                           rng=random.Random(scenario['seed']), prune=True)
+        result['simulation_time'] = time.perf_counter() - simulation_start
+        result['num_kept'] = len(feasible_results)
+        if len(feasible_results) > 0:
+            result['avg_baseloop'], result['lambda'] = feasible_results.best()[0]
+            result['status'] = 'feasible'
+        else:
+            result['status'] = 'no feasible lambda'
+    except Exception as error:
+        # one failing scenario does not stop the batch
+        result['status'] = 'error'
+        result['error'] = repr(error)
+    finally:
+        result['total_time'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(scenarios, results_filename, num_workers=None, resume=False):
+    '''
+    Runs all scenarios on a pool of processes. Each input file is read once
+    per seed and shared with the workers, and each worker imports the solver
+    once for all its scenarios. The results are written as a csv table in the
+    order of the scenarios.
+
+    The result of each finished scenario is saved in a checkpoint next to the
+    results table, see get_batch_checkpoint_path, which is removed once the
+    table is written. A batch that was killed is resumed from it.
+
+    PARAMETERS:
+    scenarios := a list of scenario dictionaries of load_manifest
+    results_filename := the path of the csv results table
+    num_workers := the number of worker processes, by default the number of
+                   CPUs. With a single worker the scenarios run in this process
+    resume := whether to skip the scenarios finished in the checkpoint
+
+    RETURN:
+    The list of result dictionaries, see run_scenario
+    '''
+    checkpoint_path = get_batch_checkpoint_path(results_filename)
+    names = [scenario['name'] for scenario in scenarios]
+    finished = {}
+    checkpoint = read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        if checkpoint['names'] != names:
+            raise ValueError("checkpoint {} was saved by a different " \
+                             "batch".format(checkpoint_path))
+        finished = {int(k): result for k, result in checkpoint['results'].items()}
+    pending = [k for k in range(len(scenarios)) if k not in finished]
+
+    def save_result(k, result):
+        finished[k] = result
+        write_checkpoint(checkpoint_path, {'names': names, 'results': finished})
+
+    blocks = []
+    descriptors = {}
+    try:
+        for k in pending:
+            key = (scenarios[k]['input'], scenarios[k]['seed'])
+            if key not in descriptors:
+                block, descriptors[key] = share_input(BaseLoopInputData(*key))
+                blocks.append(block)
+
+        if num_workers == 1:
+            attach_inputs(descriptors)
+            for k in pending:
+                save_result(k, run_scenario(scenarios[k]))
+            worker_inputs.clear()
+        elif pending:
+            with ProcessPoolExecutor(max_workers=num_workers, \
+                                     initializer=attach_inputs, \
+                                     initargs=(descriptors,)) as executor:
+                futures = {executor.submit(run_scenario, scenarios[k]): k \
+                           for k in pending}
+                for future in as_completed(futures):
+                    save_result(futures[future], future.result())
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = [finished[k] for k in range(len(scenarios))]
+    write_results(results, results_filename)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return results
+
+
+def get_batch_checkpoint_path(results_filename):
+    '''
+    Returns the path of the checkpoint of the batch writing results_filename
+    '''
+    return results_filename + '.checkpoint.json'
+
+
+def write_results(results, results_filename):
+    '''
+    Writes the results of a batch as a csv table, lists as json
+
+    PARAMETERS:
+    results := the list of result dictionaries of run_scenario
+    results_filename := the path of the csv results table
+
+    RETURN:
+    None
+    '''
+    with open(results_filename, 'w', newline='', encoding='utf-8') as results_csv:
+        writer = csv.DictWriter(results_csv, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({column: json.dumps(value) if isinstance(value, list) \
+                             else value for column, value in result.items()})
+
+
+def main():
+
+    resume = '--resume' in sys.argv
+    argv = [arg for arg in sys.argv if arg != '--resume']
+    if len(argv) < 3:
+        print("usage: python batch_runner.py manifest.json results.csv " \
+              "[num_workers] [--resume]")
+        return
+    num_workers = int(argv[3]) if len(argv) > 3 else None
+
+    scenarios = load_manifest(argv[1])
+    start = time.perf_counter()
+    results = run_batch(scenarios, argv[2], num_workers, resume)
+    print("{} scenarios in {:.3f}s, results in {}".format(len(results), \
+          time.perf_counter() - start, argv[2]))
+
+if __name__ == "__main__":
+    main()
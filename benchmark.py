@@ -0,0 +1,389 @@
+# Benchmark suite: generates synthetic input files of chosen sizes and times
+# each stage of the model on them, against a saved baseline, and times how
+# building the cost model scales with its number of nonzeros.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from cost_model import build_cost_model
+from find_skipping_coeff import get_average_baseloop_time, \
+                                get_average_baseloop_time_batch, random_simulation
+from input_reader import BaseLoopInputData, get_length_demand_schedule
+
+# (number of items, demand horizon) of the default benchmark
+DEFAULT_SIZES = [(10, 'Monthly'), (100, 'Monthly'), (100, 'Weekly'), \
+                 (1000, 'Weekly'), (10000, 'Monthly')]
+# (number of items, number of periods) of the cost model build benchmark
+BUILD_SIZES = [(10, 12), (50, 12), (100, 12), (100, 52), (200, 52), (500, 52)]
+
+
+def write_synthetic_csv(filename, num_items, demand_horizon='Monthly', seed=0):
+    '''
+    Writes a random input file in the column layout of Input_Data.csv. Item
+    data is drawn from ranges like those of Input_Data.csv, with less spread
+    of demand. The total time of a period is 3 times the time needed to
+    produce the expected demand, and the cost tolerance grows with the number
+    of items and periods, so instances of all sizes have feasible base loops.
+
+    PARAMETERS:
+    filename := the path of the csv file
+    num_items := the number of items
+    demand_horizon := "Monthly", "Weekly", or a number of time periods
+    seed := seed of the random number generator
+
+    RETURN:
+    None
+    '''
+    rng = np.random.default_rng(seed)
+    num_periods = int(get_length_demand_schedule(demand_horizon))
+    expected_demand = rng.integers(1000, 50000, num_items)
+    stdev_demand = np.floor(expected_demand * rng.uniform(0.05, 0.3, num_items))
+    changeover_cost = rng.integers(100, 2000, num_items)
+    inventory_cost = np.round(rng.uniform(0.05, 0.35, num_items), 4)
+    machine_cycle_time = np.full(num_items, 60)
+    units_per_cycle = rng.integers(1500, 3000, num_items)
+    initial_inventory = expected_demand // 10
+    trigger_points = np.zeros(num_items, dtype=int)
+    total_time = np.ceil(3 * np.sum(expected_demand * machine_cycle_time / \
+                                      units_per_cycle))
+    cost_tolerance = 1e8 * num_items / 9 * num_periods / 12
+
+    with open(filename, 'w', encoding='utf-8') as synthetic_csv:
+        synthetic_csv.write("Item Name,Demand (items),Std Dev Demand (items),"
+                            "Change Over Cost (dollars),Inventory Price per Unit "
+                            "(dollars),Machine cycle time (minutes),Units per "
+                            "machine cycle (items),Initial Inventory (items) ,"
+                            "Trigger Points (items),{},Total Time (minutes):,{:.0f},"
+                            "Cost Tolerance (dollars):,{:.0f},,\n".format(\
+                            demand_horizon, total_time, cost_tolerance))
+        for i in range(num_items):
+            synthetic_csv.write("Item {},{},{:.0f},{},{},{},{},{},{},,,,,,,\n".format(\
+                                i, expected_demand[i], stdev_demand[i], \
+                                changeover_cost[i], inventory_cost[i], \
+                                machine_cycle_time[i], units_per_cycle[i], \
+                                initial_inventory[i], trigger_points[i]))
+
+
+def get_synthetic_instance(num_items, num_periods, seed=0):
+    '''
+    Generates a random instance of the cost model with the given size, by
+    reading a file of write_synthetic_csv
+
+    PARAMETERS:
+    num_items := total number of items
+    num_periods := total number of time periods
+    seed := seed of the random number generator
+
+    RETURN:
+    A dictionary of keyword arguments for build_cost_model
+    '''
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'synthetic.csv')
+        write_synthetic_csv(filename, num_items, num_periods, seed)
+        csv_input = BaseLoopInputData(filename, seed)
+
+    demand_schedule = csv_input.demand_schedule_array
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    return {'num_items': num_items, 'num_periods': num_periods, \
+            'unit_production_time': csv_input.production_times_array, \
+            'total_time': csv_input.total_time, \
+            'initial_inventory': csv_input.initial_inventories_array, \
+            'demand_schedule': demand_schedule, \
+            'cost_tolerance': csv_input.cost_tolerance, \
+            'changeover_cost': csv_input.changeover_cost_array, \
+            'holding_cost': csv_input.inventory_cost_array, \
+            'demand_schedule_init': demand_schedule_init}
+
+
+def time_build_cost_model(num_items, num_periods, repeats=3):
+    '''
+    Times build_cost_model on a synthetic instance
+
+    PARAMETERS:
+    num_items := total number of items
+    num_periods := total number of time periods
+    repeats := number of builds, the fastest one is reported
+
+    RETURN:
+    The fastest build time in seconds
+    '''
+    kwargs = get_synthetic_instance(num_items, num_periods)
+    build_times = []
+    for k in range(repeats):
+        start = time.perf_counter()
+        build_cost_model(**kwargs)
+        build_times.append(time.perf_counter() - start)
+    return min(build_times)
+
+
+def display_build_scaling(sizes=BUILD_SIZES):
+    '''
+    Displays the build time of the cost model per nonzero for each size.
+    Every demand constraint row holds one coefficient per item, so the build
+    time should grow linearly with the number of nonzeros.
+
+    PARAMETERS:
+    sizes := a list of (number of items, number of periods)
+
+    RETURN:
+    None
+    '''
+    print("{:>8} {:>8} {:>10} {:>12} {:>12} {:>12}".format("items", "periods", \
+          "rows", "nonzeros", "build (s)", "us per nz"))
+    for num_items, num_periods in sizes:
+        num_rows = num_items * num_periods + 2
+        num_nonzeros = num_items * num_rows
+        build_time = time_build_cost_model(num_items, num_periods)
+        print("{:>8} {:>8} {:>10} {:>12} {:>12.4f} {:>12.3f}".format(num_items, \
+              num_periods, num_rows, num_nonzeros, build_time, \
+              1e6 * build_time / num_nonzeros))
+
+
+def get_reference_lambdas(csv_input, loops_per_period=10):
+    '''
+    Gives Lambdas proportional to expected demand, scaled so that about
+    loops_per_period base loops fit in a period. The benchmark evaluates
+    Lambdas around them, so that evaluations run over the whole horizon
+    rather than failing in the first period.
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData
+    loops_per_period := the number of base loops in a period
+
+    RETURN:
+    A list of L integers
+    '''
+    expected_demand = np.maximum(csv_input.expected_demand_array, 1)
+    scale = csv_input.total_time / (loops_per_period * \
+            np.sum(expected_demand * csv_input.production_times_array))
+    return np.maximum(1, np.ceil(scale * expected_demand)).astype(int).tolist()
+
+
+def time_stage(function, *args, **kwargs):
+    '''
+    Runs a function twice: once to measure its time, then once to measure
+    the peak memory allocated by Python and NumPy while it runs, since
+    tracing allocations slows Python code down several times. Memory
+    allocated by the solver library is not seen.
+
+    RETURN:
+    A tuple of the return value of the first run, the time in seconds and
+    the peak memory in MB
+    '''
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args, **kwargs)
+    peak_memory = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return value, elapsed, peak_memory
+
+
+def benchmark_instance(num_items, demand_horizon, evaluation_budget=5e6, max_cost_model_items=200, cost_model_seconds=60, seed=0):
+    '''
+    Times each stage on one synthetic instance: reading the csv, building and
+    solving the cost model, evaluating Lambdas one at a time and in batches,
+    and the random simulation. The number of evaluations of a stage is chosen
+    so that it simulates about evaluation_budget item-periods.
+
+    PARAMETERS:
+    num_items := the number of items
+    demand_horizon := "Monthly", "Weekly", or a number of time periods
+    evaluation_budget := the number of item-periods each evaluation stage
+                         simulates, a tenth of it for the scalar evaluation
+    max_cost_model_items := the cost model is skipped for larger instances,
+                            its number of nonzeros grows as items squared
+    cost_model_seconds := time limit of the cost model solve
+    seed := seed of the instance and of the sampled Lambdas
+
+    RETURN:
+    A list of dictionaries, one per stage run, with the instance size, the
+    stage, the time, the evaluations per second (None for stages that do
+    not evaluate Lambdas) and the peak memory
+    '''
+    results = []
+
+    def record(stage, elapsed, peak_memory, num_evaluations=None):
+        results.append({'num_items': num_items, 'demand_horizon': demand_horizon, \
+                        'stage': stage, 'seconds': elapsed, \
+                        'evaluations_per_second': None if num_evaluations is None \
+                                                  else num_evaluations / elapsed, \
+                        'peak_memory_mb': peak_memory})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'synthetic.csv')
+        write_synthetic_csv(filename, num_items, demand_horizon, seed)
+        csv_input, elapsed, peak_memory = time_stage(BaseLoopInputData, filename, seed)
+        record('read', elapsed, peak_memory)
+
+    L = csv_input.num_items
+    J = csv_input.num_periods
+    D = csv_input.demand_schedule_array
+    I0 = csv_input.initial_inventories_array
+    h = csv_input.inventory_cost_array
+    a = csv_input.changeover_cost_array
+    t = csv_input.production_times_array
+    Tau = csv_input.cost_tolerance
+    T = csv_input.total_time
+    trigger_points = np.zeros(L)
+
+    if L <= max_cost_model_items:
+        demand_schedule_init = np.vstack((np.zeros((1, L)), D))
+        (model, Lambda), elapsed, peak_memory = time_stage(build_cost_model, \
+            L, J, t, T, I0, D, Tau, a, h, demand_schedule_init)
+        record('cost_model_build', elapsed, peak_memory)
+        model.verbose = 0
+        status, elapsed, peak_memory = time_stage(model.optimize, \
+                                                  max_seconds=cost_model_seconds)
+        record('cost_model_solve', elapsed, peak_memory)
+
+    reference_lambda = get_reference_lambdas(csv_input)
+    neighbourhood = max(1, min(reference_lambda) // 2)
+    rng = random.Random(seed)
+    num_evaluations = max(1, int(evaluation_budget / (L * J)))
+    Lambdas = [[max(1, value + rng.randint(-neighbourhood, neighbourhood)) \
+                for value in reference_lambda] for k in range(num_evaluations)]
+
+    # the scalar evaluation takes lists, as it is called in find_skipping_coeff
+    num_scalar = max(1, num_evaluations // 10)
+    lists = (I0.tolist(), h.tolist(), a.tolist(), trigger_points.tolist(), \
+             D.tolist(), t.tolist())
+    def evaluate_scalar():
+        for Lambda in Lambdas[:num_scalar]:
+            get_average_baseloop_time(L, J, lists[0], lists[1], lists[2], \
+                                      lists[3], lists[4], Lambda, lists[5], Tau, \
+                                      T, False)
+    value, elapsed, peak_memory = time_stage(evaluate_scalar)
+    record('scalar_evaluation', elapsed, peak_memory, num_scalar)
+
+    value, elapsed, peak_memory = time_stage(get_average_baseloop_time_batch, \
+                                             L, J, I0, h, a, trigger_points, D, \
+                                             Lambdas, t, Tau, T)
+    record('batch_evaluation', elapsed, peak_memory, num_evaluations)
+
+    value, elapsed, peak_memory = time_stage(random_simulation, L, J, I0, h, a, \
+                                             trigger_points, D, t, Tau, T, \
+                                             num_evaluations, reference_lambda, \
+                                             neighbourhood, rng=random.Random(seed))
+    record('random_simulation', elapsed, peak_memory, num_evaluations)
+
+    return results
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, **kwargs):
+    '''
+    Runs benchmark_instance for each size
+
+    PARAMETERS:
+    sizes := a list of (number of items, demand horizon)
+    kwargs := settings passed to benchmark_instance
+
+    RETURN:
+    A dictionary with the environment and the list of stage results, the
+    format saved as a baseline
+    '''
+    results = []
+    for num_items, demand_horizon in sizes:
+        results += benchmark_instance(num_items, demand_horizon, **kwargs)
+    return {'python': platform.python_version(), 'numpy': np.__version__, \
+            'machine': platform.machine(), 'results': results}
+
+
+def compare_to_baseline(benchmark, baseline, tolerance=0.25):
+    '''
+    Finds the stages that got slower than in a baseline
+
+    PARAMETERS:
+    benchmark := the dictionary returned by run_benchmarks
+    baseline := a dictionary returned by run_benchmarks earlier
+    tolerance := the relative slowdown that is not reported
+
+    RETURN:
+    A list of (num_items, demand_horizon, stage, seconds, baseline seconds)
+    tuples of the stages that regressed
+    '''
+    baseline_seconds = {(result['num_items'], result['demand_horizon'], \
+                         result['stage']): result['seconds'] for result in \
+                        baseline['results']}
+    regressions = []
+    for result in benchmark['results']:
+        key = (result['num_items'], result['demand_horizon'], result['stage'])
+        if key in baseline_seconds and \
+           result['seconds'] > baseline_seconds[key] * (1 + tolerance):
+            regressions.append(key + (result['seconds'], baseline_seconds[key]))
+    return regressions
+
+
+def display_benchmark_results(benchmark):
+    '''
+    Displays the stage results of a benchmark as a table
+
+    PARAMETERS:
+    benchmark := the dictionary returned by run_benchmarks
+
+    RETURN:
+    None
+    '''
+    print("{:>8} {:>8} {:>18} {:>12} {:>14} {:>12}".format("items", "horizon", \
+          "stage", "time (s)", "evals per s", "peak (MB)"))
+    for result in benchmark['results']:
+        evaluations_per_second = result['evaluations_per_second']
+        print("{:>8} {:>8} {:>18} {:>12.4f} {:>14} {:>12.1f}".format(\
+              result['num_items'], str(result['demand_horizon']), result['stage'], \
+              result['seconds'], '-' if evaluations_per_second is None else \
+              '{:.0f}'.format(evaluations_per_second), result['peak_memory_mb']))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times each stage of the "
+                                     "model on synthetic instances")
+    parser.add_argument('--sizes', nargs='*', default=None, metavar='ITEMS:HORIZON', \
+                        help="instance sizes, e.g. 100:Weekly 50:26")
+    parser.add_argument('--save', metavar='FILE', help="save the results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="compare with a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, \
+                        help="relative slowdown allowed by --compare")
+    parser.add_argument('--build-scaling', action='store_true', \
+                        help="only time building the cost model against its "
+                        "number of nonzeros")
+    args = parser.parse_args()
+
+    if args.build_scaling:
+        display_build_scaling()
+        return
+
+    sizes = DEFAULT_SIZES
+    if args.sizes:
+        sizes = []
+        for size in args.sizes:
+            num_items, demand_horizon = size.split(':')
+            sizes.append((int(num_items), demand_horizon))
+
+    benchmark = run_benchmarks(sizes)
+    display_benchmark_results(benchmark)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as baseline_file:
+            json.dump(benchmark, baseline_file, indent=1)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare_to_baseline(benchmark, json.load(baseline_file), \
+                                              args.tolerance)
+        for num_items, demand_horizon, stage, seconds, baseline_seconds in regressions:
+            print("Regression: {} items {} {}: {:.4f}s, baseline {:.4f}s".format(\
+                  num_items, demand_horizon, stage, seconds, baseline_seconds))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
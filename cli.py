@@ -0,0 +1,452 @@
+# Command-line entry point: reads an input, solves the cost model, evaluates
+# or searches Lambdas, and prints the result as json. The solver and the
+# simulation modules are only imported by the subcommands that use them, so
+# short evaluation jobs start without loading mip.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+# time the module was imported, close to the start of the process
+START_TIME = time.perf_counter()
+
+
+def read_input(args):
+    '''
+    Reads the input csv of a subcommand
+
+    PARAMETERS:
+    args := the parsed arguments, with input, seed and cache
+
+    RETURN:
+    A BaseLoopInputData
+    '''
+    from input_reader import BaseLoopInputData
+    return BaseLoopInputData(args.input, args.seed, use_cache=args.cache)
+
+
+def get_model_args(csv_input, args):
+    '''
+    Collects the data of the skipping model in the order of
+    get_average_baseloop_time, with the cost tolerance and trigger points of
+    the arguments
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData
+    args := the parsed arguments, with cost_tolerance and trigger_points
+
+    RETURN:
+    A tuple (L, J, I0, h, a, trigger_points, D, t, Tau, T)
+    '''
+    import numpy as np
+    num_items = csv_input.num_items
+    if args.trigger_points == 'zero':
+        trigger_points = np.zeros(num_items)
+    elif args.trigger_points == 'input':
+        trigger_points = csv_input.trigger_points_array
+    else:
+        trigger_points = np.asarray(json.loads(args.trigger_points), dtype=float)
+    cost_tolerance = csv_input.cost_tolerance if args.cost_tolerance is None \
+                     else args.cost_tolerance
+    return (num_items, csv_input.num_periods, csv_input.initial_inventories_array, \
+            csv_input.inventory_cost_array, csv_input.changeover_cost_array, \
+            trigger_points, csv_input.demand_schedule_array, \
+            csv_input.production_times_array, cost_tolerance, csv_input.total_time)
+
+
+def solve_input_cost_model(csv_input, args, **solver_options):
+    '''
+    Solves the cost model of an input with solve_cost_model
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData
+    args := the parsed arguments, with cost_tolerance
+    solver_options := the options of solve_cost_model
+
+    RETURN:
+    The result dictionary of solve_cost_model
+    '''
+    import numpy as np
+    from cost_model import solve_cost_model
+    num_items = csv_input.num_items
+    demand_schedule = csv_input.demand_schedule_array
+    cost_tolerance = csv_input.cost_tolerance if args.cost_tolerance is None \
+                     else args.cost_tolerance
+    return solve_cost_model(num_items, csv_input.num_periods, \
+                            csv_input.production_times_array, \
+                            csv_input.total_time, \
+                            csv_input.initial_inventories_array, \
+                            demand_schedule, cost_tolerance, \
+                            csv_input.changeover_cost_array, \
+                            csv_input.inventory_cost_array, \
+                            np.vstack((np.zeros((1, num_items)), demand_schedule)), \
+                            **solver_options)
+
+
+def command_read(args):
+    '''
+    Reads an input and returns its data
+    '''
+    csv_input = read_input(args)
+    return {'items': [csv_input.item_directory[i] for i in range(csv_input.num_items)], \
+            'num_items': csv_input.num_items, 'num_periods': csv_input.num_periods, \
+            'total_time': csv_input.total_time, \
+            'cost_tolerance': csv_input.cost_tolerance, \
+            'production_times': csv_input.production_times_array, \
+            'inventory_cost': csv_input.inventory_cost_array, \
+            'changeover_cost': csv_input.changeover_cost_array, \
+            'initial_inventories': csv_input.initial_inventories_array, \
+            'trigger_points': csv_input.trigger_points_array, \
+            'demand_schedule': csv_input.demand_schedule_array}
+
+
+def command_solve_cost_model(args):
+    '''
+    Solves the cost model of an input, see solve_cost_model
+    '''
+    csv_input = read_input(args)
+    return solve_input_cost_model(csv_input, args, relax=args.relax, \
+                                  max_seconds=args.max_seconds, \
+                                  max_mip_gap=args.max_mip_gap, \
+                                  threads=args.threads, emphasis=args.emphasis)
+
+
+def parse_lambda(args, Lambda, num_items):
+    '''
+    Reads a Lambda given with --lambda, and exits with a usage error of the
+    subcommand unless it is a json list of one positive integer for each item
+
+    PARAMETERS:
+    args := the parsed arguments, with the parser of the subcommand
+    Lambda := the json text of the Lambda
+    num_items := the number of items of the input
+
+    RETURN:
+    The Lambda as a list
+    '''
+    try:
+        values = json.loads(Lambda)
+    except ValueError:
+        args.parser.error("--lambda {} is not a json list".format(Lambda))
+    if not isinstance(values, list) or len(values) != num_items:
+        args.parser.error("--lambda {} does not have one value for each of "
+                          "the {} items".format(Lambda, num_items))
+    if any(isinstance(value, bool) or not isinstance(value, int) or value < 1 \
+           for value in values):
+        args.parser.error("--lambda {} is not a list of positive "
+                          "integers".format(Lambda))
+    return values
+
+
+def command_evaluate(args):
+    '''
+    Evaluates the given Lambdas as one batch
+    '''
+    from find_skipping_coeff import get_average_baseloop_time_batch
+    csv_input = read_input(args)
+    L, J, I0, h, a, trigger_points, D, t, Tau, T = get_model_args(csv_input, args)
+    Lambdas = [parse_lambda(args, Lambda, L) for Lambda in args.Lambda]
+    avg_baseloop, feasible, holding_cost, changeover_cost, S = \
+        get_average_baseloop_time_batch(L, J, I0, h, a, trigger_points, D, \
+                                        Lambdas, t, Tau, T)
+    results = []
+    for k, Lambda in enumerate(Lambdas):
+        result = {'lambda': Lambda, 'avg_baseloop': avg_baseloop[k], \
+                  'feasible': feasible[k], 'holding_cost': holding_cost[k], \
+                  'changeover_cost': changeover_cost[k]}
+        if args.schedule:
+            result['S'] = S[k]
+        results.append(result)
+    return {'results': results}
+
+
+def get_start_lambda(csv_input, args):
+    '''
+    Gives the Lambda a search starts from: the one of the arguments, or else
+    the solution of the cost model
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData
+    args := the parsed arguments, with Lambda, relax and the parser of the
+            subcommand
+
+    RETURN:
+    A result dictionary with the start_lambda, None if the cost model has no
+    solution, and the cost_model result, None if it was not solved
+    '''
+    result = {'start_lambda': None, 'cost_model': None}
+    if args.Lambda is not None:
+        result['start_lambda'] = parse_lambda(args, args.Lambda, \
+                                              csv_input.num_items)
+    else:
+        result['cost_model'] = solve_input_cost_model(csv_input, args, \
+                                                      relax=args.relax)
+        result['start_lambda'] = result['cost_model']['lambda']
+    return result
+
+
+def command_search(args):
+    '''
+    Searches for the best Lambdas around a starting Lambda, by default the
+    solution of the cost model
+    '''
+    if args.method == 'cross-entropy' and (args.checkpoint is not None or \
+                                           args.resume):
+        args.parser.error("--checkpoint and --resume only apply to the random "
+                          "search")
+    csv_input = read_input(args)
+    model_args = get_model_args(csv_input, args)
+    result = get_start_lambda(csv_input, args)
+    if result['start_lambda'] is None:
+        return result
+
+    if args.method == 'random':
+        import random
+        from find_skipping_coeff import random_simulation
+        feasible_results = random_simulation(*model_args, args.num_simulation, \
+                                             result['start_lambda'], \
+                                             args.neighbourhood, \
+                                             rng=random.Random(args.search_seed), \
+                                             num_best=args.num_best, \
+                                             prune=args.prune, \
+                                             checkpoint_path=args.checkpoint, \
+                                             resume=args.resume)
+        result['best'] = [{'avg_baseloop': avg_baseloop, 'lambda': Lambda} for \
+                          avg_baseloop, Lambda in feasible_results.best()]
+        result['pruned_at'] = feasible_results.pruned_at
+    else:
+        from cross_entropy import cross_entropy_search
+        search_result = cross_entropy_search(*model_args, result['start_lambda'], \
+                                             args.neighbourhood, \
+                                             max_samples=args.num_simulation, \
+                                             num_best=args.num_best, \
+                                             seed=args.search_seed)
+        result['best'] = [{'avg_baseloop': avg_baseloop, 'lambda': Lambda} for \
+                          avg_baseloop, Lambda in search_result.pop('results').best()]
+        result.update(search_result)
+    return result
+
+
+def command_trigger_search(args):
+    '''
+    Searches trigger points and Lambdas jointly, see trigger_point_search.
+    Trigger points are sampled by get_trigger_point_grid and Lambdas around a
+    starting Lambda, by default the solution of the cost model
+    '''
+    import random
+    import numpy as np
+    from find_skipping_coeff import trigger_point_search, \
+                                    get_trigger_point_grid, get_random_lambdas
+    csv_input = read_input(args)
+    L, J, I0, h, a, trigger_points, D, t, Tau, T = get_model_args(csv_input, args)
+    result = get_start_lambda(csv_input, args)
+    if result['start_lambda'] is None:
+        return result
+
+    trigger_grid = get_trigger_point_grid(D, args.num_settings, \
+                   rng=np.random.default_rng(args.search_seed))
+    rng = random.Random(args.search_seed)
+    candidate_lambdas = [get_random_lambdas(result['start_lambda'], \
+                                            args.neighbourhood, rng) \
+                         for k in range(args.num_lambdas)]
+    result.update(trigger_point_search(L, J, I0, h, a, trigger_grid, D, t, Tau, \
+                                       T, candidate_lambdas, \
+                                       batch_size=args.batch_size, \
+                                       prune=args.prune))
+    return result
+
+
+def command_startup_times(args):
+    '''
+    Measures the cold start of each subcommand: runs it with --timing in new
+    interpreters and takes the median of the wall time of the process and of
+    the time it spent importing
+    '''
+    import statistics
+    import subprocess
+    input_args = ['--input', args.input, '--seed', str(args.seed)]
+    Lambda = json.dumps([1] * read_input(args).num_items)
+    commands = [('read', []), ('evaluate', ['--lambda', Lambda]), \
+                ('solve-cost-model', ['--relax']), \
+                ('search', ['--relax', '--num-simulation', '1000'])]
+    results = {}
+    for command, command_args in commands:
+        wall_seconds = []
+        import_seconds = []
+        for repeat in range(args.repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), \
+                                     command, '--timing'] + input_args + command_args, \
+                                    check=True, capture_output=True, text=True).stdout
+            wall_seconds.append(time.perf_counter() - start)
+            timing = json.loads(output)['timing']
+            import_seconds.append(timing['import_seconds'])
+        results[command] = {'wall_seconds': statistics.median(wall_seconds), \
+                            'import_seconds': statistics.median(import_seconds), \
+                            'solver_loaded': timing['solver_loaded']}
+    return results
+
+
+def get_parser():
+    '''
+    Builds the argument parser of the subcommands
+
+    RETURN:
+    An argparse.ArgumentParser
+    '''
+    parser = argparse.ArgumentParser(description="Base loop planning from the "
+                                     "command line, results are printed as json")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # arguments shared by all subcommands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--input', default='Input_Data.csv', help="input csv")
+    common.add_argument('--seed', type=int, default=0, \
+                        help="seed of the sampled demand schedule")
+    common.add_argument('--cache', action='store_true', \
+                        help="use the binary cache of the input")
+    common.add_argument('--timing', action='store_true', \
+                        help="add the import and run times to the output")
+    # arguments of the subcommands that use the model data
+    model = argparse.ArgumentParser(add_help=False)
+    model.add_argument('--cost-tolerance', type=float, default=None, \
+                       help="cost tolerance instead of the one of the input")
+    model.add_argument('--trigger-points', default='zero', \
+                       help="'zero', 'input' or a json list")
+
+    subparser = subparsers.add_parser('read', parents=[common], \
+                                      help="read an input")
+    subparser.set_defaults(function=command_read)
+
+    subparser = subparsers.add_parser('solve-cost-model', parents=[common, model], \
+                                      help="solve the cost model")
+    subparser.add_argument('--relax', action='store_true', \
+                           help="solve the LP relaxation and round it")
+    subparser.add_argument('--max-seconds', type=float, default=None)
+    subparser.add_argument('--max-mip-gap', type=float, default=None)
+    subparser.add_argument('--threads', type=int, default=None)
+    subparser.add_argument('--emphasis', choices=['feasibility', 'optimality'], \
+                           default=None)
+    subparser.set_defaults(function=command_solve_cost_model)
+
+    subparser = subparsers.add_parser('evaluate', parents=[common, model], \
+                                      help="evaluate Lambdas")
+    subparser.add_argument('--lambda', dest='Lambda', action='append', \
+                           required=True, help="a json list, can be repeated")
+    subparser.add_argument('--schedule', action='store_true', \
+                           help="add the skipping coefficients to the output")
+    subparser.set_defaults(function=command_evaluate, parser=subparser)
+
+    subparser = subparsers.add_parser('search', parents=[common, model], \
+                                      help="search for the best Lambdas")
+    subparser.add_argument('--method', choices=['random', 'cross-entropy'], \
+                           default='random')
+    subparser.add_argument('--lambda', dest='Lambda', default=None, \
+                           help="json list to search around, by default the "
+                           "solution of the cost model")
+    subparser.add_argument('--relax', action='store_true', \
+                           help="start from the rounded LP relaxation")
+    subparser.add_argument('--num-simulation', type=int, default=100000, \
+                           help="number of samples")
+    subparser.add_argument('--neighbourhood', type=float, default=10)
+    subparser.add_argument('--num-best', type=int, default=10)
+    subparser.add_argument('--search-seed', type=int, default=0, \
+                           help="seed of the sampled Lambdas")
+    subparser.add_argument('--prune', action='store_true')
+    subparser.add_argument('--checkpoint', default=None, \
+                           help="checkpoint file of the random search")
+    subparser.add_argument('--resume', action='store_true', \
+                           help="continue from the checkpoint")
+    subparser.set_defaults(function=command_search, parser=subparser)
+
+    subparser = subparsers.add_parser('trigger-search', parents=[common, model], \
+                                      help="search for the best trigger points "
+                                      "and Lambdas")
+    subparser.add_argument('--lambda', dest='Lambda', default=None, \
+                           help="json list to search around, by default the "
+                           "solution of the cost model")
+    subparser.add_argument('--relax', action='store_true', \
+                           help="start from the rounded LP relaxation")
+    subparser.add_argument('--num-settings', type=int, default=1000, \
+                           help="number of trigger point vectors")
+    subparser.add_argument('--num-lambdas', type=int, default=100, \
+                           help="number of Lambdas combined with each vector")
+    subparser.add_argument('--neighbourhood', type=float, default=10)
+    subparser.add_argument('--search-seed', type=int, default=0, \
+                           help="seed of the sampled trigger points and Lambdas")
+    subparser.add_argument('--batch-size', type=int, default=10000)
+    subparser.add_argument('--no-prune', dest='prune', action='store_false')
+    subparser.set_defaults(function=command_trigger_search, parser=subparser)
+
+    subparser = subparsers.add_parser('startup-times', parents=[common], \
+                                      help="measure the cold start of each "
+                                      "subcommand")
+    subparser.add_argument('--repeats', type=int, default=5)
+    subparser.set_defaults(function=command_startup_times)
+    return parser
+
+
+def get_command_modules(args):
+    '''
+    Returns the modules a subcommand imports, so that their import is timed
+    apart from the run
+
+    PARAMETERS:
+    args := the parsed arguments
+
+    RETURN:
+    A list of module names
+    '''
+    if args.command in ('read', 'startup-times'):
+        return ['input_reader']
+    if args.command == 'solve-cost-model':
+        return ['input_reader', 'cost_model']
+    if args.command == 'evaluate':
+        return ['input_reader', 'find_skipping_coeff']
+    modules = ['input_reader', 'find_skipping_coeff']
+    if args.Lambda is None:
+        modules.append('cost_model')
+    if args.command == 'search' and args.method == 'cross-entropy':
+        modules.append('cross_entropy')
+    return modules
+
+
+def to_json(value):
+    '''
+    Converts the NumPy values json cannot save
+    '''
+    return value.tolist()
+
+
+def main():
+
+    args = get_parser().parse_args()
+    import_start = time.perf_counter()
+    for module in get_command_modules(args):
+        importlib.import_module(module)
+    run_start = time.perf_counter()
+    # the solver prints to the standard output from C, which would mix with
+    # the json, so it is sent to the standard error while the command runs
+    sys.stdout.flush()
+    stdout = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        result = args.function(args)
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout, 1)
+        os.close(stdout)
+    if args.timing:
+        result['timing'] = {'startup_seconds': import_start - START_TIME, \
+                            'import_seconds': run_start - import_start, \
+                            'run_seconds': time.perf_counter() - run_start, \
+                            'solver_loaded': 'mip' in sys.modules}
+    print(json.dumps(result, default=to_json))
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,18 @@
 # @author Rosa Zhou
 # @author Will Thompson
 
+import math
+import time
 import numpy as np
-from mip import Model, xsum, maximize, minimize, BINARY, INTEGER
+from mip import Model, LinExpr, xsum, maximize, minimize, BINARY, INTEGER, \
+                GREATER_OR_EQUAL, OptimizationStatus, SearchEmphasis
 from input_reader import *
+from instrumentation import phase, optimize_model
+
+# name of the cost constraint in the model built by build_cost_model
+COST_CONSTRAINT = 'cost'
+# absolute violation of a constraint accepted when rounding the relaxation
+ROUNDING_TOLERANCE = 1e-6
 
 
 def demand_upto(demand_schedule, current_time, item):
@@ -50,15 +59,41 @@ def get_cost_coeff(item_index, total_time, num_periods, holding_cost, \
     The coefficient for the given item's lambda in the cost constraint of the
     closed form of linear program
     '''
-    term1 = total_time * num_periods * (num_periods-1) * holding_cost[item_index] / 2
+    return get_cost_coeffs(total_time, num_periods, holding_cost, \
+                           demand_schedule_init, unit_production_time, \
+                           initial_inventory, cost_tolerance)[item_index]
+
+
+def get_cost_coeffs(total_time, num_periods, holding_cost, \
+                    demand_schedule_init, unit_production_time, \
+                    initial_inventory, cost_tolerance):
+    '''
+    Compute the coefficients of all items in the cost constraint of the closed
+    form of linear program. The demand and holding cost terms are shared by
+    all items, so they are computed once.
+
+    PARAMETERS:
+    total_time := total time in one period
+    num_periods := total number of time periods
+    holding_cost := inventory cost for each item
+    demand_schedule_init := demand schedule including the initial time period
+    unit_production_time := time needed to produce one unit for each item
+    initial_inventory := initial inventory for each item
+    cost_tolerance := total cost tolerance for the year
+
+    RETURN:
+    An array containing the coefficient of each item's lambda in the cost
+    constraint of the closed form of linear program
+    '''
+    holding_cost_np = np.asarray(holding_cost, dtype=float)
+    unit_production_time_np = np.asarray(unit_production_time, dtype=float)
+    term1 = total_time * num_periods * (num_periods-1) * holding_cost_np / 2
 
-    num_periods_vector = [i for i in range(num_periods, -1, -1)]
-    num_periods_np = np.array(num_periods_vector)
+    num_periods_np = np.arange(num_periods, -1, -1)
     d_np = np.asarray(demand_schedule_init)
-    holding_cost_np = np.array(holding_cost)
     initial_inventory_np = np.asarray(initial_inventory)
 
-    term2 = unit_production_time[item_index] * \
+    term2 = unit_production_time_np * \
             (num_periods * np.dot(holding_cost_np, initial_inventory_np) - \
             np.dot(np.dot(num_periods_np, d_np), holding_cost_np) -\
                    cost_tolerance)
@@ -66,9 +101,115 @@ def get_cost_coeff(item_index, total_time, num_periods, holding_cost, \
     return coefficient
 
 
+def get_demand_constraint_coeffs(num_items, num_periods, unit_production_time, \
+                                 total_time, initial_inventory, demand_schedule):
+    '''
+    Compute the coefficients of the constraints for inventory to meet demand at
+    each time period. Cumulative demand is taken from one prefix sum over the
+    demand schedule.
+
+    PARAMETERS:
+    num_items := total number of items
+    num_periods := total number of time periods
+    unit_production_time := time needed to produce one unit for each item
+    total_time := total time in one period
+    initial_inventory := initial inventory for each item
+    demand_schedule := a matrix of size (J, L) containing demand for each item
+
+    RETURN:
+    A matrix of size (L*J, L). Row i*J + j-1 holds the coefficients of the
+    lambdas in the constraint of item i at time period j
+    '''
+    unit_production_time_np = np.asarray(unit_production_time, dtype=float)
+    demand_np = np.asarray(demand_schedule, dtype=float).reshape(num_periods, \
+                                                                 num_items)
+    cumulative_demand = np.cumsum(demand_np, axis=0)
+    remaining_inventory = np.asarray(initial_inventory, dtype=float) - \
+                          cumulative_demand
+
+    coeff = remaining_inventory.T[:, :, None] * unit_production_time_np
+    items = np.arange(num_items)[:, None]
+    periods = np.arange(num_periods)[None, :]
+    coeff[items, periods, items] += np.arange(1, num_periods+1) * total_time
+    return coeff.reshape(num_items * num_periods, num_items)
+
+
+def get_period_demand_constraint_coeffs(num_items, period, unit_production_time, \
+                                        total_time, initial_inventory, \
+                                        cumulative_demand):
+    '''
+    Compute the coefficients of the constraints for inventory to meet demand at
+    one time period, the same rows as get_demand_constraint_coeffs gives for it
+
+    PARAMETERS:
+    num_items := total number of items
+    period := index of the time period, starting at 1
+    unit_production_time := time needed to produce one unit for each item
+    total_time := total time in one period
+    initial_inventory := initial inventory for each item
+    cumulative_demand := total demand of each item up to this time period
+
+    RETURN:
+    A matrix of size (L, L). Row i holds the coefficients of the lambdas in the
+    constraint of item i at this time period
+    '''
+    remaining_inventory = np.asarray(initial_inventory, dtype=float) - \
+                          np.asarray(cumulative_demand, dtype=float)
+    coeff = remaining_inventory[:, None] * np.asarray(unit_production_time, \
+                                                      dtype=float)
+    coeff[np.arange(num_items), np.arange(num_items)] += period * total_time
+    return coeff
+
+
+def build_cost_model(num_items, num_periods, unit_production_time, total_time, \
+                     initial_inventory, demand_schedule, cost_tolerance, \
+                     changeover_cost, holding_cost, demand_schedule_init):
+    '''
+    Builds the cost model without solving it. Parameters are the same as in
+    cost_model.
+
+    RETURN:
+    A tuple of the mip Model and the list of its Lambda variables
+    '''
+    with phase('build_cost_model'):
+        # initialize model
+        model = Model('loop minimization')
+
+        # add model variables
+        Lambda = [model.add_var(var_type=INTEGER) for i in range(num_items)]
+
+        # set model objective
+        model.objective = minimize(xsum(Lambda[i] * unit_production_time[i] \
+                                        for i in range(num_items)))
+
+        # add constraints for inventory to meet demand at each time period
+        with phase('demand_constraints'):
+            demand_coeff = get_demand_constraint_coeffs(num_items, num_periods, \
+                                                        unit_production_time, \
+                                                        total_time, \
+                                                        initial_inventory, \
+                                                        demand_schedule)
+            for row in demand_coeff.tolist():
+                model.add_constr(LinExpr(Lambda, row, sense=GREATER_OR_EQUAL))
+
+        # cost constraint
+        cost_coeff = get_cost_coeffs(total_time, num_periods, holding_cost, \
+                                     demand_schedule_init, unit_production_time, \
+                                     initial_inventory, cost_tolerance)
+        model.add_constr(LinExpr(Lambda, cost_coeff.tolist()) <=\
+                         - num_periods * total_time * sum(changeover_cost), \
+                         name=COST_CONSTRAINT)
+
+        # constraint on positive looptime
+        model += xsum(unit_production_time[i] * Lambda[i] for i in range(num_items)) >= 1
+
+    return model, Lambda
+
+
 def cost_model(num_items, num_periods, unit_production_time, total_time, \
                initial_inventory, demand_schedule, cost_tolerance, \
-               changeover_cost, holding_cost, demand_schedule_init):
+               changeover_cost, holding_cost, demand_schedule_init, \
+               **solver_options):
     '''
     Solves for the cost model. Find lambdas that satisfy the cost constraint and
     have inventory meet demand at each time period
@@ -80,60 +221,339 @@ def cost_model(num_items, num_periods, unit_production_time, total_time, \
     total_time := total time in one period
     initial_inventory := initial inventory for each item
     demand_schedule := a matrix of size (J, L) containing demand for each item
+    in each time period
     cost_tolerance := total cost tolerance for the year
     changeover_cost := changeover cost for each item
     holding_cost := inventory cost for each item
     demand_schedule_init := demand schedule including the initial time period
+    solver_options := the options of solve_cost_model, such as max_seconds or
+    relax
 
     RETURN:
-    None
+    The list of lambdas of the best solution found, also when the solve was
+    stopped before optimality, or -1 if no solution was found. Use
+    solve_cost_model for the status, bound, gap and solve time
     '''
-    # initialize model
-    model = Model('loop minimization')
-
-    # add model variables
-    Lambda = [model.add_var(var_type=INTEGER) for i in range(num_items)]
-
-    # set model objective
-    model.objective = minimize(xsum(Lambda[i] * unit_production_time[i] \
-                                    for i in range(num_items)))
-
-    # add constraints
-    cost_coeff = [0] * num_items
-    for i in range(1, num_items+1):
-        for j in range(1, num_periods+1):
-            # baseloop constraints
-            coeff = [0] * num_items
-            for k in range(num_items):
-                coeff[k] = unit_production_time[k] * \
-                           (initial_inventory[i-1] - \
-                            demand_upto(demand_schedule, j, i-1))
-            coeff[i-1] += j*total_time
-            # add constraints for inventory to meet demand at each time period
-            model += xsum(coeff[i] * Lambda[i] for i in range(num_items)) >= 0
-            # add coeffs in for cost constraint
-            kwargs = {'num_periods': num_periods, 'unit_production_time': \
-                      unit_production_time, 'total_time': total_time, \
-                      'initial_inventory':initial_inventory, 'cost_tolerance': \
-                      cost_tolerance, 'holding_cost': holding_cost, \
-                      'demand_schedule_init': demand_schedule_init, \
-                      'item_index': i-1}
-            cost_coeff[i-1] = get_cost_coeff(**kwargs)
-
-    # cost constraint
-    model += xsum(cost_coeff[i] * Lambda[i] for i in range(num_items)) <=\
-             - num_periods * total_time * sum(changeover_cost)
-
-    # constraint on positive looptime
-    model += xsum(unit_production_time[i] * Lambda[i] for i in range(num_items)) >= 1
-
-    # solve for model
-    model.optimize()
-
-    try:
-        print('result of cost model (non-skipping): ')
-        print([Lambda[i].x for i in range(num_items)])
-        return [Lambda[i].x for i in range(num_items)]
-    except:
+    result = solve_cost_model(num_items, num_periods, unit_production_time, \
+                              total_time, initial_inventory, demand_schedule, \
+                              cost_tolerance, changeover_cost, holding_cost, \
+                              demand_schedule_init, **solver_options)
+
+    if result['lambda'] is None:
         print("no solution for cost model")
         return -1
+    print('result of cost model (non-skipping): ')
+    print(result['lambda'])
+    return result['lambda']
+
+
+def solve_cost_model(num_items, num_periods, unit_production_time, total_time, \
+                     initial_inventory, demand_schedule, cost_tolerance, \
+                     changeover_cost, holding_cost, demand_schedule_init, \
+                     relax=False, max_seconds=None, max_mip_gap=None, \
+                     threads=None, emphasis=None, verbose=False):
+    '''
+    Solves the cost model with the given solver options. With relax, only the
+    LP relaxation is solved and its Lambdas are rounded to feasible integers
+    by round_relaxed_lambdas, which is much faster than the MIP on large
+    instances but not optimal. The LP objective is a lower bound of the MIP
+    objective, so the gap of the rounded Lambdas is still reported.
+
+    PARAMETERS:
+    relax := whether to solve the LP relaxation and round it, instead of the
+             MIP
+    max_seconds := time limit of the solver. A MIP stopped by the limit
+                   returns the best solution found so far
+    max_mip_gap := relative optimality gap at which the solver stops
+    threads := number of threads of the solver
+    emphasis := 'feasibility' to find good solutions early, 'optimality' to
+                close the gap, or None for the default of the solver
+    verbose := whether the solver prints its progress
+    other parameters are the same as in cost_model
+
+    RETURN:
+    A dictionary with the status name, the method ('mip' or 'lp_rounding'),
+    the Lambdas, the base loop (objective), its lower bound, the relative gap
+    and the solve time in seconds. Lambdas, objective and gap are None if no
+    solution was found
+    '''
+    model, Lambda = build_cost_model(num_items, num_periods, \
+                                     unit_production_time, total_time, \
+                                     initial_inventory, demand_schedule, \
+                                     cost_tolerance, changeover_cost, \
+                                     holding_cost, demand_schedule_init)
+    model.verbose = 1 if verbose else 0
+    return optimize_cost_model(model, Lambda, num_items, num_periods, \
+                               unit_production_time, total_time, \
+                               initial_inventory, demand_schedule, \
+                               cost_tolerance, changeover_cost, holding_cost, \
+                               demand_schedule_init, relax, max_seconds, \
+                               max_mip_gap, threads, emphasis)
+
+
+def optimize_cost_model(model, Lambda, num_items, num_periods, \
+                        unit_production_time, total_time, initial_inventory, \
+                        demand_schedule, cost_tolerance, changeover_cost, \
+                        holding_cost, demand_schedule_init, relax=False, \
+                        max_seconds=None, max_mip_gap=None, threads=None, \
+                        emphasis=None):
+    '''
+    Solves a cost model built by build_cost_model, as solve_cost_model does, so
+    that a model can be solved again without being rebuilt. Solver options
+    that are None keep their value in the model.
+
+    PARAMETERS:
+    model := the mip Model returned by build_cost_model
+    Lambda := the list of its Lambda variables
+    cost_tolerance := the cost tolerance of the cost constraint of the model
+    other parameters are the same as in solve_cost_model
+
+    RETURN:
+    The result dictionary of solve_cost_model
+    '''
+    if threads is not None:
+        model.threads = threads
+    if max_mip_gap is not None:
+        model.max_mip_gap = max_mip_gap
+    if emphasis is not None:
+        model.emphasis = SearchEmphasis[emphasis.upper()]
+
+    start = time.perf_counter()
+    optimize_args = {'relax': relax}
+    if max_seconds is not None:
+        optimize_args['max_seconds'] = max_seconds
+    status = optimize_model(model, 'optimize_cost_model', **optimize_args)
+
+    result = {'status': status.name, 'method': 'lp_rounding' if relax else 'mip', \
+              'lambda': None, 'objective_value': None, \
+              'objective_bound': None, 'gap': None, 'seconds': None}
+    if not relax:
+        result['objective_bound'] = model.objective_bound
+    if model.num_solutions > 0:
+        lambdas = [Lambda[i].x for i in range(num_items)]
+        if relax:
+            # the LP optimum bounds the MIP from below
+            result['objective_bound'] = model.objective_value
+            lambdas = round_relaxed_lambdas(lambdas, num_items, num_periods, \
+                                            unit_production_time, total_time, \
+                                            initial_inventory, demand_schedule, \
+                                            cost_tolerance, changeover_cost, \
+                                            holding_cost, demand_schedule_init)
+            result['status'] = OptimizationStatus.FEASIBLE.name if lambdas \
+                               is not None else \
+                               OptimizationStatus.NO_SOLUTION_FOUND.name
+        if lambdas is not None:
+            result['lambda'] = lambdas
+            result['objective_value'] = float(np.dot(unit_production_time, lambdas))
+            result['gap'] = abs(result['objective_value'] - \
+                                result['objective_bound']) / \
+                            max(abs(result['objective_value']), 1e-10)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def round_relaxed_lambdas(relaxed_lambda, num_items, num_periods, \
+                          unit_production_time, total_time, initial_inventory, \
+                          demand_schedule, cost_tolerance, changeover_cost, \
+                          holding_cost, demand_schedule_init, max_iterations=1000):
+    '''
+    Rounds the Lambdas of the LP relaxation up to integers and repairs the
+    demand constraints they break. The constraint of item i at period j has
+    the coefficient r * t[k] for every lambda k, where r is the inventory of
+    item i left after the demand so far, plus j * T for lambda i. If r is not
+    negative, no coefficient is negative and the constraint holds for any
+    non-negative Lambdas. So only constraints with a negative r are broken,
+    and in those lambda i has the only coefficient that can be positive: each
+    broken constraint is repaired by raising lambda i to the smallest integer
+    that meets it for the current lambdas of the other items, or cannot be
+    repaired if that coefficient is not positive. Raising a lambda tightens
+    the constraints with a negative r of the other items, so this is repeated
+    until no lambda changes.
+
+    PARAMETERS:
+    relaxed_lambda := the Lambdas of the LP relaxation
+    max_iterations := the maximum number of repair rounds
+    other parameters are the same as in cost_model
+
+    RETURN:
+    A list of integer Lambdas that satisfy all constraints of the cost model,
+    or None if the repair did not find one
+    '''
+    unit_production_time_np = np.asarray(unit_production_time, dtype=float)
+    demand_coeff = get_demand_constraint_coeffs(num_items, num_periods, \
+                                                unit_production_time, \
+                                                total_time, initial_inventory, \
+                                                demand_schedule)
+    cost_coeff = get_cost_coeffs(total_time, num_periods, holding_cost, \
+                                 demand_schedule_init, unit_production_time, \
+                                 initial_inventory, cost_tolerance)
+    cost_bound = - num_periods * total_time * sum(changeover_cost)
+
+    # coefficient of each item's own lambda in its constraints, shape (L, J)
+    own_coeff = demand_coeff.reshape(num_items, num_periods, num_items)\
+                [np.arange(num_items), :, np.arange(num_items)]
+    own_coeff = own_coeff.reshape(num_items * num_periods)
+    item_of_row = np.repeat(np.arange(num_items), num_periods)
+
+    Lambda = np.maximum(0, np.ceil(np.asarray(relaxed_lambda, dtype=float) - \
+                                   ROUNDING_TOLERANCE))
+    for iteration in range(max_iterations):
+        rows = demand_coeff @ Lambda
+        violated = rows < -ROUNDING_TOLERANCE
+        if not violated.any():
+            break
+        if (own_coeff[violated] <= 0).any():
+            # raising the lambda of the item does not help
+            return None
+        others = rows - own_coeff * Lambda[item_of_row]
+        needed = np.zeros(num_items)
+        np.maximum.at(needed, item_of_row[violated], \
+                      np.ceil(-others[violated] / own_coeff[violated]))
+        Lambda = np.maximum(Lambda, needed)
+    else:
+        return None
+
+    if np.dot(unit_production_time_np, Lambda) < 1:
+        # the smallest base loop is met by the item of longest production time
+        item = int(np.argmax(unit_production_time_np))
+        Lambda[item] += math.ceil((1 - np.dot(unit_production_time_np, Lambda)) / \
+                                  unit_production_time_np[item])
+        if (demand_coeff @ Lambda < -ROUNDING_TOLERANCE).any():
+            return None
+    if np.dot(cost_coeff, Lambda) > cost_bound + ROUNDING_TOLERANCE * \
+       max(1, abs(cost_bound)):
+        return None
+    return Lambda.astype(int).tolist()
+
+
+def set_cost_tolerance(model, Lambda, num_periods, unit_production_time, \
+                       total_time, initial_inventory, cost_tolerance, \
+                       changeover_cost, holding_cost, demand_schedule_init):
+    '''
+    Changes the cost tolerance of a model built by build_cost_model. The
+    tolerance enters the coefficients of the cost constraint, which CBC cannot
+    change in place, so only that row is replaced. All other rows are kept.
+
+    PARAMETERS:
+    model := the mip Model returned by build_cost_model
+    Lambda := the list of its Lambda variables
+    cost_tolerance := the new total cost tolerance for the year
+    other parameters are the same as in cost_model
+
+    RETURN:
+    None
+    '''
+    cost_coeff = get_cost_coeffs(total_time, num_periods, holding_cost, \
+                                 demand_schedule_init, unit_production_time, \
+                                 initial_inventory, cost_tolerance)
+    model.remove(model.constr_by_name(COST_CONSTRAINT))
+    model.add_constr(LinExpr(Lambda, cost_coeff.tolist()) <=\
+                     - num_periods * total_time * sum(changeover_cost), \
+                     name=COST_CONSTRAINT)
+
+
+def get_required_cost_tolerance(Lambda, num_periods, unit_production_time, \
+                                total_time, initial_inventory, changeover_cost, \
+                                holding_cost, demand_schedule_init):
+    '''
+    Computes the smallest cost tolerance for which the given Lambdas satisfy
+    the cost constraint. The tolerance enters each coefficient multiplied by
+    the item's unit production time, so the constraint holds exactly when the
+    tolerance is at least (c . Lambda - rhs) / (t . Lambda), where c are the
+    coefficients for a tolerance of 0.
+
+    PARAMETERS:
+    Lambda := a list of lambdas with a positive base loop
+    other parameters are the same as in cost_model
+
+    RETURN:
+    The smallest cost tolerance of the Lambdas
+    '''
+    cost_coeff = get_cost_coeffs(total_time, num_periods, holding_cost, \
+                                 demand_schedule_init, unit_production_time, \
+                                 initial_inventory, 0)
+    Lambda_np = np.asarray(Lambda, dtype=float)
+    rhs = - num_periods * total_time * sum(changeover_cost)
+    return (np.dot(cost_coeff, Lambda_np) - rhs) / \
+           np.dot(np.asarray(unit_production_time, dtype=float), Lambda_np)
+
+
+def cost_tolerance_sweep(num_items, num_periods, unit_production_time, \
+                         total_time, initial_inventory, demand_schedule, \
+                         cost_tolerances, changeover_cost, holding_cost, \
+                         demand_schedule_init, max_mip_gap=None, verbose=False):
+    '''
+    Solves the cost model for each cost tolerance, giving the frontier of the
+    base loop against the cost tolerance. The model is built once and only the
+    cost constraint changes between solves.
+
+    Tolerances are solved in decreasing order. The optimal base loop only
+    grows as the tolerance shrinks, so the Lambdas solved for one tolerance
+    are also optimal for every smaller tolerance they still satisfy, down to
+    get_required_cost_tolerance. Those tolerances are not solved again, and
+    the frontier costs one solve per step of the base loop instead of one per
+    tolerance. Optimal means within the optimality gap of the solver.
+
+    Otherwise the sweep gives no time benefit. CBC cannot change the
+    coefficients of a row in place and the tolerance enters every coefficient
+    of the cost constraint, so the row is replaced, and each solve takes as
+    long as a cold one. The base loop of Input_Data.csv changes at every step
+    of a 20 point grid, even one within 0.1% of its tolerance.
+
+    PARAMETERS:
+    cost_tolerances := a list of total cost tolerances for the year
+    max_mip_gap := relative optimality gap at which each solve stops, by
+                   default the one of the solver
+    verbose := whether the solver prints its progress
+    other parameters are the same as in cost_model
+
+    RETURN:
+    A list of (cost tolerance, base loop, Lambdas) tuples in increasing order
+    of cost tolerance. Base loop and Lambdas are None if the cost model has no
+    solution for that tolerance
+    '''
+    cost_tolerances = sorted(cost_tolerances, reverse=True)
+    frontier = []
+    if not cost_tolerances:
+        return frontier
+
+    model, Lambda = build_cost_model(num_items, num_periods, \
+                                     unit_production_time, total_time, \
+                                     initial_inventory, demand_schedule, \
+                                     cost_tolerances[0], changeover_cost, \
+                                     holding_cost, demand_schedule_init)
+    model.verbose = 1 if verbose else 0
+    if max_mip_gap is not None:
+        model.max_mip_gap = max_mip_gap
+
+    k = 0
+    while k < len(cost_tolerances):
+        if k > 0:
+            set_cost_tolerance(model, Lambda, num_periods, unit_production_time, \
+                               total_time, initial_inventory, cost_tolerances[k], \
+                               changeover_cost, holding_cost, \
+                               demand_schedule_init)
+
+        status = optimize_model(model, 'optimize_cost_model')
+        if status not in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE):
+            # no solution for this tolerance, so neither for smaller ones
+            frontier += [(cost_tolerance, None, None) for cost_tolerance in \
+                         cost_tolerances[k:]]
+            break
+
+        solved_lambda = [Lambda[i].x for i in range(num_items)]
+        required_tolerance = get_required_cost_tolerance(solved_lambda, \
+                             num_periods, unit_production_time, total_time, \
+                             initial_inventory, changeover_cost, holding_cost, \
+                             demand_schedule_init)
+        # the solution is shared by every tolerance it satisfies
+        frontier.append((cost_tolerances[k], model.objective_value, solved_lambda))
+        k += 1
+        while k < len(cost_tolerances) and \
+              cost_tolerances[k] >= required_tolerance:
+            frontier.append((cost_tolerances[k], model.objective_value, \
+                             list(solved_lambda)))
+            k += 1
+
+    frontier.reverse()
+    return frontier
@@ -0,0 +1,186 @@
+# Cross-entropy search for the skipping Lambdas: samples whole populations of
+# Lambdas and moves the sampling distribution toward the best of them.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import random
+import time
+import numpy as np
+from find_skipping_coeff import get_average_baseloop_time_batch, \
+                                random_simulation
+from input_reader import BaseLoopInputData
+from simulation_results import TopKResults
+
+
+def cross_entropy_search(L, J, I0, h, a, trigger_points, D, t, Tau, T, initial_lambda, neighbourhood, population_size=1000, elite_fraction=0.05, smoothing=0.7, collapse_stdev=0.5, max_samples=None, max_infeasible=10, target=None, num_best=10, seed=0):
+    '''
+    This function searches for the Lambdas with the smallest average Base
+    Loop by the cross-entropy method. Each item's lambda is sampled from a
+    normal distribution, rounded to an integer and raised to at least 1. A
+    population is evaluated as one batch, then each item's mean and standard
+    deviation move toward those of the elite, the best elite_fraction of the
+    feasible Lambdas. The search stops when every standard deviation is below
+    collapse_stdev, where almost every sample is the same Lambda.
+
+    The first distribution has the mean and standard deviation of the uniform
+    interval random_simulation samples from. A population without feasible
+    Lambdas leaves the distribution unchanged, so after max_infeasible of them
+    in a row the search stops without converging rather than sampling the
+    same distribution forever.
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    I0: a list of item initial inventories
+    h: inventory cost
+    a: changeover cost
+    trigger_points: a list of item trigger points
+    D: A list of lists containing all item demands in each time period
+    t: a list of time takes to produce one unit of item
+    Tau: cost tolerance
+    T: the total time available to run the loop in each time period
+    initial_lambda: the output from the Cost Model, the first mean
+    neighbourhood: the interval around each lambda of the first distribution
+    population_size: the number of Lambdas sampled in each iteration
+    elite_fraction: the fraction of the population the distribution is
+                    refitted to
+    smoothing: the weight of the elite statistics in the refitted
+               distribution, the rest is the previous distribution
+    collapse_stdev: the standard deviation below which an item's
+                    distribution has collapsed
+    max_samples: stop after this many samples if not converged
+    max_infeasible: stop after this many populations in a row without
+                    feasible Lambdas
+    target: the average Base Loop the number of samples to target is
+            measured for
+    num_best: the number of best feasible Lambdas kept
+    seed: seed of the NumPy random Generator
+
+    RETURN:
+    A dictionary with the best Lambda (None if no feasible Lambda was found),
+    its average Base Loop (-1 if none), the TopKResults of the best Lambdas,
+    the number of samples and iterations, the number of samples after which
+    the target was reached (None if it was not), the elapsed time, the final
+    mean and standard deviation, and whether the distribution collapsed
+    '''
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    mean = np.asarray(initial_lambda, dtype=float)
+    stdev = np.full(L, neighbourhood / np.sqrt(3))
+    num_elite = max(1, int(round(elite_fraction * population_size)))
+    feasible_results = TopKResults(num_best)
+    num_samples = 0
+    num_iterations = 0
+    num_infeasible = 0
+    samples_to_target = None
+    converged = False
+
+    while max_samples is None or num_samples < max_samples:
+        if np.all(stdev < collapse_stdev):
+            converged = True
+            break
+
+        Lambdas = np.maximum(1, np.rint(rng.normal(mean, stdev, \
+                                                   (population_size, L))))
+        Lambdas = Lambdas.astype(np.int64)
+        avg_baseloop = get_average_baseloop_time_batch(L, J, I0, h, a, \
+                       trigger_points, D, Lambdas, t, Tau, T)[0]
+        feasible_results.add_batch(avg_baseloop, Lambdas.tolist())
+        num_samples += population_size
+        num_iterations += 1
+
+        if target is not None and samples_to_target is None and \
+           len(feasible_results) > 0 and feasible_results.best()[0][0] <= target:
+            # the population where the target is first reached
+            samples_to_target = num_samples
+
+        feasible = np.flatnonzero(avg_baseloop != -1)
+        if len(feasible) == 0:
+            num_infeasible += 1
+            if num_infeasible >= max_infeasible:
+                break
+            continue
+        num_infeasible = 0
+        elite = feasible[np.argsort(avg_baseloop[feasible], kind='stable')[:num_elite]]
+        mean = smoothing * Lambdas[elite].mean(axis=0) + (1 - smoothing) * mean
+        stdev = smoothing * Lambdas[elite].std(axis=0) + (1 - smoothing) * stdev
+
+    best_avg_baseloop, best_lambda = -1, None
+    if len(feasible_results) > 0:
+        best_avg_baseloop, best_lambda = feasible_results.best()[0]
+    return {'lambda': best_lambda, 'avg_baseloop': best_avg_baseloop, \
+            'results': feasible_results, 'samples': num_samples, \
+            'iterations': num_iterations, 'samples_to_target': samples_to_target, \
+            'elapsed': time.perf_counter() - start, 'mean': mean.tolist(), \
+            'stdev': stdev.tolist(), 'converged': converged}
+
+
+def display_cross_entropy_results(search_result):
+    '''
+    Displays the best Lambdas found by the cross-entropy search
+
+    PARAMETERS:
+    search_result := the dictionary returned by cross_entropy_search
+
+    RETURN:
+    None
+    '''
+    print("***************************")
+    print("Cross-entropy Output:")
+    if search_result['lambda'] is not None:
+        print("Optimal Choice of Lambdas: {}".format(search_result['lambda']))
+        print("Optimal average baseloop: {}".format(search_result['avg_baseloop']))
+    else:
+        print("No feasible solution found")
+    print("Samples: {} in {} iterations, {:.3f}s".format(search_result['samples'], \
+          search_result['iterations'], search_result['elapsed']))
+    print("Samples to target: {}".format(search_result['samples_to_target']))
+    print("Converged: {}".format(search_result['converged']))
+    print("***************************")
+
+
+def main():
+
+    num_simulation = 100000
+    neighbourhood = 10
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    num_items = csv_input.num_items
+    num_periods = csv_input.num_periods
+    demand_schedule = csv_input.demand_schedule_array
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    trigger_points = np.zeros(num_items)
+    args = (num_items, num_periods, csv_input.initial_inventories_array, \
+            csv_input.inventory_cost_array, csv_input.changeover_cost_array, \
+            trigger_points, demand_schedule, csv_input.production_times_array, \
+            csv_input.cost_tolerance, csv_input.total_time)
+
+    from cost_model import cost_model
+    optimal_lambdas = cost_model(num_items, num_periods, \
+                                 csv_input.production_times_array, \
+                                 csv_input.total_time, \
+                                 csv_input.initial_inventories_array, \
+                                 demand_schedule, csv_input.cost_tolerance, \
+                                 csv_input.changeover_cost_array, \
+                                 csv_input.inventory_cost_array, \
+                                 demand_schedule_init)
+    if optimal_lambdas == -1:
+        optimal_lambdas = [1] * num_items
+
+    # the result of the random simulation is the target
+    start = time.perf_counter()
+    feasible_results = random_simulation(*args, num_simulation, optimal_lambdas, \
+                                         neighbourhood, rng=random.Random(0))
+    # without a feasible Lambda there is no target to reach
+    target = None
+    if len(feasible_results) > 0:
+        target = feasible_results.best()[0][0]
+    print("Random simulation: {} samples, average baseloop {}, {:.3f}s".format(\
+          num_simulation, target, time.perf_counter() - start))
+
+    search_result = cross_entropy_search(*args, optimal_lambdas, neighbourhood, \
+                                         target=target)
+    display_cross_entropy_results(search_result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Memoization of Lambda evaluations for the skipping model, shared by the
+# random simulation and the other search drivers.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import hashlib
+from collections import OrderedDict
+from contextlib import nullcontext
+import numpy as np
+from find_skipping_coeff import get_average_baseloop_time_batch
+
+
+def get_input_fingerprint(L, J, I0, h, a, trigger_points, D, t, Tau, T):
+    '''
+    Computes a fingerprint of the data of a skipping model, so that cached
+    evaluations are only reused for the same data
+
+    PARAM:
+    L, J, I0, h, a, trigger_points, D, t, Tau, T: same as
+    get_average_baseloop_time
+
+    RETURN:
+    A hexadecimal string
+    '''
+    digest = hashlib.sha1()
+    digest.update(np.array([L, J, Tau, T], dtype=float).tobytes())
+    for values in (I0, h, a, trigger_points, D, t):
+        digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class EvaluationCache:
+
+    def __init__(self, max_size=100000, lock=None):
+        '''
+        This class is a least recently used cache of average Base Loop times,
+        keyed by the fingerprint of the input data and the tuple of integer
+        Lambdas.
+
+        The cache is not safe to share between threads on its own. If a lock
+        is given, evaluate_batch holds it only while it looks up and stores
+        evaluations, so threads that share the cache simulate the Lambdas
+        missing from it at the same time.
+
+        Instance variables:
+        self.max_size := the largest number of evaluations kept
+        self.entries := an OrderedDict of the evaluations, the least recently
+                        used one first
+        self.hits := the number of evaluations found in the cache
+        self.misses := the number of evaluations that had to be computed
+        self.lock := the lock of evaluate_batch, None if the cache is used by
+                     one thread
+        '''
+        self.max_size = max_size
+        self.lock = lock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, fingerprint, Lambda):
+        '''
+        Returns the key of a Lambda in the cache
+        '''
+        return (fingerprint, tuple(int(value) for value in Lambda))
+
+    def lookup(self, fingerprint, Lambda):
+        '''
+        Looks up the average Base Loop of a Lambda and counts a hit or a miss
+
+        PARAM:
+        fingerprint: the fingerprint of the input data
+        Lambda: a list of L integers
+
+        RETURN:
+        The cached average Base Loop (-1 if infeasible), or None
+        '''
+        key = self.get_key(fingerprint, Lambda)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, fingerprint, Lambda, avg_baseloop):
+        '''
+        Stores the average Base Loop of a Lambda, evicting the least recently
+        used evaluation if the cache is full
+
+        PARAM:
+        fingerprint: the fingerprint of the input data
+        Lambda: a list of L integers
+        avg_baseloop: the average Base Loop of Lambda, -1 if infeasible
+
+        RETURN:
+        None
+        '''
+        key = self.get_key(fingerprint, Lambda)
+        self.entries[key] = float(avg_baseloop)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def evaluate_batch(self, L, J, I0, h, a, trigger_points, D, Lambdas, t, Tau, T, fingerprint=None, incumbent=None, pruned_at=None):
+        '''
+        Computes the average Base Loop of a batch of Lambdas. Only the Lambdas
+        that are not cached, and not repeated earlier in the batch, are passed
+        to get_average_baseloop_time_batch.
+
+        PARAM:
+        L, J, I0, h, a, trigger_points, D, Lambdas, t, Tau, T: same as
+        get_average_baseloop_time_batch
+        fingerprint: the fingerprint of the input data, computed if None
+        incumbent, pruned_at: pruning of the Lambdas that are not cached, see
+                              get_average_baseloop_time_batch. Pruned Lambdas
+                              are not stored, since they are not known to be
+                              infeasible
+
+        RETURN:
+        An (N,) array of average Base Loop times, -1 for infeasible Lambdas
+        '''
+        if fingerprint is None:
+            fingerprint = get_input_fingerprint(L, J, I0, h, a, trigger_points, \
+                                                D, t, Tau, T)
+        lock = nullcontext() if self.lock is None else self.lock
+        avg_baseloop = np.empty(len(Lambdas))
+        missing = OrderedDict()
+        with lock:
+            for n in range(len(Lambdas)):
+                key = self.get_key(fingerprint, Lambdas[n])
+                if key in missing:
+                    self.hits += 1
+                    missing[key].append(n)
+                    continue
+                value = self.lookup(fingerprint, Lambdas[n])
+                if value is None:
+                    missing[key] = [n]
+                else:
+                    avg_baseloop[n] = value
+
+        if missing:
+            missing_lambdas = [key[1] for key in missing]
+            missing_avg_baseloop, missing_feasible, holding_cost, \
+                changeover_cost, S = get_average_baseloop_time_batch(L, J, I0, \
+                h, a, trigger_points, D, missing_lambdas, t, Tau, T, incumbent, \
+                pruned_at)
+            with lock:
+                for k, key in enumerate(missing):
+                    if incumbent is None or missing_feasible[k]:
+                        self.store(fingerprint, key[1], missing_avg_baseloop[k])
+                    avg_baseloop[missing[key]] = missing_avg_baseloop[k]
+
+        return avg_baseloop
+
+    def hit_rate(self):
+        '''
+        Returns the fraction of lookups that were found in the cache
+        '''
+        num_lookups = self.hits + self.misses
+        return self.hits / num_lookups if num_lookups > 0 else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -2,13 +2,21 @@
 # @author Rosa Zhou
 # @author Will Thompson
 
-from cost_model import cost_model
+from concurrent.futures import ProcessPoolExecutor
 import random
 import math
+import numpy as np
 from input_reader import *
+from simulation_results import TopKResults, write_checkpoint, read_checkpoint, \
+                               get_rng_state, set_rng_state
+from instrumentation import phase, count, is_enabled
 
+# relative margin of the pruning bound, so that rounding in the bound never
+# prunes a candidate that would beat the incumbent
+PRUNING_TOLERANCE = 1e-9
 
-def random_simulation(L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulation, optimal_lambda, neighbourhood):
+
+def random_simulation(L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulation, optimal_lambda, neighbourhood, batch_size=1000, rng=random, num_best=10, stream_path=None, cache=None, prune=False, checkpoint_path=None, checkpoint_every=100000, resume=False):
     '''
     This function runs a random simulation to test different combinations of
     Lambdas
@@ -29,26 +37,291 @@ def random_simulation(L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulati
                     without skipping
     neighbourhood: the interval around each lambda that we will sample new choices
                    of lambda from
+    batch_size: the number of sampled Lambdas evaluated together by
+                get_average_baseloop_time_batch
+    rng: the random number generator used to sample lambdas, by default the
+         global random module
+    num_best: the number of best feasible choices of lambdas to keep
+    stream_path: a directory every evaluated choice of lambdas is streamed to,
+                 see TopKResults
+    cache: an EvaluationCache, so that repeated lambdas are not simulated again
+    prune: whether to abandon the lambdas that exceed Tau or cannot beat the
+           worst kept result, see get_average_baseloop_time. The kept results
+           are the same, pruned lambdas are streamed as infeasible and counted
+           in the pruned_at of the result
+    checkpoint_path: a file the state of the simulation is saved to, see
+                     write_checkpoint. It holds the number of samples done,
+                     the state of rng and the kept results
+    checkpoint_every: the number of samples between checkpoints, rounded up
+                      to whole batches. A checkpoint is also saved at the end
+    resume: whether to continue from the checkpoint at checkpoint_path, if
+            there is one. The results are the same as those of a run that
+            was not interrupted, also with a larger num_simulation than the
+            interrupted run
+
+    RETURN:
+    A TopKResults containing the best feasible choices for the lambdas and their
+    respective average Base Loop times
+    '''
+    checkpoint = None
+    if checkpoint_path is not None:
+        settings = get_checkpoint_settings(L, J, I0, h, a, trigger_points, D, t, \
+                                           Tau, T, optimal_lambda, neighbourhood, \
+                                           batch_size, num_best, prune)
+        if resume:
+            checkpoint = read_checkpoint(checkpoint_path)
+        if checkpoint is not None and checkpoint['settings'] != settings:
+            raise ValueError("checkpoint {} was saved by a different " \
+                             "simulation".format(checkpoint_path))
+
+    if checkpoint is None:
+        feasible_results = TopKResults(num_best, stream_path, L)
+        if prune:
+            feasible_results.pruned_at = [0] * J
+        num_done = 0
+    else:
+        feasible_results = TopKResults(num_best, stream_path, L, checkpoint['results'])
+        set_rng_state(rng, checkpoint['rng_state'])
+        num_done = checkpoint['num_done']
+    incumbent = None
+    num_checkpointed = num_done
+
+    with phase('random_simulation'):
+        while num_done < num_simulation:
+            num_batch = min(batch_size, num_simulation - num_done)
+            with phase('sample_lambdas'):
+                Lambdas = [get_random_lambdas(optimal_lambda, neighbourhood, rng) \
+                           for k in range(num_batch)]
+            if prune:
+                # until num_best results are kept, only prune on cost
+                incumbent = feasible_results.threshold()
+                if incumbent is None:
+                    incumbent = math.inf
+            with phase('evaluate_batch'):
+                if cache is None:
+                    avg_baseloop = get_average_baseloop_time_batch(L, J, I0, h, a, \
+                                   trigger_points, D, Lambdas, t, Tau, T, incumbent, \
+                                   feasible_results.pruned_at)[0]
+                else:
+                    avg_baseloop = cache.evaluate_batch(L, J, I0, h, a, \
+                                   trigger_points, D, Lambdas, t, Tau, T, \
+                                   incumbent=incumbent, \
+                                   pruned_at=feasible_results.pruned_at)
+
+            with phase('collect_results'):
+                feasible_results.add_batch(avg_baseloop, Lambdas)
+            num_done += num_batch
+
+            if checkpoint_path is not None and \
+               (num_done - num_checkpointed >= checkpoint_every or \
+                num_done >= num_simulation):
+                with phase('write_checkpoint'):
+                    write_checkpoint(checkpoint_path, \
+                                     {'settings': settings, 'num_done': num_done, \
+                                      'rng_state': get_rng_state(rng), \
+                                      'results': feasible_results.get_state()})
+                num_checkpointed = num_done
+
+    return feasible_results
+
+
+def get_checkpoint_settings(L, J, I0, h, a, trigger_points, D, t, Tau, T, optimal_lambda, neighbourhood, batch_size, num_best, prune):
+    '''
+    This function collects the inputs and settings of random_simulation that
+    a checkpoint can only be resumed with. The number of simulations is not
+    one of them, so a finished run can be extended.
+
+    PARAM:
+    same as random_simulation
 
     RETURN:
-    A dictionary containing feasible choices for the lambdas and their respective
-    average Base Loop times
+    A dictionary that compares equal to one read back from json
     '''
-    feasible_results = {}
-    for i in range(num_simulation):
-        Lambda = get_random_lambdas(optimal_lambda, neighbourhood)
-        avg_baseloop = get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau, T, False)
+    # evaluation_cache imports this module
+    from evaluation_cache import get_input_fingerprint
+    settings = {'fingerprint': get_input_fingerprint(L, J, I0, h, a, \
+                               trigger_points, D, t, Tau, T), \
+                'optimal_lambda': np.asarray(optimal_lambda, dtype=float).tolist(), \
+                'neighbourhood': float(neighbourhood), 'batch_size': batch_size, \
+                'num_best': num_best, 'prune': prune}
+    return settings
+
 
-        if avg_baseloop != -1:
-            feasible_results[avg_baseloop] = Lambda
+def parallel_random_simulation(L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulation, optimal_lambda, neighbourhood, num_workers=None, seed=0, chunk_size=10000, num_best=10, prune=False):
+    '''
+    This function runs random_simulation on a pool of processes. The
+    simulations are split into chunks of chunk_size samples and each chunk
+    draws its lambdas from its own generator, seeded with a sub-seed derived
+    from seed and the chunk index. Since the chunks do not depend on the number
+    of workers, the result for a given seed is the same whatever num_workers is.
+
+    PARAM:
+    L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulation,
+    optimal_lambda, neighbourhood: same as random_simulation
+    num_workers: the number of worker processes, by default the number of CPUs.
+                 With a single worker the chunks run in this process
+    seed: the seed all chunk sub-seeds are derived from
+    chunk_size: the number of simulations run by each chunk
+    num_best: the number of best feasible results each chunk sends back
+    prune: whether each chunk prunes against its own kept results, the merged
+           pruned_at counts the evaluations pruned by all chunks
+
+    RETURN:
+    A TopKResults containing the num_best best feasible choices for the lambdas
+    and their respective average Base Loop times
+    '''
+    num_chunks = math.ceil(num_simulation / chunk_size)
+    sub_seeds = [int(seq.generate_state(1)[0]) for seq in \
+                 np.random.SeedSequence(seed).spawn(num_chunks)]
+    chunk_args = []
+    for k in range(num_chunks):
+        num_chunk_simulation = min(chunk_size, num_simulation - k * chunk_size)
+        chunk_args.append((L, J, I0, h, a, trigger_points, D, t, Tau, T, \
+                           num_chunk_simulation, optimal_lambda, neighbourhood, \
+                           sub_seeds[k], num_best, prune))
+
+    if num_workers == 1:
+        chunk_results = [simulate_chunk(args) for args in chunk_args]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            chunk_results = list(executor.map(simulate_chunk, chunk_args))
+
+    # merge in chunk order so the result does not depend on scheduling
+    feasible_results = TopKResults(num_best)
+    for chunk_result in chunk_results:
+        feasible_results.merge(chunk_result)
 
     return feasible_results
 
 
-def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau, T, print_optimal_info):
+def simulate_chunk(chunk_args):
+    '''
+    Runs one chunk of parallel_random_simulation in a worker process
+
+    PARAM:
+    chunk_args: a tuple of the random_simulation arguments, followed by the
+                sub-seed of this chunk, the number of best results to keep and
+                whether to prune
+
+    RETURN:
+    A TopKResults containing the best feasible choices for the lambdas of this
+    chunk and their respective average Base Loop times
+    '''
+    L, J, I0, h, a, trigger_points, D, t, Tau, T, num_simulation, \
+        optimal_lambda, neighbourhood, sub_seed, num_best, prune = chunk_args
+
+    return random_simulation(L, J, I0, h, a, trigger_points, D, t, Tau, T, \
+                             num_simulation, optimal_lambda, neighbourhood, \
+                             rng=random.Random(sub_seed), num_best=num_best, \
+                             prune=prune)
+
+
+def trigger_point_search(L, J, I0, h, a, trigger_grid, D, t, Tau, T, Lambdas, batch_size=10000, prune=True):
+    '''
+    This function searches the trigger points and Lambdas jointly: every
+    trigger point vector of trigger_grid is combined with every choice of
+    Lambdas, and the combinations are evaluated in batches by
+    get_average_baseloop_time_batch, each candidate with its own trigger
+    points. Combinations are ordered by trigger point vector, then Lambdas,
+    and of equal average Base Loops the first one is kept.
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    I0: a list of item initial inventories
+    h: inventory cost
+    a: changeover cost
+    trigger_grid: a (G, L) array, each row is one choice of trigger points
+    D: A list of lists containing all item demands in each time period
+    t: a list of time takes to produce one unit of item
+    Tau: cost tolerance
+    T: the total time available to run the loop in each time period
+    Lambdas: an (M, L) array, each row is one choice of Lambda
+    batch_size: the number of combinations evaluated together
+    prune: whether to abandon the combinations that exceed Tau or cannot beat
+           the best one so far, see get_average_baseloop_time. The best
+           combination is the same
+
+    RETURN:
+    A dictionary with the best trigger points and Lambdas, their average Base
+    Loop, holding and changeover cost and skipping coefficients (all None, and
+    the average -1, if no combination is feasible), the number of
+    combinations evaluated and found feasible, and the combinations pruned in
+    each period (None without pruning)
+    '''
+    trigger_grid = np.asarray(trigger_grid, dtype=float).reshape(-1, L)
+    Lambdas = np.asarray(Lambdas, dtype=float).reshape(-1, L)
+    num_lambdas = len(Lambdas)
+    num_combinations = len(trigger_grid) * num_lambdas
+    result = {'trigger_points': None, 'lambda': None, 'avg_baseloop': -1, \
+              'holding_cost': None, 'changeover_cost': None, 'S': None, \
+              'num_evaluated': num_combinations, 'num_feasible': 0, \
+              'pruned_at': [0] * J if prune else None}
+
+    incumbent = math.inf if prune else None
+    with phase('trigger_point_search'):
+        for start in range(0, num_combinations, batch_size):
+            combination = np.arange(start, min(start + batch_size, num_combinations))
+            batch_triggers = trigger_grid[combination // num_lambdas]
+            batch_lambdas = Lambdas[combination % num_lambdas]
+            avg_baseloop, feasible, holding_cost, changeover_cost, S = \
+                get_average_baseloop_time_batch(L, J, I0, h, a, batch_triggers, \
+                                                D, batch_lambdas, t, Tau, T, \
+                                                incumbent, result['pruned_at'])
+            result['num_feasible'] += int(feasible.sum())
+            if not feasible.any():
+                continue
+
+            k = np.flatnonzero(feasible)[np.argmin(avg_baseloop[feasible])]
+            if result['lambda'] is None or avg_baseloop[k] < result['avg_baseloop']:
+                result.update({'trigger_points': batch_triggers[k].tolist(), \
+                               'lambda': batch_lambdas[k].astype(int).tolist(), \
+                               'avg_baseloop': float(avg_baseloop[k]), \
+                               'holding_cost': float(holding_cost[k]), \
+                               'changeover_cost': float(changeover_cost[k]), \
+                               'S': S[k].tolist()})
+                if prune:
+                    incumbent = result['avg_baseloop']
+
+    return result
+
+
+def get_trigger_point_grid(D, num_settings, multiples=(0, 0.5, 1, 1.5, 2), rng=None):
+    '''
+    This function samples trigger point vectors for trigger_point_search. The
+    trigger point of each item is a multiple of its mean demand per period,
+    drawn from multiples independently for each item. The first vector is all
+    zeros, the trigger points of main.
+
+    PARAM:
+    D: A list of lists containing all item demands in each time period
+    num_settings: the number of trigger point vectors
+    multiples: the multiples of the mean demand an item's trigger point is
+               drawn from
+    rng: a NumPy random Generator, by default one seeded with 0
+
+    RETURN:
+    A (num_settings, L) array of trigger points
+    '''
+    if rng is None:
+        rng = np.random.default_rng(0)
+    mean_demand = np.asarray(D, dtype=float).mean(axis=0)
+    trigger_grid = rng.choice(np.asarray(multiples, dtype=float), \
+                              size=(num_settings, len(mean_demand))) * mean_demand
+    trigger_grid[0] = 0
+    return trigger_grid
+
+
+def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau, T, print_optimal_info, incumbent=None, pruned_at=None):
     '''
     This function loops through each time period and checks the skipping criteria,
 
+    If an incumbent average Base Loop is given, the candidate is abandoned at
+    the end of a period once its cost exceeds Tau, or once a lower bound on its
+    average Base Loop shows it cannot beat the incumbent. The bound is the Base
+    Loop so far plus one loop of every item whose inventory does not cover its
+    remaining demand, since each of those items has to be produced again.
+
 
     PARAM:
     L: number of items
@@ -63,11 +336,17 @@ def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau,
     T: the total time available to run the loop in each time period
     print_optimal_info: a boolean that allows you to print out additional
                         information about cost
+    incumbent: the average Base Loop to beat, or None to simulate every
+               period. float('inf') only prunes on cost
+    pruned_at: a list of J counters, the period at which the candidate is
+               pruned is counted in it
 
     RETURN:
-    Average Base Loop time
+    Average Base Loop time, -1 if infeasible or pruned
     '''
     inventory = []
+    if incumbent is not None:
+        remaining_demand = get_remaining_demand(L, J, D)
 
     # initialize placeholders (all zeros) for skipping coefficients
     S = []
@@ -101,6 +380,7 @@ def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau,
                 if production + cur_inventory[i] < D[j][i]:
                     # does not meet demand
                     if print_optimal_info: print('Does not meet demand')
+                    count('does_not_meet_demand', (j, i))
                     return -1
             else:
                 production = 0
@@ -112,9 +392,25 @@ def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau,
             total_holding_cost += h[i] * cur_inventory[i]
         inventory.append(inventory_j)
 
+        # pruning: cost so far and lower bound on the average Base Loop
+        if incumbent is not None:
+            pruned = total_holding_cost + total_changeover_cost > Tau
+            if not pruned:
+                lower_bound = total_baseloop
+                for i in range(L):
+                    if cur_inventory[i] < remaining_demand[j+1][i]:
+                        lower_bound += Lambda[i] * t[i]
+                pruned = lower_bound / J > incumbent * (1 + PRUNING_TOLERANCE)
+            if pruned:
+                if pruned_at is not None: pruned_at[j] += 1
+                count('pruned', (j,))
+                if print_optimal_info: print('Pruned at period', j)
+                return -1
+
     # feasibility: cost tolerance in a year
     if total_holding_cost + total_changeover_cost > Tau:
         if print_optimal_info: print('Exceeds cost tolerance')
+        count('exceeds_cost_tolerance')
         return -1
 
     avg_baseloop = total_baseloop/(J)
@@ -128,6 +424,207 @@ def get_average_baseloop_time(L, J, I0, h, a, trigger_points, D, Lambda, t, Tau,
     return avg_baseloop
 
 
+def get_average_baseloop_time_batch(L, J, I0, h, a, trigger_points, D, Lambdas, t, Tau, T, incumbent=None, pruned_at=None):
+    '''
+    Batched version of get_average_baseloop_time. Evaluates N choices of
+    Lambda at once, looping over the J time periods and vectorizing over the
+    candidates. Sums are accumulated in the same order as the scalar function,
+    so the results match it exactly. Candidates that miss demand, or are
+    pruned, are dropped from the arrays at the end of the period.
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    I0: a list of item initial inventories
+    h: inventory cost
+    a: changeover cost
+    trigger_points: a list of item trigger points, or an (N, L) array of the
+                    trigger points of each candidate
+    D: A list of lists containing all item demands in each time period, or a
+       (K, J, L) stack of K demand scenarios. With a stack, N must be a
+       multiple of K and candidate n is evaluated against scenario n % K
+    Lambdas: an (N, L) array, each row is one choice of Lambda
+    t: a list of time takes to produce one unit of item
+    Tau: cost tolerance
+    T: the total time available to run the loop in each time period
+    incumbent: the average Base Loop to beat, see get_average_baseloop_time
+    pruned_at: a list of J counters of the candidates pruned in each period
+
+    RETURN:
+    A tuple of five arrays:
+    avg_baseloop: (N,) average Base Loop times, -1 for infeasible or pruned
+                  candidates
+    feasible: (N,) boolean mask of the feasible candidates
+    total_holding_cost: (N,) holding cost up to the end of the horizon, or up
+                        to the period an infeasible candidate was dropped
+    total_changeover_cost: (N,) changeover cost, as total_holding_cost
+    S: (N, J, L) skipping coefficients, zero after a candidate was dropped
+    '''
+    # arrays are kept item-major, shape (L, N), so that the sums over items
+    # run row by row in the same order as the scalar function
+    Lambdas = np.asarray(Lambdas, dtype=float).reshape(-1, L)
+    num_candidates = Lambdas.shape[0]
+    Lambdas = np.ascontiguousarray(Lambdas.T)
+    D = np.asarray(D, dtype=float).reshape(-1, J, L)
+    num_scenarios = D.shape[0]
+    if num_candidates % num_scenarios != 0:
+        raise ValueError("number of candidates must be a multiple of the " \
+                         "number of demand scenarios")
+    h = np.asarray(h, dtype=float)
+    a = np.asarray(a, dtype=float)
+    t = np.asarray(t, dtype=float)
+    trigger_points = np.asarray(trigger_points, dtype=float)
+    per_candidate_triggers = trigger_points.ndim == 2
+    if per_candidate_triggers:
+        trigger_points = np.ascontiguousarray(trigger_points.T)
+    else:
+        trigger_points = trigger_points[:, None]
+    if incumbent is not None:
+        remaining_demand = get_remaining_demand(L, J, D)
+
+    # results of all candidates
+    S = np.zeros((J, L, num_candidates), dtype=np.int8)
+    feasible = np.zeros(num_candidates, dtype=bool)
+    avg_baseloop = np.full(num_candidates, -1.0)
+    holding_cost = np.zeros(num_candidates)
+    changeover_cost = np.zeros(num_candidates)
+
+    # state of the candidates still simulated, index is their position
+    index = np.arange(num_candidates)
+    scenario = index % num_scenarios
+    Lambda_t = Lambdas * t[:, None]
+    cur_inventory = np.repeat(np.asarray(I0, dtype=float)[:, None], \
+                              num_candidates, axis=1)
+    total_baseloop = np.zeros(num_candidates)
+    total_holding_cost = np.zeros(num_candidates)
+    total_changeover_cost = np.zeros(num_candidates)
+
+    for j in range(J):
+        num_active = len(index)
+        # demand of each candidate at time j, shape (L, 1) or (L, N)
+        if num_scenarios == 1:
+            D_j = D[0, j][:, None]
+        else:
+            D_j = D[scenario, j].T
+
+        # determine which items to skip
+        produce = cur_inventory < np.maximum(trigger_points, D_j)
+        S[j][:, index] = produce
+
+        # compute baseloop at time j
+        baseloop = np.zeros(num_active)
+        for i in range(L):
+            baseloop += Lambda_t[i] * produce[i]
+        total_baseloop += baseloop
+        num_baseloop = np.zeros(num_active)
+        np.divide(T, baseloop, out=num_baseloop, where=baseloop > 0)
+        np.floor(num_baseloop, out=num_baseloop)
+
+        production = Lambdas * num_baseloop * produce
+        changeover = produce & (produce.sum(axis=0) > 1)
+
+        # feasibility: meet demand at each time period
+        short = produce & (production + cur_inventory < D_j)
+        keep = ~np.any(short, axis=0)
+        if is_enabled() and not keep.all():
+            # the scalar function stops at the first item short of demand
+            count_items(short[:, ~keep], 'does_not_meet_demand', j)
+
+        # update inventory, changeover and holding cost
+        cur_inventory = production + cur_inventory - D_j
+        holding_cost_j = h[:, None] * cur_inventory
+        changeover_cost_j = a[:, None] * num_baseloop * changeover
+        for i in range(L):
+            total_changeover_cost += changeover_cost_j[i]
+            total_holding_cost += holding_cost_j[i]
+
+        # pruning: cost so far and lower bound on the average Base Loop
+        if incumbent is not None:
+            if num_scenarios == 1:
+                remaining_j = remaining_demand[0, j+1][:, None]
+            else:
+                remaining_j = remaining_demand[scenario, j+1].T
+            lower_bound = total_baseloop.copy()
+            required = cur_inventory < remaining_j
+            for i in range(L):
+                lower_bound += Lambda_t[i] * required[i]
+            pruned = keep & ((total_holding_cost + total_changeover_cost > Tau) | \
+                             (lower_bound / J > incumbent * (1 + PRUNING_TOLERANCE)))
+            if pruned_at is not None:
+                pruned_at[j] += int(pruned.sum())
+            if is_enabled() and pruned.any():
+                count('pruned', (j,), int(pruned.sum()))
+            keep &= ~pruned
+
+        # drop the candidates that stopped in this period
+        if not keep.all():
+            stopped = ~keep
+            holding_cost[index[stopped]] = total_holding_cost[stopped]
+            changeover_cost[index[stopped]] = total_changeover_cost[stopped]
+            index = index[keep]
+            scenario = scenario[keep]
+            Lambdas = Lambdas[:, keep]
+            Lambda_t = Lambda_t[:, keep]
+            if per_candidate_triggers:
+                trigger_points = trigger_points[:, keep]
+            cur_inventory = cur_inventory[:, keep]
+            total_baseloop = total_baseloop[keep]
+            total_holding_cost = total_holding_cost[keep]
+            total_changeover_cost = total_changeover_cost[keep]
+
+    holding_cost[index] = total_holding_cost
+    changeover_cost[index] = total_changeover_cost
+
+    # feasibility: cost tolerance in a year
+    within_tolerance = ~(total_holding_cost + total_changeover_cost > Tau)
+    if is_enabled() and not within_tolerance.all():
+        count('exceeds_cost_tolerance', (), int((~within_tolerance).sum()))
+    feasible[index] = within_tolerance
+    avg_baseloop[index] = np.where(within_tolerance, total_baseloop / J, -1)
+    S = S.transpose(2, 0, 1)
+
+    return avg_baseloop, feasible, holding_cost, changeover_cost, S
+
+
+def count_items(failed, name, j):
+    '''
+    Counts, for each item, the candidates whose first failing item it is
+
+    PARAM:
+    failed: an (L, N) boolean array of the failing items of N candidates, each
+            candidate has at least one
+    name: the name of the counter
+    j: the time period of the failure
+
+    RETURN:
+    None
+    '''
+    items, num_failed = np.unique(np.argmax(failed, axis=0), return_counts=True)
+    for i, amount in zip(items.tolist(), num_failed.tolist()):
+        count(name, (j, i), amount)
+
+
+def get_remaining_demand(L, J, D):
+    '''
+    This function computes the demand of each item from each time period to
+    the end of the horizon
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    D: A list of lists containing all item demands in each time period, or a
+       (K, J, L) stack of demand scenarios
+
+    RETURN:
+    A (J+1, L) array, or (K, J+1, L) for a stack, whose row j is the total
+    demand from period j on. Row J is zero.
+    '''
+    D = np.asarray(D, dtype=float)
+    remaining_demand = np.zeros(D.shape[:-2] + (J+1, L))
+    remaining_demand[..., :J, :] = np.cumsum(D[..., ::-1, :], axis=-2)[..., ::-1, :]
+    return remaining_demand
+
+
 def get_baseloop_skipping(Lambda, t, s):
     '''
     This function computes the baseloop at a given time period
@@ -147,7 +644,7 @@ def get_baseloop_skipping(Lambda, t, s):
     return baseloop
 
 
-def get_random_lambdas(optimal_lambda, neighborhood):
+def get_random_lambdas(optimal_lambda, neighborhood, rng=random):
     '''
     This function randomly samples from an interval around each lambda
 
@@ -155,6 +652,8 @@ def get_random_lambdas(optimal_lambda, neighborhood):
     neighbourhood: the interval around each lambda that we will sample new choices
                    of lambda from
     optimal_lambda: a list of L items output by the non-skipping model
+    rng: the random number generator to sample from, by default the global
+         random module
 
     RETURN:
     A new choice of lambdas
@@ -163,7 +662,7 @@ def get_random_lambdas(optimal_lambda, neighborhood):
     for i in range(len(optimal_lambda)):
         generated_val = -1
         while generated_val <= 0:
-            generated_val = int(random.uniform(optimal_lambda[i] - neighborhood, \
+            generated_val = int(rng.uniform(optimal_lambda[i] - neighborhood, \
                                    optimal_lambda[i] + neighborhood))
         new_lambda[i] = generated_val
     return new_lambda
@@ -176,8 +675,8 @@ def get_optimal_siumulation_results(some_simulation_result):
     average Base Loop
 
     PARAMETERS:
-    some_simulation_result := Some dictionary of feasible results outputed from
-                              the random simulation
+    some_simulation_result := Some TopKResults or dictionary of feasible results
+                              outputed from the random simulation
 
     RETURN:
     A tuple containing two objects: a list of optimal lambdas, one for each item,
@@ -186,6 +685,8 @@ def get_optimal_siumulation_results(some_simulation_result):
 
     if len(some_simulation_result) == 0:
         return -1
+    elif isinstance(some_simulation_result, TopKResults):
+        return some_simulation_result.best()[0]
     else:
         optimal_avg_baseloop = min(some_simulation_result.keys())
         optimal_lambda = some_simulation_result[optimal_avg_baseloop]
@@ -221,20 +722,19 @@ def main():
 
     random.seed(0)
 
-    csv_input = BaseLoopInputData('Input_Data.csv')
-    demand_schedule = csv_input.entire_demand_schedule
-    unit_production_time = csv_input.all_production_times
-    holding_cost = csv_input.inventory_cost
-    num_items = len(holding_cost)
-    num_periods = len(demand_schedule)
-    demand_schedule_init = demand_schedule.copy()
-    demand_schedule_init.insert(0,[0]*num_items)
-    changeover_cost = csv_input.changeover_cost
-    initial_inventory = csv_input.initial_inventories
+    csv_input = BaseLoopInputData('Input_Data.csv', use_cache=True)
+    demand_schedule = csv_input.demand_schedule_array
+    unit_production_time = csv_input.production_times_array
+    holding_cost = csv_input.inventory_cost_array
+    num_items = csv_input.num_items
+    num_periods = csv_input.num_periods
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    changeover_cost = csv_input.changeover_cost_array
+    initial_inventory = csv_input.initial_inventories_array
     total_time = csv_input.total_time
     cost_tolerance = csv_input.cost_tolerance
-    #trigger_points = csv_input.trigger_points
-    trigger_points = [0] * num_items
+    #trigger_points = csv_input.trigger_points_array
+    trigger_points = np.zeros(num_items)
 
     kwargs = {'num_items': num_items, 'num_periods': num_periods, \
               'unit_production_time': unit_production_time, \
@@ -243,6 +743,7 @@ def main():
               'changeover_cost': changeover_cost, 'holding_cost': holding_cost, \
               'demand_schedule_init': demand_schedule_init}
 
+    from cost_model import cost_model
     optimal_lambdas = cost_model(**kwargs)
     if optimal_lambdas == -1:
         optimal_lambdas = [random.randint(1, 100) for i in range(num_items)]
@@ -256,10 +757,11 @@ def main():
     # Optimal average baseloop: 2.442414905878085
     optimal_lambdas = [11, 84, 5, 4, 13, 9, 18, 8, 96]
     avg_baseloop = get_average_baseloop_time(num_items, num_periods, \
-    initial_inventory, holding_cost, changeover_cost, trigger_points, \
-    demand_schedule, optimal_lambdas, unit_production_time, cost_tolerance, \
-    total_time, True)
-    print('demand_schedule_init: ', demand_schedule_init)
+    csv_input.initial_inventories, csv_input.inventory_cost, \
+    csv_input.changeover_cost, trigger_points.tolist(), \
+    csv_input.entire_demand_schedule, optimal_lambdas, \
+    csv_input.all_production_times, cost_tolerance, total_time, True)
+    print('demand_schedule_init: ', demand_schedule_init.astype(int).tolist())
     '''
     # Run simulations
     feasible_results = random_simulation(num_items, num_periods, \
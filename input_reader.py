@@ -1,257 +1,625 @@
-# This program outputs reads in user input from a CSV file for a Baseloop
-# minimization problem
-# @author Will Thompson
-# @author Rosa Zhou
-
-import csv
-import numpy as np
-
-class BaseLoopInputData:
-
-    def __init__(self, input_filename):
-        '''
-        This class takes in data from a csv file and saves all data into 9 lists
-
-        Instance variables:
-        self.item_directory :=  The data for each item data stored in a list
-                                will be stored in lists, which are indexed by
-                                item.
-
-                                The keys in this dictionary are the indices and
-                                the values are the names of the items.
-        self.entire_demand_schedule := This object is a list of lists containing
-                                       the demand for each item in each time period.
-                                       The nth list in this object contains the
-                                       demand for each item in the nth time
-                                       period.
-        self.all_production_times := This is a list containing the production time
-                                     for each item. The nth entry in this list
-                                     is the production time for the nth items
-        self.inventory_cost := This is a list of all item inventory costs
-        self.changeover_cost := This is a list of all item changeover costs
-        self.initial_inventories := This is a list of all of the initial
-                                    inventories for each item
-        self.total_time := A fixed amount of time available to produce items
-        self.cost_tolerance := A number that represents the maximum cost
-                               production can incure
-        self.trigger_points := This is a list of all item trigger points
-        '''
-        self.item_directory = self.read_input_filename(input_filename)[0]
-        self.entire_demand_schedule = self.read_input_filename(input_filename)[1]
-        self.all_production_times = self.read_input_filename(input_filename)[2]
-        self.inventory_cost = self.read_input_filename(input_filename)[3]
-        self.changeover_cost = self.read_input_filename(input_filename)[4]
-        self.initial_inventories = self.read_input_filename(input_filename)[5]
-        self.total_time = self.read_input_filename(input_filename)[6]
-        self.cost_tolerance = self.read_input_filename(input_filename)[7]
-        self.trigger_points = self.read_input_filename(input_filename)[8]
-
-
-    def get_item_demand_schedule(self, expected_demand, stdev_demand, num_time_periods):
-        '''
-        This function estimates an item's demand schedule. With a specified demand
-        horizon, we sample from a normal distribution given by the item's expected
-        demand and standard deviation.
-
-        PARAMETERS:
-        expected_demand := The average demand for an item
-        stdev_demand := standard deviation of demand
-        num_time_periods := total number of time periods
-
-        RETURN:
-        A list containing the item's demand over the given number of time periods
-        '''
-
-        np.random.seed(0)
-        item_demand_array = np.random.normal(expected_demand, stdev_demand,\
-                                             num_time_periods)
-
-        item_demand_list = item_demand_array.tolist()
-        item_demand_list = [int(i) for i in item_demand_list]
-        negative_samples = self.get_negative_samples(item_demand_list)
-
-        for index in negative_samples:
-            item_demand_list[index] = self.make_sample_positive(expected_demand, stdev_demand)
-
-        return item_demand_list
-
-    def get_negative_samples(self, demand_list):
-        '''
-        This function iterates through a sampled demand schedule and returns the
-        indices of negative samples.
-
-        PARAMETERS:
-        demand_list := a list of an item's demand in each time period
-
-        RETURN:
-        A list containing the indices of samples that were negative
-        '''
-
-        indices_of_negative_samples = []
-
-        new_demand_list = demand_list.copy()
-        sign_of_entries_array = np.sign(new_demand_list)
-        sign_of_entries_list = sign_of_entries_array.tolist()
-
-        for i in range(len(sign_of_entries_list)):
-            if sign_of_entries_list[i] == -1.0:
-                indices_of_negative_samples.append(i)
-
-        return indices_of_negative_samples
-
-    def make_sample_positive(self, expected_demand, stdev_demand):
-        '''
-        This function keeps sampling from a normal distribution until it returns
-        a sample that is positive. This new positive sample will replace the
-        previous negative sample.
-
-        PARAMETERS:
-        expected_demand := The average demand for an item
-        stdev_demand := standard deviation of demand
-
-        RETURN:
-        A positive sample from a normal distribution with the given mean and
-        standard deviation
-        '''
-
-        sign = -1
-        while sign == -1:
-            new_demand_sample = int(np.random.normal(expected_demand, stdev_demand))
-
-            if new_demand_sample > 0:
-                sign = 1
-        return new_demand_sample
-
-    def get_length_demand_schedule(self, demand_horizon):
-        '''
-        This function converts a spreadsheet's description of the
-        deamnd horizon, such as "Weekly" or "Monthly" into an integer value
-
-
-        PARAMETERS:
-        demand_horizon := a qualitative description of how many time periods the
-                          loop will run for
-
-        RETURN:
-        An integer value for the number of time periods
-        '''
-
-        if demand_horizon == "Monthly":
-            length_demand_schedule = 12
-
-        elif demand_horizon == "Weekly":
-            length_demand_schedule = 52
-
-        else:
-            length_demand_schedule = demand_horizon
-
-        return length_demand_schedule
-
-    def update_demand_schedule(self, entire_demand_schedule, some_item_demand_schedule):
-        '''
-        This function is designed to insert an item's demand schedule into the
-        entire_demand_schedule object, which contains all demands index by time
-        period.
-
-        PARAMETERS:
-        entire_demand_schedule := A list of lists containing all item demand in
-                                  each time period
-
-        some_item_demand_schedule := A list of an item's demand for each time period
-
-        RETURN:
-        An updated version of entire_demand_schedule containing a new list
-        of item demand
-        '''
-        for i in range(len(entire_demand_schedule)):
-            entire_demand_schedule[i].append(some_item_demand_schedule[i])
-
-        return entire_demand_schedule
-
-    def get_item_production_time(self, machine_cycle_time, units_per_machine_cycle):
-        '''
-        This function calculates item production time by dividing total machine
-        cycle time by the number of units produced in that time
-
-        PARAMETERS:
-        machine_cycle_time := The total time for a machine to run one cycle
-
-        units_per_machine_cycle := The number of items produced in one cycle
-
-        RETURN:
-        item production time
-        '''
-
-        item_production_time = (machine_cycle_time/units_per_machine_cycle)
-        return item_production_time
-
-    def read_input_filename(self, some_input_filename):
-        ''''
-        This function reads in the data from a csv file
-
-        PARAMETERS:
-        some_input_filename := The csv spreadsheet containing the appropriate data
-
-        RETURN:
-        Returns 7 lists of item data, including the complete demand schedule,
-        as well as total_time and cost_tolerance.
-        '''
-        total_time = 0
-        cost_tolerance = 0
-        item_directory = {}
-        entire_demand_schedule = []
-        changeover_cost = []
-        inventory_cost = []
-        all_production_times = []
-        initial_inventories = []
-        trigger_points = []
-
-        line_index = 0
-        inputdata_csv = open(some_input_filename, 'r', encoding='utf-8')
-
-        for line in inputdata_csv:
-            item_data = line.split(",")
-
-            item_demand_horizon = item_data[9].strip()
-            num_time_periods = int(self.get_length_demand_schedule(item_demand_horizon))
-            entire_demand_schedule = [[] for i in range(num_time_periods)]
-
-            total_time = float(item_data[11].strip())
-            cost_tolerance = float(item_data[13].strip())
-
-            line_index+=1
-            break
-
-        for line in inputdata_csv:
-
-            item_data = line.split(",")
-
-            if line_index >= 1:
-
-                item_Name = item_data[0]
-                item_directory[line_index - 1] = item_Name
-
-                item_expected_demand = float(item_data[1])
-                item_stdev_demand = float(item_data[2])
-                item_demand_schedule = self.get_item_demand_schedule(item_expected_demand, item_stdev_demand, num_time_periods)
-                entire_demand_schedule = self.update_demand_schedule(entire_demand_schedule, item_demand_schedule)
-
-                item_changeover_cost = float(item_data[3])
-                changeover_cost.append(item_changeover_cost)
-                item_Inventory_cost = float(item_data[4])
-                inventory_cost.append(item_Inventory_cost)
-
-                machine_cycle_time = float(item_data[5])
-                units_per_Machince_cycle = float(item_data[6])
-                item_production_time = self.get_item_production_time(machine_cycle_time, units_per_Machince_cycle)
-                all_production_times.append(item_production_time)
-
-                item_initial_inventory = float(item_data[7])
-                initial_inventories.append(item_initial_inventory)
-
-                item_trigger_point = float(item_data[8])
-                trigger_points.append(item_trigger_point)
-
-                line_index += 1
-
-        return item_directory, entire_demand_schedule, all_production_times, inventory_cost, changeover_cost, initial_inventories, total_time, cost_tolerance, trigger_points
+# This program outputs reads in user input from a CSV file for a Baseloop
+# minimization problem
+# @author Will Thompson
+# @author Rosa Zhou
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from instrumentation import phase
+
+# version of the layout of the binary input cache, part of its key
+INPUT_CACHE_VERSION = 1
+# arrays kept in the binary input cache, one .npy file each
+INPUT_CACHE_ARRAYS = ['demand_schedule_array', 'production_times_array', \
+                      'inventory_cost_array', 'changeover_cost_array', \
+                      'initial_inventories_array', 'trigger_points_array', \
+                      'expected_demand_array', 'stdev_demand_array']
+
+
+def sample_demand_schedule(expected_demand, stdev_demand, num_time_periods, \
+                           num_scenarios=None, seed=0):
+    '''
+    This function samples the demand of all items in all time periods at once
+    from normal distributions truncated to positive values. Negative samples
+    are redrawn together until every entry is positive, which is an exact way
+    of sampling from the truncated normal. Samples are then rounded down to
+    whole items. Items with a non-positive expected demand have no demand.
+
+    PARAMETERS:
+    expected_demand := a list of the average demand for each item
+    stdev_demand := a list of the standard deviation of demand for each item
+    num_time_periods := total number of time periods
+    num_scenarios := number of independent demand schedules to draw. If None,
+                     a single schedule is drawn
+    seed := seed of the NumPy random Generator, or a Generator
+
+    RETURN:
+    An array of size (J, L) containing the demand for each item in each time
+    period, or an array of size (K, J, L) with one schedule per scenario
+    '''
+    rng = np.random.default_rng(seed)
+    expected_demand = np.asarray(expected_demand, dtype=float)
+    stdev_demand = np.asarray(stdev_demand, dtype=float)
+    num_items = expected_demand.shape[0]
+    if num_scenarios is None:
+        shape = (num_time_periods, num_items)
+    else:
+        shape = (num_scenarios, num_time_periods, num_items)
+
+    samples = rng.normal(expected_demand, stdev_demand, shape)
+    flat_samples = samples.reshape(-1)
+    flat_expected = np.broadcast_to(expected_demand, shape).reshape(-1)
+    flat_stdev = np.broadcast_to(stdev_demand, shape).reshape(-1)
+
+    # redraw the negative samples of items that can have demand
+    redraw = np.flatnonzero((flat_samples <= 0) & (flat_expected > 0))
+    while redraw.size > 0:
+        flat_samples[redraw] = rng.normal(flat_expected[redraw], flat_stdev[redraw])
+        redraw = redraw[flat_samples[redraw] <= 0]
+
+    return np.floor(np.maximum(samples, 0))
+
+
+def get_file_hash(filename):
+    '''
+    This function computes the SHA-1 hash of the content of a file
+
+    PARAMETERS:
+    filename := the path of the file
+
+    RETURN:
+    A hexadecimal string
+    '''
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as some_file:
+        for block in iter(lambda: some_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_input_cache_path(input_filename, seed):
+    '''
+    This function gives the directory of the binary cache of a csv file. The
+    caches of a file live in a hidden directory next to it, one directory per
+    content hash and seed, so a cache is never used for an edited file.
+
+    PARAMETERS:
+    input_filename := the path of the csv file
+    seed := the integer seed of the demand schedule
+
+    RETURN:
+    The path of the cache directory
+    '''
+    input_dir, input_name = os.path.split(os.path.abspath(input_filename))
+    key = "v{}-{}-{}".format(INPUT_CACHE_VERSION, get_file_hash(input_filename), seed)
+    return os.path.join(input_dir, '.' + input_name + '.cache', key)
+
+
+class BaseLoopInputData:
+
+    def __init__(self, input_filename, seed=0, use_cache=False):
+        '''
+        This class takes in data from a csv file. The file is parsed once and
+        the item data is saved into NumPy arrays, which can be passed directly
+        to the cost model and the simulator. The lists of the previous version
+        of this class are still available as properties. Each list is built
+        from its array on first use and kept until the array is replaced, so
+        it is not rebuilt on every access. The list is shared by all accesses
+        and is not written back to the array; assign the property to change
+        the data.
+
+        With use_cache, the parsed data and the sampled demand schedule are
+        saved to a binary cache next to the csv file, keyed by the content
+        hash of the file and the seed. Later runs memory-map the arrays of
+        the cache, read-only, instead of parsing the file and sampling again.
+        The cache is only used for integer seeds.
+
+        Instance variables:
+        self.item_directory :=  The data for each item data stored in a list
+                                will be stored in lists, which are indexed by
+                                item.
+
+                                The keys in this dictionary are the indices and
+                                the values are the names of the items.
+        self.demand_schedule_array := A (J, L) array of floats containing the
+                                      demand for each item in each time period.
+                                      The nth row contains the demand for each
+                                      item in the nth time period.
+        self.production_times_array := A (L,) array of the production time
+                                       of each item
+        self.inventory_cost_array := A (L,) array of all item inventory costs
+        self.changeover_cost_array := A (L,) array of all item changeover costs
+        self.initial_inventories_array := A (L,) array of the initial
+                                          inventories for each item
+        self.total_time := A fixed amount of time available to produce items
+        self.cost_tolerance := A number that represents the maximum cost
+                               production can incure
+        self.trigger_points_array := A (L,) array of all item trigger points
+        self.expected_demand_array := A (L,) array of the average demand of
+                                      each item
+        self.stdev_demand_array := A (L,) array of the standard deviation of
+                                   demand of each item
+        self.seed := The seed the demand schedule was sampled with
+        self.cache_path := The directory of the binary cache, None if it is
+                           not used
+        self.lists := The lists of the list properties, keyed by the name of
+                      their array, with the array each was built from
+
+        List properties:
+        self.entire_demand_schedule := This object is a list of lists containing
+                                       the demand for each item in each time period.
+                                       The nth list in this object contains the
+                                       demand for each item in the nth time
+                                       period.
+        self.all_production_times := This is a list containing the production time
+                                     for each item. The nth entry in this list
+                                     is the production time for the nth items
+        self.inventory_cost := This is a list of all item inventory costs
+        self.changeover_cost := This is a list of all item changeover costs
+        self.initial_inventories := This is a list of all of the initial
+                                    inventories for each item
+        self.trigger_points := This is a list of all item trigger points
+        '''
+        self.seed = seed
+        self.cache_path = None
+        self.lists = {}
+        if use_cache and isinstance(seed, (int, np.integer)):
+            self.cache_path = get_input_cache_path(input_filename, seed)
+            if self.load_input_cache(self.cache_path):
+                return
+
+        self.item_directory, self.demand_schedule_array, \
+        self.production_times_array, self.inventory_cost_array, \
+        self.changeover_cost_array, self.initial_inventories_array, \
+        self.total_time, self.cost_tolerance, \
+        self.trigger_points_array = self.read_input_arrays(input_filename, seed)
+        if self.cache_path is not None:
+            self.write_input_cache(self.cache_path)
+
+    def load_input_cache(self, cache_path):
+        '''
+        This function memory-maps the arrays of a binary cache written by
+        write_input_cache and reads its other data
+
+        PARAMETERS:
+        cache_path := the directory of the cache
+
+        RETURN:
+        True if the cache was loaded, False if there is no complete cache
+        '''
+        try:
+            with open(os.path.join(cache_path, 'meta.json'), encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+            arrays = {name: np.load(os.path.join(cache_path, name + '.npy'), \
+                                    mmap_mode='r') for name in INPUT_CACHE_ARRAYS}
+        except (OSError, ValueError):
+            return False
+
+        self.item_directory = dict(enumerate(meta['item_names']))
+        self.total_time = meta['total_time']
+        self.cost_tolerance = meta['cost_tolerance']
+        for name in INPUT_CACHE_ARRAYS:
+            setattr(self, name, arrays[name])
+        return True
+
+    def write_input_cache(self, cache_path):
+        '''
+        This function writes the parsed data and the demand schedule to a
+        binary cache. Each array is saved as an .npy file, which can be
+        memory-mapped; the other data is saved as json. The cache is written
+        to a temporary directory first and then renamed, so a cache directory
+        is always complete.
+
+        PARAMETERS:
+        cache_path := the directory of the cache
+
+        RETURN:
+        None
+        '''
+        parent_dir = os.path.dirname(cache_path)
+        try:
+            os.makedirs(parent_dir, exist_ok=True)
+            temp_path = tempfile.mkdtemp(dir=parent_dir)
+        except OSError:
+            # the cache is only an optimization, the data is already read
+            return
+        try:
+            for name in INPUT_CACHE_ARRAYS:
+                np.save(os.path.join(temp_path, name + '.npy'), \
+                        np.ascontiguousarray(getattr(self, name)))
+            meta = {'item_names': [self.item_directory[k] for k in \
+                                   range(len(self.item_directory))], \
+                    'total_time': self.total_time, \
+                    'cost_tolerance': self.cost_tolerance}
+            with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as meta_file:
+                json.dump(meta, meta_file)
+            os.rename(temp_path, cache_path)
+        except OSError:
+            # another run wrote the same cache first
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def get_list(self, name, dtype=float):
+        '''
+        Returns the list form of an array attribute, built once for each array
+
+        PARAMETERS:
+        name := the name of the array attribute
+        dtype := the type of the values of the list
+
+        RETURN:
+        A list, or a list of lists for a 2-D array
+        '''
+        array = getattr(self, name)
+        array_list = self.lists.get(name)
+        if array_list is None or array_list[0] is not array:
+            array_list = (array, array.astype(dtype).tolist())
+            self.lists[name] = array_list
+        return array_list[1]
+
+    @property
+    def entire_demand_schedule(self):
+        return self.get_list('demand_schedule_array', int)
+
+    @entire_demand_schedule.setter
+    def entire_demand_schedule(self, value):
+        self.demand_schedule_array = np.asarray(value, dtype=float)
+
+    @property
+    def all_production_times(self):
+        return self.get_list('production_times_array')
+
+    @all_production_times.setter
+    def all_production_times(self, value):
+        self.production_times_array = np.asarray(value, dtype=float)
+
+    @property
+    def inventory_cost(self):
+        return self.get_list('inventory_cost_array')
+
+    @inventory_cost.setter
+    def inventory_cost(self, value):
+        self.inventory_cost_array = np.asarray(value, dtype=float)
+
+    @property
+    def changeover_cost(self):
+        return self.get_list('changeover_cost_array')
+
+    @changeover_cost.setter
+    def changeover_cost(self, value):
+        self.changeover_cost_array = np.asarray(value, dtype=float)
+
+    @property
+    def initial_inventories(self):
+        return self.get_list('initial_inventories_array')
+
+    @initial_inventories.setter
+    def initial_inventories(self, value):
+        self.initial_inventories_array = np.asarray(value, dtype=float)
+
+    @property
+    def trigger_points(self):
+        return self.get_list('trigger_points_array')
+
+    @trigger_points.setter
+    def trigger_points(self, value):
+        self.trigger_points_array = np.asarray(value, dtype=float)
+
+    @property
+    def num_items(self):
+        return self.demand_schedule_array.shape[1]
+
+    @property
+    def num_periods(self):
+        return self.demand_schedule_array.shape[0]
+
+
+    def get_demand_scenarios(self, num_scenarios, seed=None):
+        '''
+        This function draws independent demand schedules for the items read
+        from the csv file
+
+        PARAMETERS:
+        num_scenarios := number of demand schedules to draw
+        seed := seed of the NumPy random Generator
+
+        RETURN:
+        An array of size (K, J, L) containing one demand schedule per scenario
+        '''
+        return sample_demand_schedule(self.expected_demand_array, \
+                                      self.stdev_demand_array, self.num_periods, \
+                                      num_scenarios, seed)
+
+    def get_item_demand_schedule(self, expected_demand, stdev_demand, num_time_periods, seed=0):
+        '''
+        This function estimates an item's demand schedule. With a specified demand
+        horizon, we sample from a normal distribution given by the item's expected
+        demand and standard deviation, truncated to positive values.
+
+        PARAMETERS:
+        expected_demand := The average demand for an item
+        stdev_demand := standard deviation of demand
+        num_time_periods := total number of time periods
+        seed := seed of the NumPy random Generator
+
+        RETURN:
+        A list containing the item's demand over the given number of time periods
+        '''
+        item_demand_array = sample_demand_schedule([expected_demand], \
+                            [stdev_demand], num_time_periods, seed=seed)[:, 0]
+        return item_demand_array.astype(int).tolist()
+
+    def get_length_demand_schedule(self, demand_horizon):
+        '''
+        This function converts a spreadsheet's description of the
+        deamnd horizon, such as "Weekly" or "Monthly" into an integer value
+
+
+        PARAMETERS:
+        demand_horizon := a qualitative description of how many time periods the
+                          loop will run for
+
+        RETURN:
+        An integer value for the number of time periods
+        '''
+        return get_length_demand_schedule(demand_horizon)
+
+    def update_demand_schedule(self, entire_demand_schedule, some_item_demand_schedule):
+        '''
+        This function is designed to insert an item's demand schedule into the
+        entire_demand_schedule object, which contains all demands index by time
+        period.
+
+        PARAMETERS:
+        entire_demand_schedule := A list of lists containing all item demand in
+                                  each time period
+
+        some_item_demand_schedule := A list of an item's demand for each time period
+
+        RETURN:
+        An updated version of entire_demand_schedule containing a new list
+        of item demand
+        '''
+        for i in range(len(entire_demand_schedule)):
+            entire_demand_schedule[i].append(some_item_demand_schedule[i])
+
+        return entire_demand_schedule
+
+    def get_item_production_time(self, machine_cycle_time, units_per_machine_cycle):
+        '''
+        This function calculates item production time by dividing total machine
+        cycle time by the number of units produced in that time
+
+        PARAMETERS:
+        machine_cycle_time := The total time for a machine to run one cycle
+
+        units_per_machine_cycle := The number of items produced in one cycle
+
+        RETURN:
+        item production time
+        '''
+
+        item_production_time = (machine_cycle_time/units_per_machine_cycle)
+        return item_production_time
+
+    def read_input_arrays(self, some_input_filename, seed=0):
+        '''
+        This function reads in the data from a csv file in a single pass and
+        samples the demand schedule of all items together
+
+        PARAMETERS:
+        some_input_filename := The csv spreadsheet containing the appropriate data
+        seed := seed used to sample the demand schedule
+
+        RETURN:
+        Returns the item directory, the (J, L) demand schedule array, 5 arrays
+        of item data, as well as total_time and cost_tolerance, in the same
+        order as read_input_filename
+        '''
+        num_time_periods = 0
+        total_time = 0
+        cost_tolerance = 0
+        item_directory = {}
+        item_rows = []
+
+        with phase('read_csv'), open(some_input_filename, 'r', encoding='utf-8') as inputdata_csv:
+            for line in inputdata_csv:
+                num_time_periods, total_time, cost_tolerance = parse_input_header(line)
+                break
+
+            for line in inputdata_csv:
+                item_data = line.split(",")
+
+                item_directory[len(item_rows)] = item_data[0]
+                item_rows.append([float(value) for value in item_data[1:9]])
+
+        chunk = InputDataChunk(item_directory, item_rows, num_time_periods, \
+                               total_time, cost_tolerance, seed)
+        self.expected_demand_array = chunk.expected_demand_array
+        self.stdev_demand_array = chunk.stdev_demand_array
+
+        return item_directory, chunk.demand_schedule_array, chunk.production_times_array, chunk.inventory_cost_array, chunk.changeover_cost_array, chunk.initial_inventories_array, total_time, cost_tolerance, chunk.trigger_points_array
+
+    def read_input_filename(self, some_input_filename, seed=0):
+        ''''
+        This function reads in the data from a csv file
+
+        PARAMETERS:
+        some_input_filename := The csv spreadsheet containing the appropriate data
+        seed := seed used to sample the demand schedule
+
+        RETURN:
+        Returns 7 lists of item data, including the complete demand schedule,
+        as well as total_time and cost_tolerance.
+        '''
+        item_directory, demand_schedule, all_production_times, inventory_cost, \
+        changeover_cost, initial_inventories, total_time, cost_tolerance, \
+        trigger_points = self.read_input_arrays(some_input_filename, seed)
+
+        return item_directory, demand_schedule.astype(int).tolist(), all_production_times.tolist(), inventory_cost.tolist(), changeover_cost.tolist(), initial_inventories.tolist(), total_time, cost_tolerance, trigger_points.tolist()
+
+
+class InputDataChunk:
+
+    def __init__(self, item_directory, item_rows, num_time_periods, total_time, \
+                 cost_tolerance, seed=0, item_offset=0):
+        '''
+        This class holds the data of a block of consecutive items of a csv
+        file, in the same arrays as BaseLoopInputData, so a block can be passed
+        to the cost model and the simulator like the whole file. The demand
+        schedule of the block is sampled when the block is made.
+
+        PARAMETERS:
+        item_directory := a dictionary of the names of the items in the block,
+                          indexed from item_offset
+        item_rows := a list of the 8 numeric columns of each item
+        num_time_periods := total number of time periods
+        total_time := the time available to produce items in a period
+        cost_tolerance := the maximum cost production can incure
+        seed := seed used to sample the demand schedule of the block
+        item_offset := the index of the first item of the block in the file
+
+        Instance variables:
+        self.item_offset, self.item_directory, self.total_time,
+        self.cost_tolerance := as given
+        self.demand_schedule_array, self.production_times_array,
+        self.inventory_cost_array, self.changeover_cost_array,
+        self.initial_inventories_array, self.trigger_points_array,
+        self.expected_demand_array, self.stdev_demand_array := the arrays of
+        BaseLoopInputData for the items of the block
+        '''
+        self.item_offset = item_offset
+        self.item_directory = item_directory
+        self.total_time = total_time
+        self.cost_tolerance = cost_tolerance
+
+        # columns: demand, std dev, changeover cost, inventory cost, machine
+        # cycle time, units per machine cycle, initial inventory, trigger point
+        item_array = np.array(item_rows, dtype=float).reshape(-1, 8)
+        self.expected_demand_array = item_array[:, 0].copy()
+        self.stdev_demand_array = item_array[:, 1].copy()
+        with phase('sample_demand'):
+            self.demand_schedule_array = sample_demand_schedule(\
+                                         self.expected_demand_array, \
+                                         self.stdev_demand_array, \
+                                         num_time_periods, seed=seed)
+        self.changeover_cost_array = item_array[:, 2].copy()
+        self.inventory_cost_array = item_array[:, 3].copy()
+        self.production_times_array = item_array[:, 4] / item_array[:, 5]
+        self.initial_inventories_array = item_array[:, 6].copy()
+        self.trigger_points_array = item_array[:, 7].copy()
+
+    @property
+    def num_items(self):
+        return self.demand_schedule_array.shape[1]
+
+    @property
+    def num_periods(self):
+        return self.demand_schedule_array.shape[0]
+
+
+def get_length_demand_schedule(demand_horizon):
+    '''
+    This function converts a spreadsheet's description of the demand horizon,
+    such as "Weekly" or "Monthly" into an integer value
+
+    PARAMETERS:
+    demand_horizon := a qualitative description of how many time periods the
+                      loop will run for
+
+    RETURN:
+    An integer value for the number of time periods
+    '''
+    if demand_horizon == "Monthly":
+        length_demand_schedule = 12
+
+    elif demand_horizon == "Weekly":
+        length_demand_schedule = 52
+
+    else:
+        length_demand_schedule = demand_horizon
+
+    return length_demand_schedule
+
+
+def parse_input_header(line):
+    '''
+    This function reads the settings in the header line of a csv file
+
+    PARAMETERS:
+    line := the first line of the csv file
+
+    RETURN:
+    A tuple of the number of time periods, total_time and cost_tolerance
+    '''
+    item_data = line.split(",")
+    num_time_periods = int(get_length_demand_schedule(item_data[9].strip()))
+    total_time = float(item_data[11].strip())
+    cost_tolerance = float(item_data[13].strip())
+    return num_time_periods, total_time, cost_tolerance
+
+
+def read_input_chunks(input_filename, chunk_size=1000, seed=0):
+    '''
+    This function reads a csv file in blocks of chunk_size items and yields
+    each block once it is read, so memory is bounded by the block size rather
+    than by the number of items in the file. The demand schedule of block k is
+    sampled with its own seed, derived from seed and k, so the blocks do not
+    depend on each other but are not the same samples as BaseLoopInputData.
+
+    PARAMETERS:
+    input_filename := The csv spreadsheet containing the appropriate data
+    chunk_size := the number of items in each block, the last one can be
+                  smaller
+    seed := the seed the block seeds are derived from
+
+    RETURN:
+    A generator of InputDataChunk
+    '''
+    with open(input_filename, 'r', encoding='utf-8') as inputdata_csv:
+        header = inputdata_csv.readline()
+        if not header:
+            return
+        num_time_periods, total_time, cost_tolerance = parse_input_header(header)
+
+        chunk_index = 0
+        item_offset = 0
+        item_directory = {}
+        item_rows = []
+        for line in inputdata_csv:
+            item_data = line.split(",")
+            item_directory[item_offset + len(item_rows)] = item_data[0]
+            item_rows.append([float(value) for value in item_data[1:9]])
+
+            if len(item_rows) == chunk_size:
+                yield InputDataChunk(item_directory, item_rows, num_time_periods, \
+                                     total_time, cost_tolerance, \
+                                     get_chunk_seed(seed, chunk_index), item_offset)
+                chunk_index += 1
+                item_offset += len(item_rows)
+                item_directory = {}
+                item_rows = []
+
+        if item_rows:
+            yield InputDataChunk(item_directory, item_rows, num_time_periods, \
+                                 total_time, cost_tolerance, \
+                                 get_chunk_seed(seed, chunk_index), item_offset)
+
+
+def get_chunk_seed(seed, chunk_index):
+    '''
+    This function derives the seed of a block of items, the same one as the
+    chunk_index-th child of np.random.SeedSequence(seed).spawn
+
+    PARAMETERS:
+    seed := the integer seed of the file
+    chunk_index := the index of the block
+
+    RETURN:
+    A np.random.SeedSequence
+    '''
+    return np.random.SeedSequence(seed, spawn_key=(chunk_index,))
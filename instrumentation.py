@@ -0,0 +1,224 @@
+# Opt-in instrumentation of a planning run: nested phase timers, counters of
+# why candidates fail, and solver statistics, exported as json or as a trace
+# for chrome://tracing. Nothing is recorded until enable is called.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import json
+import os
+import time
+from contextlib import nullcontext
+
+# the active Profiler, None while instrumentation is disabled
+profiler = None
+# context manager returned by phase while disabled
+NO_PHASE = nullcontext()
+
+
+class Profiler:
+
+    def __init__(self):
+        '''
+        This class records the phases, counters and solver statistics of a run.
+        Phases nest: a phase entered inside another one is recorded as its
+        child.
+
+        Instance variables:
+        self.phases := a list of (name, path, start, duration, depth) of the
+                       finished phases, times in nanoseconds from the start of
+                       the profiler and path the names of the enclosing phases
+                       and this one joined by '/'
+        self.counters := a dictionary of counters, each a dictionary from a key
+                         tuple to a count
+        self.solver_stats := a list of dictionaries of solver statistics
+        '''
+        self.start_time = time.perf_counter_ns()
+        self.phases = []
+        self.counters = {}
+        self.solver_stats = []
+        self.stack = []
+
+    def phase(self, name):
+        '''
+        Returns a context manager that times a phase
+        '''
+        return Phase(self, name)
+
+    def count(self, name, key=(), amount=1):
+        '''
+        Adds amount to the counter name at key
+
+        PARAMETERS:
+        name := the name of the counter, such as 'does_not_meet_demand'
+        key := a tuple such as (period, item)
+        amount := the amount added
+
+        RETURN:
+        None
+        '''
+        counter = self.counters.setdefault(name, {})
+        counter[key] = counter.get(key, 0) + amount
+
+    def get_phase_totals(self):
+        '''
+        Sums the time of the phases with the same path
+
+        RETURN:
+        A dictionary from path to a dictionary with the number of calls and
+        the total seconds, in the order the paths were first finished
+        '''
+        totals = {}
+        for name, path, start, duration, depth in self.phases:
+            total = totals.setdefault(path, {'calls': 0, 'seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] += duration / 1e9
+        return totals
+
+    def to_dict(self):
+        '''
+        Returns the recorded data in a form that can be saved as json. Counter
+        keys are joined by '/', for example 'period/item'.
+        '''
+        return {'phases': self.get_phase_totals(), \
+                'counters': {name: {'/'.join(str(value) for value in key): count \
+                                    for key, count in counter.items()} \
+                             for name, counter in self.counters.items()}, \
+                'solver_stats': self.solver_stats}
+
+    def export_json(self, filename):
+        '''
+        Saves the phase totals, counters and solver statistics as json
+        '''
+        with open(filename, 'w', encoding='utf-8') as json_file:
+            json.dump(self.to_dict(), json_file, indent=1)
+
+    def export_chrome_trace(self, filename):
+        '''
+        Saves the phases in the trace event format of chrome://tracing and
+        Perfetto, one complete event per phase. Counters and solver
+        statistics are saved with the trace as metadata.
+        '''
+        pid = os.getpid()
+        events = [{'name': name, 'cat': path.split('/')[0], 'ph': 'X', \
+                   'ts': start / 1e3, 'dur': duration / 1e3, 'pid': pid, \
+                   'tid': 0, 'args': {'path': path}} for name, path, start, \
+                  duration, depth in self.phases]
+        metadata = self.to_dict()
+        del metadata['phases']
+        with open(filename, 'w', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', \
+                       'otherData': metadata}, trace_file)
+
+
+class Phase:
+
+    def __init__(self, profiler, name):
+        '''
+        This class times one phase of a Profiler, as a context manager
+        '''
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        stack = self.profiler.stack
+        path = '/'.join(stack)
+        stack.pop()
+        self.profiler.phases.append((self.name, path, \
+                                     self.start - self.profiler.start_time, \
+                                     end - self.start, len(stack)))
+        return False
+
+
+def enable():
+    '''
+    Starts recording with a new Profiler
+
+    RETURN:
+    The Profiler
+    '''
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+
+def disable():
+    '''
+    Stops recording
+
+    RETURN:
+    The Profiler that was recording, or None
+    '''
+    global profiler
+    stopped, profiler = profiler, None
+    return stopped
+
+
+def is_enabled():
+    '''
+    Returns whether instrumentation is recording
+    '''
+    return profiler is not None
+
+
+def phase(name):
+    '''
+    Returns a context manager that times a phase while instrumentation is
+    enabled, and does nothing otherwise
+
+    PARAMETERS:
+    name := the name of the phase
+
+    RETURN:
+    A context manager
+    '''
+    if profiler is None:
+        return NO_PHASE
+    return Phase(profiler, name)
+
+
+def count(name, key=(), amount=1):
+    '''
+    Adds amount to a counter while instrumentation is enabled, see
+    Profiler.count
+    '''
+    if profiler is not None:
+        profiler.count(name, key, amount)
+
+
+def optimize_model(model, name, **kwargs):
+    '''
+    Optimizes a mip Model in a phase and records its solver statistics while
+    instrumentation is enabled. python-mip does not report the number of
+    branch and bound nodes of CBC, so they are not recorded.
+
+    PARAMETERS:
+    model := a mip Model
+    name := the name of the phase and of the statistics
+    kwargs := arguments of model.optimize
+
+    RETURN:
+    The status returned by model.optimize
+    '''
+    if profiler is None:
+        return model.optimize(**kwargs)
+
+    start = time.perf_counter()
+    with phase(name):
+        status = model.optimize(**kwargs)
+    seconds = time.perf_counter() - start
+    stats = {'name': name, 'status': status.name, 'seconds': seconds, \
+             'num_rows': model.num_rows, 'num_cols': model.num_cols, \
+             'num_nz': model.num_nz, 'num_solutions': model.num_solutions, \
+             'objective_value': None, 'objective_bound': None, 'gap': None}
+    if model.num_solutions > 0:
+        stats.update({'objective_value': model.objective_value, \
+                      'objective_bound': model.objective_bound, \
+                      'gap': model.gap})
+    profiler.solver_stats.append(stats)
+    return status
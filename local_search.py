@@ -0,0 +1,480 @@
+# Local search for the skipping model: hill climbing and simulated annealing
+# over the Lambdas, starting from the output of the cost model.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import math
+import random
+import time
+import numpy as np
+from evaluation_cache import get_input_fingerprint
+from find_skipping_coeff import get_baseloop_skipping, get_remaining_demand, \
+                                PRUNING_TOLERANCE
+from input_reader import BaseLoopInputData
+from instrumentation import count
+
+# score of an infeasible Lambda, the number of periods it could not simulate
+# is added on top so that Lambdas failing later are preferred
+INFEASIBLE_SCORE = 1e9
+# score of a Lambda abandoned because it cannot beat the incumbent
+PRUNED_SCORE = math.inf
+
+
+class SkippingLocalSearch:
+
+    def __init__(self, L, J, I0, h, a, trigger_points, D, t, Tau, T, cache=None):
+        '''
+        This class searches for the Lambdas with the smallest average Base Loop
+        by changing one item's lambda per move. The state of the simulation at
+        the start of each period is kept for the current Lambda, so a move only
+        re-simulates the periods from the first one where the changed item is
+        produced. Before that period the item is skipped, so its lambda cannot
+        change the Base Loop, the production or the skip decisions.
+
+        PARAM:
+        L: number of items
+        J: number of time periods
+        I0: a list of item initial inventories
+        h: inventory cost
+        a: changeover cost
+        trigger_points: a list of item trigger points
+        D: A list of lists containing all item demands in each time period
+        t: a list of time takes to produce one unit of item
+        Tau: cost tolerance
+        T: the total time available to run the loop in each time period
+        cache: an EvaluationCache. While the current Lambda is feasible, moves
+               to cached Lambdas that would be rejected are not simulated
+
+        Instance variables:
+        self.num_evaluations := number of Lambdas evaluated so far
+        self.num_periods_simulated := number of periods simulated so far, a
+                                      full evaluation simulates J periods
+        self.pruned_at := a list counting the evaluations pruned in each
+                          period, None if the search does not prune
+        '''
+        self.L = L
+        self.J = J
+        self.I0 = [float(value) for value in I0]
+        self.h = [float(value) for value in h]
+        self.a = [float(value) for value in a]
+        self.trigger_points = [float(value) for value in trigger_points]
+        self.D = [[float(value) for value in row] for row in D]
+        self.t = [float(value) for value in t]
+        self.Tau = Tau
+        self.T = T
+        self.num_evaluations = 0
+        self.num_periods_simulated = 0
+        self.pruned_at = None
+        self.remaining_demand = get_remaining_demand(L, J, self.D).tolist()
+        self.cache = cache
+        if cache is not None:
+            self.fingerprint = get_input_fingerprint(L, J, I0, h, a, \
+                               trigger_points, D, t, Tau, T)
+
+    def evaluate(self, Lambda, current=None, item=None, incumbent=None):
+        '''
+        This function evaluates a choice of Lambda. If current is the
+        evaluation of a Lambda that only differs from this one in the given
+        item, the simulation resumes from the first period where that item is
+        produced. With an incumbent, the simulation is abandoned as in
+        get_average_baseloop_time and the score is PRUNED_SCORE.
+
+        PARAM:
+        Lambda: a list of L items, each correspond to number of one item
+                produced in a loop
+        current: the evaluation of the current Lambda, or None
+        item: the index of the item whose lambda changed
+        incumbent: the average Base Loop to beat, or None
+
+        RETURN:
+        A tuple (score, avg_baseloop, states, S). score is the average Base Loop
+        for feasible Lambdas and INFEASIBLE_SCORE plus a penalty otherwise,
+        avg_baseloop is -1 for infeasible Lambdas. states[j] holds the
+        inventory and running totals at the start of period j and S holds the
+        skipping coefficients of the simulated periods.
+        '''
+        self.num_evaluations += 1
+        start_period = 0
+        if current is not None:
+            S = current[3]
+            start_period = len(S)
+            for j in range(len(S)):
+                if S[j][item] == 1:
+                    start_period = j
+                    break
+            if start_period == len(S):
+                # the item is never produced, nothing changes
+                return current
+
+            states = current[2][:start_period+1]
+            S = S[:start_period]
+        else:
+            states = [(self.I0, 0, 0, 0)]
+            S = []
+
+        evaluation = self.simulate_periods(Lambda, states, S, incumbent)
+        if self.cache is not None and evaluation[0] != PRUNED_SCORE:
+            self.cache.store(self.fingerprint, Lambda, evaluation[1])
+        return evaluation
+
+    def get_cached_score(self, Lambda, current):
+        '''
+        This function looks up the score of a Lambda in the cache. Scores of
+        infeasible Lambdas are only known to be worse than any feasible score,
+        so they are only looked up while the current Lambda is feasible.
+
+        PARAM:
+        Lambda: a list of L items
+        current: the evaluation of the current Lambda
+
+        RETURN:
+        The score of Lambda, or None if it has to be evaluated
+        '''
+        if self.cache is None or current[1] == -1:
+            return None
+        avg_baseloop = self.cache.lookup(self.fingerprint, Lambda)
+        if avg_baseloop == -1:
+            return INFEASIBLE_SCORE
+        return avg_baseloop
+
+    def simulate_periods(self, Lambda, states, S, incumbent=None):
+        '''
+        This function continues the skipping simulation of
+        get_average_baseloop_time from the last state in states
+
+        PARAM:
+        Lambda: a list of L items, each correspond to number of one item
+                produced in a loop
+        states: the states at the start of the periods already simulated
+        S: the skipping coefficients of the periods already simulated
+        incumbent: the average Base Loop to beat, or None
+
+        RETURN:
+        The same tuple as evaluate
+        '''
+        L, D, T = self.L, self.D, self.T
+        cur_inventory, total_baseloop, total_holding_cost, \
+            total_changeover_cost = states[-1]
+
+        for j in range(len(S), self.J):
+            self.num_periods_simulated += 1
+            cur_inventory = cur_inventory.copy()
+            # determine which items to skip
+            S_j = [0] * L
+            for i in range(L):
+                if cur_inventory[i] < max(self.trigger_points[i], D[j][i]):
+                    S_j[i] = 1
+            S.append(S_j)
+            # compute baseloop at time j
+            baseloop = get_baseloop_skipping(Lambda, self.t, S_j)
+            total_baseloop += baseloop
+            for i in range(L):
+                # feasibility: meet demand at each time period
+                if S_j[i] == 1:
+                    num_baseloop = math.floor(T / baseloop)
+                    production = Lambda[i] * num_baseloop
+                    if sum(S_j) > 1:
+                        total_changeover_cost += self.a[i] * num_baseloop
+                    if production + cur_inventory[i] < D[j][i]:
+                        # does not meet demand
+                        score = INFEASIBLE_SCORE + self.J - j
+                        count('does_not_meet_demand', (j, i))
+                        return score, -1, states, S
+                else:
+                    production = 0
+
+                # update inventory and holding cost
+                cur_inventory[i] = production + cur_inventory[i] - D[j][i]
+                total_holding_cost += self.h[i] * cur_inventory[i]
+            states.append((cur_inventory, total_baseloop, total_holding_cost, \
+                           total_changeover_cost))
+
+            # pruning: cost so far and lower bound on the average Base Loop
+            if incumbent is not None:
+                pruned = total_holding_cost + total_changeover_cost > self.Tau
+                if not pruned:
+                    lower_bound = total_baseloop
+                    for i in range(L):
+                        if cur_inventory[i] < self.remaining_demand[j+1][i]:
+                            lower_bound += Lambda[i] * self.t[i]
+                    pruned = lower_bound / self.J > incumbent * (1 + PRUNING_TOLERANCE)
+                if pruned:
+                    if self.pruned_at is not None: self.pruned_at[j] += 1
+                    count('pruned', (j,))
+                    return PRUNED_SCORE, -1, states, S
+
+        # feasibility: cost tolerance in a year
+        total_cost = total_holding_cost + total_changeover_cost
+        if total_cost > self.Tau:
+            score = INFEASIBLE_SCORE + (total_cost - self.Tau) / total_cost
+            count('exceeds_cost_tolerance')
+            return score, -1, states, S
+
+        avg_baseloop = total_baseloop/(self.J)
+        return avg_baseloop, avg_baseloop, states, S
+
+    def hill_climbing(self, initial_lambda, step_size=1, max_evaluations=None, target=None, seed=0, prune=False):
+        '''
+        This function moves to the first neighbouring Lambda with a better score
+        until no neighbour improves the score. The neighbours of a Lambda change
+        one item's lambda by up to step_size, in a random order. With prune,
+        while the current Lambda is feasible, neighbours are abandoned as soon
+        as they cannot beat it.
+
+        PARAM:
+        initial_lambda: a list of L items to start from, such as the output of
+                        the cost model
+        step_size: the largest change of one lambda in a move
+        max_evaluations: stop after this many evaluations if not converged
+        target: the average Base Loop the time to target is measured for
+        seed: seed of the random order of the moves
+        prune: whether to prune the evaluation of neighbours
+
+        RETURN:
+        The dictionary of results described in get_search_results
+        '''
+        rng = random.Random(seed)
+        self.start_search(target, prune)
+        Lambda = [max(1, int(round(value))) for value in initial_lambda]
+        current = self.evaluate(Lambda)
+        self.record(current, Lambda)
+
+        moves = [(i, step) for i in range(self.L) for step in \
+                 range(-step_size, step_size+1) if step != 0]
+        converged = False
+        while not converged and not self.out_of_evaluations(max_evaluations):
+            converged = True
+            rng.shuffle(moves)
+            for i, step in moves:
+                if Lambda[i] + step < 1:
+                    continue
+                new_lambda = Lambda.copy()
+                new_lambda[i] += step
+                cached_score = self.get_cached_score(new_lambda, current)
+                if cached_score is not None and cached_score >= current[0]:
+                    continue
+                incumbent = current[1] if prune and current[1] != -1 else None
+                candidate = self.evaluate(new_lambda, current, i, incumbent)
+                if candidate[0] < current[0]:
+                    Lambda, current = new_lambda, candidate
+                    self.record(current, Lambda)
+                    converged = False
+                    break
+                if self.out_of_evaluations(max_evaluations):
+                    converged = False
+                    break
+
+        return self.get_search_results(converged)
+
+    def simulated_annealing(self, initial_lambda, step_size=5, initial_temperature=0.1, cooling_rate=0.999, min_temperature=1e-4, patience=5000, max_evaluations=None, target=None, seed=0, prune=False):
+        '''
+        This function changes the lambda of a random item by a random step at
+        each move. Moves that improve the score are always accepted, worse
+        moves are accepted with probability exp(-increase / temperature). The
+        temperature is multiplied by cooling_rate after each move. The search
+        converges when the temperature falls below min_temperature or the
+        best score has not improved for patience moves. Since worse moves
+        can be accepted, prune only abandons moves that exceed Tau while the
+        current Lambda is feasible, which are never accepted.
+
+        PARAM:
+        initial_lambda: a list of L items to start from, such as the output of
+                        the cost model
+        step_size: the largest change of one lambda in a move
+        initial_temperature: the temperature of the first move, in units of
+                             average Base Loop
+        cooling_rate: the factor the temperature decreases by after each move
+        min_temperature: the temperature at which the search stops
+        patience: the number of moves without improving the best score after
+                  which the search stops
+        max_evaluations: stop after this many evaluations if not converged
+        target: the average Base Loop the time to target is measured for
+        seed: seed of the random moves
+        prune: whether to prune the evaluation of moves on cost
+
+        RETURN:
+        The dictionary of results described in get_search_results
+        '''
+        rng = random.Random(seed)
+        self.start_search(target, prune)
+        Lambda = [max(1, int(round(value))) for value in initial_lambda]
+        current = self.evaluate(Lambda)
+        self.record(current, Lambda)
+
+        temperature = initial_temperature
+        moves_since_best = 0
+        converged = False
+        while not self.out_of_evaluations(max_evaluations):
+            if temperature < min_temperature or moves_since_best >= patience:
+                converged = True
+                break
+
+            i = rng.randrange(self.L)
+            step = rng.choice([-1, 1]) * rng.randint(1, step_size)
+            temperature *= cooling_rate
+            moves_since_best += 1
+            if Lambda[i] + step < 1:
+                continue
+
+            new_lambda = Lambda.copy()
+            new_lambda[i] += step
+            candidate = None
+            score = self.get_cached_score(new_lambda, current)
+            if score is None:
+                incumbent = math.inf if prune and current[1] != -1 else None
+                candidate = self.evaluate(new_lambda, current, i, incumbent)
+                score = candidate[0]
+            increase = score - current[0]
+            if increase <= 0 or rng.random() < math.exp(-increase / temperature):
+                if candidate is None:
+                    candidate = self.evaluate(new_lambda, current, i)
+                Lambda, current = new_lambda, candidate
+                if self.record(current, Lambda):
+                    moves_since_best = 0
+
+        return self.get_search_results(converged)
+
+    def start_search(self, target, prune=False):
+        '''
+        Resets the counters and the best Lambda before a search
+
+        PARAM:
+        target: the average Base Loop the time to target is measured for
+        prune: whether the search prunes evaluations
+
+        RETURN:
+        None
+        '''
+        self.num_evaluations = 0
+        self.num_periods_simulated = 0
+        self.pruned_at = [0] * self.J if prune else None
+        self.best_score = math.inf
+        self.best_lambda = None
+        self.best_avg_baseloop = -1
+        self.target = target
+        self.time_to_target = None
+        self.start_time = time.perf_counter()
+
+    def record(self, evaluation, Lambda):
+        '''
+        Keeps the given Lambda if it is the best one found so far
+
+        PARAM:
+        evaluation: the tuple returned by evaluate for Lambda
+        Lambda: a list of L items
+
+        RETURN:
+        True if Lambda is the new best Lambda
+        '''
+        if evaluation[0] >= self.best_score:
+            return False
+
+        self.best_score = evaluation[0]
+        self.best_lambda = Lambda.copy()
+        self.best_avg_baseloop = evaluation[1]
+        if self.target is not None and self.time_to_target is None and \
+           evaluation[1] != -1 and evaluation[1] <= self.target:
+            self.time_to_target = time.perf_counter() - self.start_time
+        return True
+
+    def out_of_evaluations(self, max_evaluations):
+        '''
+        Checks whether a search has used up its evaluations
+
+        PARAM:
+        max_evaluations: the largest number of evaluations, or None
+
+        RETURN:
+        True if the search has to stop
+        '''
+        return max_evaluations is not None and self.num_evaluations >= max_evaluations
+
+    def get_search_results(self, converged):
+        '''
+        Summarizes the search that just finished
+
+        PARAM:
+        converged: whether the search stopped on its convergence criterion
+
+        RETURN:
+        A dictionary with the best Lambda, its average Base Loop (-1 if no
+        feasible Lambda was found), the number of evaluations, the elapsed
+        time, the evaluations per second, the time to reach the target (None
+        if it was not reached), the fraction of periods that were simulated
+        compared to full evaluations, whether the search converged and the
+        number of evaluations pruned in each period (None without pruning)
+        '''
+        elapsed = time.perf_counter() - self.start_time
+        return {'lambda': self.best_lambda, \
+                'avg_baseloop': self.best_avg_baseloop, \
+                'evaluations': self.num_evaluations, \
+                'elapsed': elapsed, \
+                'evaluations_per_second': self.num_evaluations / elapsed, \
+                'time_to_target': self.time_to_target, \
+                'periods_simulated_fraction': self.num_periods_simulated / \
+                                              (self.num_evaluations * self.J), \
+                'converged': converged, \
+                'pruned_at': self.pruned_at}
+
+
+def display_search_results(search_result):
+    '''
+    Displays the best Lambdas found by a local search and its statistics
+
+    PARAMETERS:
+    search_result := the dictionary returned by a local search
+
+    RETURN:
+    None
+    '''
+    print("***************************")
+    print("Local Search Output:")
+    if search_result['avg_baseloop'] != -1:
+        print("Optimal Choice of Lambdas: {}".format(search_result['lambda']))
+        print("Optimal average baseloop: {}".format(search_result['avg_baseloop']))
+    else:
+        print("No feasible solution found")
+    print("Evaluations: {} ({:.0f} per second, {:.1%} of periods simulated)".format(\
+          search_result['evaluations'], search_result['evaluations_per_second'], \
+          search_result['periods_simulated_fraction']))
+    print("Elapsed time: {:.3f}s, time to target: {}".format(\
+          search_result['elapsed'], search_result['time_to_target']))
+    print("Converged: {}".format(search_result['converged']))
+    if search_result['pruned_at'] is not None:
+        print("Pruned evaluations: {}, by period: {}".format(\
+              sum(search_result['pruned_at']), search_result['pruned_at']))
+    print("***************************")
+
+
+def main():
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    num_items = csv_input.num_items
+    num_periods = csv_input.num_periods
+    demand_schedule = csv_input.demand_schedule_array
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    trigger_points = np.zeros(num_items)
+
+    from cost_model import cost_model
+    optimal_lambdas = cost_model(num_items, num_periods, \
+                                 csv_input.production_times_array, \
+                                 csv_input.total_time, \
+                                 csv_input.initial_inventories_array, \
+                                 demand_schedule, csv_input.cost_tolerance, \
+                                 csv_input.changeover_cost_array, \
+                                 csv_input.inventory_cost_array, \
+                                 demand_schedule_init)
+    if optimal_lambdas == -1:
+        optimal_lambdas = [1] * num_items
+
+    search = SkippingLocalSearch(num_items, num_periods, \
+                                 csv_input.initial_inventories, \
+                                 csv_input.inventory_cost, \
+                                 csv_input.changeover_cost, trigger_points, \
+                                 demand_schedule, csv_input.all_production_times, \
+                                 csv_input.cost_tolerance, csv_input.total_time)
+    display_search_results(search.hill_climbing(optimal_lambdas, step_size=3))
+    display_search_results(search.simulated_annealing(optimal_lambdas))
+
+if __name__ == "__main__":
+    main()
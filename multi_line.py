@@ -0,0 +1,340 @@
+# Multi-line decomposition: assigns the items to production lines, plans each
+# line with its own cost model and skipping search, and combines the lines
+# into one plan for the plant.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mip import OptimizationStatus
+from cost_model import build_cost_model
+from find_skipping_coeff import get_average_baseloop_time_batch
+from input_reader import BaseLoopInputData, read_input_chunks
+from instrumentation import optimize_model
+from local_search import SkippingLocalSearch
+
+
+def assign_items_to_lines(production_times, expected_demand, num_lines):
+    '''
+    Balances the items over the lines by their workload, the time needed to
+    produce their expected demand in a period. Items are taken from the
+    largest workload down and each goes to the line with the smallest
+    workload so far.
+
+    PARAMETERS:
+    production_times := time needed to produce one unit for each item
+    expected_demand := the average demand for each item
+    num_lines := the number of production lines
+
+    RETURN:
+    A list of the line of each item
+    '''
+    workload = np.asarray(production_times, dtype=float) * \
+               np.asarray(expected_demand, dtype=float)
+    line_of_item = [0] * len(workload)
+    line_workloads = [(0.0, line) for line in range(num_lines)]
+    for i in np.argsort(-workload, kind='stable'):
+        line_workload, line = heapq.heappop(line_workloads)
+        line_of_item[i] = line
+        heapq.heappush(line_workloads, (line_workload + workload[i], line))
+    return line_of_item
+
+
+def read_line_assignment(input_filename, column):
+    '''
+    Reads the line of each item from a column of the csv file
+
+    PARAMETERS:
+    input_filename := The csv spreadsheet containing the appropriate data
+    column := the index of the column holding the line of each item
+
+    RETURN:
+    A list of the line of each item, numbered from 0 in order of appearance
+    '''
+    line_index = {}
+    line_of_item = []
+    with open(input_filename, 'r', encoding='utf-8') as inputdata_csv:
+        inputdata_csv.readline()
+        for line in inputdata_csv:
+            label = line.split(",")[column].strip()
+            line_of_item.append(line_index.setdefault(label, len(line_index)))
+    return line_of_item
+
+
+def get_line_cost_tolerances(line_of_item, num_lines, holding_cost, expected_demand, cost_tolerance):
+    '''
+    Splits the cost tolerance of the plant over the lines in proportion to the
+    holding cost of a period of expected demand of their items
+
+    PARAMETERS:
+    line_of_item := the line of each item
+    num_lines := the number of production lines
+    holding_cost := inventory cost for each item
+    expected_demand := the average demand for each item
+    cost_tolerance := total cost tolerance of the plant
+
+    RETURN:
+    A list of the cost tolerance of each line
+    '''
+    weight = np.asarray(holding_cost, dtype=float) * \
+             np.asarray(expected_demand, dtype=float)
+    line_weight = np.bincount(line_of_item, weights=weight, minlength=num_lines)
+    if line_weight.sum() <= 0:
+        return [cost_tolerance / num_lines] * num_lines
+    return (cost_tolerance * line_weight / line_weight.sum()).tolist()
+
+
+def solve_line(line_args):
+    '''
+    Plans one line: solves its cost model, then searches for the skipping
+    Lambdas by hill climbing from the cost model output, as local_search does
+
+    PARAMETERS:
+    line_args := a tuple of the items of the line, L, J, I0, h, a,
+                 trigger_points, D, t, Tau, T of the line, and the step size
+                 and maximum number of evaluations of the hill climbing
+
+    RETURN:
+    A dictionary with the items of the line, the cost model Lambdas (None if
+    the cost model has no solution), the skipping Lambdas, the average Base
+    Loop (-1 if infeasible), the holding and changeover cost and the time
+    taken
+    '''
+    items, L, J, I0, h, a, trigger_points, D, t, Tau, T, step_size, \
+        max_evaluations = line_args
+    start = time.perf_counter()
+
+    demand_schedule_init = np.vstack((np.zeros((1, L)), D))
+    model, Lambda = build_cost_model(L, J, t, T, I0, D, Tau, a, h, \
+                                     demand_schedule_init)
+    model.verbose = 0
+    status = optimize_model(model, 'optimize_cost_model')
+    cost_model_lambda = None
+    initial_lambda = [1] * L
+    if status in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE):
+        cost_model_lambda = [Lambda[i].x for i in range(L)]
+        initial_lambda = cost_model_lambda
+
+    search = SkippingLocalSearch(L, J, I0, h, a, trigger_points, D, t, Tau, T)
+    search_result = search.hill_climbing(initial_lambda, step_size=step_size, \
+                                         max_evaluations=max_evaluations, \
+                                         prune=True)
+
+    avg_baseloop, feasible, holding_cost, changeover_cost, S = \
+        get_average_baseloop_time_batch(L, J, I0, h, a, trigger_points, D, \
+                                        [search_result['lambda']], t, Tau, T)
+    return {'items': items, 'cost_model_lambda': cost_model_lambda, \
+            'lambda': search_result['lambda'], \
+            'avg_baseloop': float(avg_baseloop[0]), \
+            'holding_cost': float(holding_cost[0]), \
+            'changeover_cost': float(changeover_cost[0]), \
+            'elapsed': time.perf_counter() - start}
+
+
+def solve_multi_line(csv_input, line_of_item, trigger_points=None, num_workers=None, step_size=3, max_evaluations=None):
+    '''
+    Plans every line in its own process and combines the lines into a plan
+    for the plant. Each line runs its own base loop, so the lines only share
+    the cost tolerance, which is split by get_line_cost_tolerances.
+
+    PARAMETERS:
+    csv_input := a BaseLoopInputData, or an InputDataChunk
+    line_of_item := the line of each item, numbered from 0
+    trigger_points := the trigger point of each item, by default zero
+    num_workers := the number of worker processes, by default the number of
+                   CPUs. With a single worker the lines are solved in this
+                   process
+    step_size, max_evaluations := the hill climbing settings of each line
+
+    RETURN:
+    A dictionary with the list of line results of solve_line, the total
+    holding, changeover and overall cost of the plant, whether every line is
+    feasible and the wall time
+    '''
+    start = time.perf_counter()
+    num_items = csv_input.num_items
+    if trigger_points is None:
+        trigger_points = np.zeros(num_items)
+    trigger_points = np.asarray(trigger_points, dtype=float)
+    line_of_item = np.asarray(line_of_item, dtype=int)
+    num_lines = int(line_of_item.max()) + 1 if num_items > 0 else 0
+    line_cost_tolerances = get_line_cost_tolerances(line_of_item, num_lines, \
+                           csv_input.inventory_cost_array, \
+                           csv_input.expected_demand_array, \
+                           csv_input.cost_tolerance)
+
+    line_args = []
+    for line in range(num_lines):
+        items = np.flatnonzero(line_of_item == line)
+        if len(items) == 0:
+            continue
+        line_args.append((items.tolist(), len(items), csv_input.num_periods, \
+                          csv_input.initial_inventories_array[items], \
+                          csv_input.inventory_cost_array[items], \
+                          csv_input.changeover_cost_array[items], \
+                          trigger_points[items], \
+                          np.asarray(csv_input.demand_schedule_array)[:, items], \
+                          csv_input.production_times_array[items], \
+                          line_cost_tolerances[line], csv_input.total_time, \
+                          step_size, max_evaluations))
+
+    if num_workers == 1:
+        line_results = [solve_line(args) for args in line_args]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            line_results = list(executor.map(solve_line, line_args))
+
+    holding_cost = sum(result['holding_cost'] for result in line_results)
+    changeover_cost = sum(result['changeover_cost'] for result in line_results)
+    return {'lines': line_results, 'holding_cost': holding_cost, \
+            'changeover_cost': changeover_cost, \
+            'total_cost': holding_cost + changeover_cost, \
+            'feasible': all(result['avg_baseloop'] != -1 for result in line_results), \
+            'elapsed': time.perf_counter() - start}
+
+
+def get_input_weight(input_filename):
+    '''
+    Reads the total weight of the items of a csv file, the holding cost of a
+    period of expected demand that get_line_cost_tolerances splits the cost
+    tolerance by, without keeping the items
+
+    PARAMETERS:
+    input_filename := The csv spreadsheet containing the appropriate data
+
+    RETURN:
+    The total weight of the items
+    '''
+    total_weight = 0.0
+    with open(input_filename, 'r', encoding='utf-8') as inputdata_csv:
+        inputdata_csv.readline()
+        for line in inputdata_csv:
+            item_data = line.split(",")
+            total_weight += float(item_data[1]) * float(item_data[4])
+    return total_weight
+
+
+def solve_multi_line_file(input_filename, num_lines, chunk_size=1000, seed=0, trigger_points='zero', num_workers=None, step_size=3, max_evaluations=None):
+    '''
+    Plans a csv file too large to hold at once. The file is read in blocks of
+    chunk_size items by read_input_chunks, the items of each block are
+    assigned to num_lines lines of their own and the block is planned by
+    solve_multi_line. Each block gets the share of the cost tolerance of the
+    plant that get_line_cost_tolerances would give its items, so the weight
+    of the whole file is read first.
+
+    PARAMETERS:
+    input_filename := The csv spreadsheet containing the appropriate data
+    num_lines := the number of production lines of each block
+    chunk_size := the number of items in each block
+    seed := the seed the demand schedules of the blocks are sampled from
+    trigger_points := "zero", or "input" for the trigger points of the csv
+    num_workers, step_size, max_evaluations := same as solve_multi_line
+
+    RETURN:
+    A dictionary like the one of solve_multi_line for all the lines of all
+    blocks, where the items of each line are numbered in the file
+    '''
+    start = time.perf_counter()
+    total_weight = get_input_weight(input_filename)
+
+    line_results = []
+    for chunk in read_input_chunks(input_filename, chunk_size, seed):
+        block_weight = float(np.dot(chunk.inventory_cost_array, \
+                                    chunk.expected_demand_array))
+        if total_weight > 0:
+            chunk.cost_tolerance = chunk.cost_tolerance * block_weight / total_weight
+        line_of_item = assign_items_to_lines(chunk.production_times_array, \
+                                             chunk.expected_demand_array, \
+                                             num_lines)
+        block_trigger_points = chunk.trigger_points_array \
+                               if trigger_points == 'input' else None
+        plan = solve_multi_line(chunk, line_of_item, block_trigger_points, \
+                                num_workers, step_size, max_evaluations)
+        for result in plan['lines']:
+            result['items'] = [chunk.item_offset + i for i in result['items']]
+        line_results += plan['lines']
+
+    holding_cost = sum(result['holding_cost'] for result in line_results)
+    changeover_cost = sum(result['changeover_cost'] for result in line_results)
+    return {'lines': line_results, 'holding_cost': holding_cost, \
+            'changeover_cost': changeover_cost, \
+            'total_cost': holding_cost + changeover_cost, \
+            'feasible': all(result['avg_baseloop'] != -1 for result in line_results), \
+            'elapsed': time.perf_counter() - start}
+
+
+def get_speedup_report(csv_input, line_of_item, trigger_points=None, num_workers=None, step_size=3, max_evaluations=None):
+    '''
+    Times the monolithic plan, with every item on one line, against the
+    decomposition solved in one process and in parallel
+
+    PARAMETERS:
+    same as solve_multi_line
+
+    RETURN:
+    A dictionary with the three results of solve_multi_line, under
+    'monolithic', 'serial' and 'parallel', and the speedups of the parallel
+    decomposition over the monolithic and the serial solve
+    '''
+    monolithic = solve_multi_line(csv_input, [0] * csv_input.num_items, \
+                                  trigger_points, 1, step_size, max_evaluations)
+    serial = solve_multi_line(csv_input, line_of_item, trigger_points, 1, \
+                              step_size, max_evaluations)
+    parallel = solve_multi_line(csv_input, line_of_item, trigger_points, \
+                                num_workers, step_size, max_evaluations)
+    return {'monolithic': monolithic, 'serial': serial, 'parallel': parallel, \
+            'speedup_over_monolithic': monolithic['elapsed'] / parallel['elapsed'], \
+            'speedup_over_serial': serial['elapsed'] / parallel['elapsed']}
+
+
+def display_multi_line_results(plan):
+    '''
+    Displays the plan of each line and the cost of the plant
+
+    PARAMETERS:
+    plan := the dictionary returned by solve_multi_line
+
+    RETURN:
+    None
+    '''
+    print("***************************")
+    print("Multi-line Output:")
+    for line, result in enumerate(plan['lines']):
+        print("Line {}: items {}".format(line, result['items']))
+        print("  Lambdas: {}, average baseloop: {}".format(result['lambda'], \
+              result['avg_baseloop']))
+        print("  Holding cost: {}, changeover cost: {}, time: {:.3f}s".format(\
+              result['holding_cost'], result['changeover_cost'], \
+              result['elapsed']))
+    print("Plant total cost: {}, feasible: {}".format(plan['total_cost'], \
+                                                      plan['feasible']))
+    print("Wall time: {:.3f}s".format(plan['elapsed']))
+    print("***************************")
+
+
+def main():
+
+    num_lines = 3
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    line_of_item = assign_items_to_lines(csv_input.production_times_array, \
+                                         csv_input.expected_demand_array, \
+                                         num_lines)
+
+    report = get_speedup_report(csv_input, line_of_item)
+    display_multi_line_results(report['parallel'])
+    print("Monolithic: {:.3f}s, serial lines: {:.3f}s, parallel lines: {:.3f}s".format(\
+          report['monolithic']['elapsed'], report['serial']['elapsed'], \
+          report['parallel']['elapsed']))
+    print("Speedup over monolithic: {:.2f}, over serial: {:.2f}".format(\
+          report['speedup_over_monolithic'], report['speedup_over_serial']))
+
+    # the same plan from the file read in blocks, as for files too large to
+    # hold at once
+    display_multi_line_results(solve_multi_line_file('Input_Data.csv', num_lines))
+
+if __name__ == "__main__":
+    main()
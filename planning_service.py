@@ -0,0 +1,658 @@
+# Long-running local planning service: keeps parsed inputs, built cost models
+# and evaluation caches in memory between requests, and runs evaluate, solve
+# and search jobs on a bounded pool of threads behind a localhost HTTP server.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from cli import to_json
+from cost_model import build_cost_model, optimize_cost_model, set_cost_tolerance
+from cross_entropy import cross_entropy_search
+from evaluation_cache import EvaluationCache
+from find_skipping_coeff import random_simulation, get_random_lambdas
+from input_reader import BaseLoopInputData, get_file_hash
+
+# kinds of jobs, each is the path of its POST request
+JOB_KINDS = ('evaluate', 'solve', 'search')
+# number of latencies kept for the metrics of each kind of job
+NUM_LATENCIES = 1000
+
+
+class ServiceBusy(Exception):
+    '''
+    Raised when a job arrives while max_pending jobs are already queued or
+    running
+    '''
+    pass
+
+
+class WarmInput:
+
+    def __init__(self, input_filename, seed, cache_size):
+        '''
+        This class keeps one input in memory with its cost model, built on the
+        first solve, and a cache of its evaluations. The model is changed
+        in place for each cost tolerance, and each solve starts from the
+        previous solution. Solves wait for the model on their own thread, so
+        that they do not hold the threads of the evaluations.
+
+        Instance variables:
+        self.csv_input := the BaseLoopInputData of the input
+        self.model := the mip Model of build_cost_model, None until the first
+                      solve
+        self.Lambda := the list of its Lambda variables
+        self.cost_tolerance := the cost tolerance of the cost constraint of
+                               self.model
+        self.solver_defaults := the solver options of a new model, restored
+                                before each solve
+        self.last_lambda := the Lambdas of the last MIP solution
+        self.cache := an EvaluationCache of the evaluations of this input,
+                      shared by the evaluations and searches of all threads
+        self.model_lock := the lock of the model, which is not safe to share
+                           between threads
+        self.solve_executor := the single thread the solves of this input are
+                               queued on
+        self.num_jobs := the number of jobs holding this input, changed by
+                         the PlanningService under its inputs_lock
+        self.evicted := whether the PlanningService has dropped this input, its
+                        solve thread stops once no job holds it
+        '''
+        self.csv_input = BaseLoopInputData(input_filename, seed)
+        self.model = None
+        self.Lambda = None
+        self.cost_tolerance = None
+        self.solver_defaults = None
+        self.last_lambda = None
+        self.cache = EvaluationCache(cache_size, threading.Lock())
+        self.model_lock = threading.Lock()
+        self.solve_executor = ThreadPoolExecutor(max_workers=1)
+        self.num_jobs = 0
+        self.evicted = False
+
+    def get_model_args(self, cost_tolerance=None, trigger_points='zero'):
+        '''
+        Collects the data of the skipping model in the order of
+        get_average_baseloop_time
+
+        PARAMETERS:
+        cost_tolerance := cost tolerance instead of the one of the input
+        trigger_points := 'zero', 'input' or a list
+
+        RETURN:
+        A tuple (L, J, I0, h, a, trigger_points, D, t, Tau, T)
+        '''
+        csv_input = self.csv_input
+        if isinstance(trigger_points, str):
+            if trigger_points not in ('zero', 'input'):
+                raise ValueError("unknown trigger points {}".format(trigger_points))
+            trigger_points = np.zeros(csv_input.num_items) if trigger_points == \
+                             'zero' else csv_input.trigger_points_array
+        trigger_points = np.asarray(trigger_points, dtype=float)
+        if trigger_points.shape != (csv_input.num_items,):
+            raise ValueError("expected {} trigger points".format(csv_input.num_items))
+        if cost_tolerance is None:
+            cost_tolerance = csv_input.cost_tolerance
+        return (csv_input.num_items, csv_input.num_periods, \
+                csv_input.initial_inventories_array, \
+                csv_input.inventory_cost_array, csv_input.changeover_cost_array, \
+                trigger_points, csv_input.demand_schedule_array, \
+                csv_input.production_times_array, cost_tolerance, \
+                csv_input.total_time)
+
+    def evaluate(self, Lambdas, cost_tolerance=None, trigger_points='zero'):
+        '''
+        Computes the average Base Loop of a batch of Lambdas through the cache.
+        The cache is only locked to look up and store evaluations, so batches
+        of several threads are simulated at the same time.
+
+        RETURN:
+        An (N,) array of average Base Loop times, -1 for infeasible Lambdas
+        '''
+        L, J, I0, h, a, trigger_points, D, t, Tau, T = \
+            self.get_model_args(cost_tolerance, trigger_points)
+        Lambdas = np.asarray(Lambdas, dtype=float).reshape(-1, L)
+        return self.cache.evaluate_batch(L, J, I0, h, a, trigger_points, D, \
+                                         Lambdas, t, Tau, T)
+
+    def solve(self, cost_tolerance=None, relax=False, max_seconds=None, \
+              max_mip_gap=None, threads=None, emphasis=None):
+        '''
+        Solves the cost model of the input with optimize_cost_model, building
+        it on the first call and changing its cost tolerance on later calls
+
+        RETURN:
+        The result dictionary of solve_cost_model
+        '''
+        csv_input = self.csv_input
+        num_items = csv_input.num_items
+        demand_schedule = csv_input.demand_schedule_array
+        demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+        if cost_tolerance is None:
+            cost_tolerance = csv_input.cost_tolerance
+        data = (num_items, csv_input.num_periods, csv_input.production_times_array, \
+                csv_input.total_time, csv_input.initial_inventories_array)
+
+        with self.model_lock:
+            if self.model is None:
+                self.model, self.Lambda = build_cost_model(*data, demand_schedule, \
+                                          cost_tolerance, \
+                                          csv_input.changeover_cost_array, \
+                                          csv_input.inventory_cost_array, \
+                                          demand_schedule_init)
+                self.model.verbose = 0
+                self.cost_tolerance = cost_tolerance
+                self.solver_defaults = {'max_seconds': self.model.max_seconds, \
+                                        'max_mip_gap': self.model.max_mip_gap, \
+                                        'threads': self.model.threads, \
+                                        'emphasis': self.model.emphasis.name}
+            elif cost_tolerance != self.cost_tolerance:
+                set_cost_tolerance(self.model, self.Lambda, csv_input.num_periods, \
+                                   csv_input.production_times_array, \
+                                   csv_input.total_time, \
+                                   csv_input.initial_inventories_array, \
+                                   cost_tolerance, csv_input.changeover_cost_array, \
+                                   csv_input.inventory_cost_array, \
+                                   demand_schedule_init)
+                self.cost_tolerance = cost_tolerance
+
+            options = dict(self.solver_defaults)
+            for name, value in (('max_seconds', max_seconds), \
+                                ('max_mip_gap', max_mip_gap), ('threads', threads), \
+                                ('emphasis', emphasis)):
+                if value is not None:
+                    options[name] = value
+            # CBC keeps the time limit of the last optimize, so it is always set
+            self.model.max_seconds = options.pop('max_seconds')
+            if not relax and self.last_lambda is not None:
+                # the solver ignores a start that is infeasible for this tolerance
+                self.model.start = [(self.Lambda[i], self.last_lambda[i]) \
+                                    for i in range(num_items)]
+            result = optimize_cost_model(self.model, self.Lambda, *data, \
+                                         demand_schedule, cost_tolerance, \
+                                         csv_input.changeover_cost_array, \
+                                         csv_input.inventory_cost_array, \
+                                         demand_schedule_init, relax, \
+                                         self.model.max_seconds, **options)
+            if not relax and result['lambda'] is not None:
+                self.last_lambda = result['lambda']
+        return result
+
+
+class PlanningService:
+
+    def __init__(self, num_workers=4, max_pending=64, cache_size=100000, max_inputs=8):
+        '''
+        This class runs the jobs of the planning service. Up to max_inputs
+        inputs are kept warm, keyed by the content hash of the csv and the
+        seed; the least recently used one is dropped to make room for a new
+        one. A job holds its input from the time it is queued until it
+        finishes, so the jobs of a dropped input still finish, and its solve
+        thread stops with the last of them. Jobs run on a pool of
+        num_workers threads, except solves, which are queued on the solve
+        thread of their input, as each input has one model. A job that arrives
+        while max_pending jobs are queued or running is rejected with
+        ServiceBusy, so the queue stays bounded.
+
+        Instance variables:
+        self.executor := the ThreadPoolExecutor the evaluate and search jobs
+                         run on
+        self.pending := a semaphore counting the free places of the queue
+        self.inputs := an OrderedDict of WarmInput, keyed by (content hash,
+                       seed), the least recently used one first
+        self.latencies := for each kind of job, a deque of the last
+                          NUM_LATENCIES (queue seconds, run seconds) of its
+                          finished jobs
+        self.num_jobs, self.num_errors := the number of finished and failed
+                                          jobs of each kind
+        self.num_rejected := the number of jobs rejected with ServiceBusy
+        '''
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.max_inputs = max_inputs
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.inputs = OrderedDict()
+        self.inputs_lock = threading.Lock()
+        self.metrics_lock = threading.Lock()
+        self.latencies = {kind: deque(maxlen=NUM_LATENCIES) for kind in JOB_KINDS}
+        self.num_jobs = {kind: 0 for kind in JOB_KINDS}
+        self.num_errors = {kind: 0 for kind in JOB_KINDS}
+        self.num_rejected = 0
+        self.start_time = time.perf_counter()
+
+    def acquire_input(self, input_filename, seed=0):
+        '''
+        Returns the WarmInput of an input for a job, reading it on first use
+        and dropping the least recently used input if max_inputs are kept. The
+        csv is read without holding inputs_lock, so a cold input does not hold
+        up the jobs of the other inputs. The job holds the input until it is
+        given to release_input.
+
+        PARAMETERS:
+        input_filename := the path of the input csv
+        seed := the seed of the demand schedule
+
+        RETURN:
+        A WarmInput
+        '''
+        key = (get_file_hash(input_filename), seed)
+        with self.inputs_lock:
+            warm_input = self.inputs.get(key)
+            if warm_input is not None:
+                self.inputs.move_to_end(key)
+                warm_input.num_jobs += 1
+                return warm_input
+
+        new_input = WarmInput(input_filename, seed, self.cache_size)
+        evicted = []
+        with self.inputs_lock:
+            # another job may have read the same input in the meantime
+            warm_input = self.inputs.get(key)
+            if warm_input is None:
+                warm_input = new_input
+                self.inputs[key] = warm_input
+                while len(self.inputs) > self.max_inputs:
+                    dropped = self.inputs.popitem(last=False)[1]
+                    dropped.evicted = True
+                    if dropped.num_jobs == 0:
+                        evicted.append(dropped)
+            else:
+                self.inputs.move_to_end(key)
+            warm_input.num_jobs += 1
+        if warm_input is not new_input:
+            new_input.solve_executor.shutdown(wait=False)
+        for dropped in evicted:
+            dropped.solve_executor.shutdown(wait=False)
+        return warm_input
+
+    def release_input(self, warm_input):
+        '''
+        Ends the hold of a job on its WarmInput, and stops the solve thread of
+        a dropped input once no job holds it
+        '''
+        with self.inputs_lock:
+            warm_input.num_jobs -= 1
+            stop = warm_input.evicted and warm_input.num_jobs == 0
+        if stop:
+            warm_input.solve_executor.shutdown(wait=False)
+
+    def submit(self, kind, job):
+        '''
+        Runs a job on the pool, or a solve on the solve thread of its input,
+        and waits for its result. The input of the job is read before it is
+        queued.
+
+        PARAMETERS:
+        kind := one of JOB_KINDS
+        job := the dictionary of the job, see run_evaluate, run_solve and
+               run_search
+
+        RETURN:
+        The result dictionary of the job, with its queue and run seconds
+        '''
+        if kind not in JOB_KINDS:
+            raise ValueError("unknown job {}".format(kind))
+        if not self.pending.acquire(blocking=False):
+            with self.metrics_lock:
+                self.num_rejected += 1
+            raise ServiceBusy("{} jobs are pending".format(self.max_pending))
+        try:
+            warm_input = self.acquire_input(job['input'], job.get('seed', 0))
+        except BaseException:
+            self.pending.release()
+            raise
+        try:
+            executor = warm_input.solve_executor if kind == 'solve' else \
+                       self.executor
+            try:
+                future = executor.submit(self.run_job, kind, warm_input, job, \
+                                         time.perf_counter())
+            except BaseException:
+                self.pending.release()
+                raise
+            return future.result()
+        finally:
+            self.release_input(warm_input)
+
+    def run_job(self, kind, warm_input, job, submit_time):
+        '''
+        Runs a job on a worker thread and records its latency
+        '''
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = getattr(self, 'run_' + kind)(warm_input, job)
+            failed = False
+        finally:
+            end = time.perf_counter()
+            self.pending.release()
+            with self.metrics_lock:
+                self.num_jobs[kind] += 1
+                self.num_errors[kind] += failed
+                self.latencies[kind].append((start - submit_time, end - start))
+        result['queue_seconds'] = start - submit_time
+        result['run_seconds'] = end - start
+        return result
+
+    def run_evaluate(self, warm_input, job):
+        '''
+        Evaluates Lambdas. The job holds input, seed, lambdas (a list of
+        lists), and optionally cost_tolerance and trigger_points
+        '''
+        avg_baseloop = warm_input.evaluate(job['lambdas'], \
+                                           job.get('cost_tolerance'), \
+                                           job.get('trigger_points', 'zero'))
+        return {'avg_baseloop': avg_baseloop, 'feasible': avg_baseloop != -1}
+
+    def run_solve(self, warm_input, job):
+        '''
+        Solves the cost model. The job holds input, seed, and optionally
+        cost_tolerance and the options of solve_cost_model
+        '''
+        return warm_input.solve(job.get('cost_tolerance'), job.get('relax', False), \
+                                job.get('max_seconds'), job.get('max_mip_gap'), \
+                                job.get('threads'), job.get('emphasis'))
+
+    def run_search(self, warm_input, job):
+        '''
+        Searches for the best Lambdas around a start Lambda, by default the
+        solution of the cost model. The job holds input, seed, and optionally
+        lambda, method ('random' or 'cross-entropy'), num_simulation,
+        neighbourhood, num_best, search_seed, prune, cost_tolerance,
+        trigger_points and relax. The random search evaluates through the
+        cache of the input.
+        '''
+        model_args = warm_input.get_model_args(job.get('cost_tolerance'), \
+                                               job.get('trigger_points', 'zero'))
+        result = {'start_lambda': job.get('lambda'), 'cost_model': None}
+        if result['start_lambda'] is None:
+            result['cost_model'] = warm_input.solve_executor.submit(\
+                                   warm_input.solve, job.get('cost_tolerance'), \
+                                   job.get('relax', False)).result()
+            result['start_lambda'] = result['cost_model']['lambda']
+            if result['start_lambda'] is None:
+                return result
+
+        num_simulation = job.get('num_simulation', 100000)
+        neighbourhood = job.get('neighbourhood', 10)
+        num_best = job.get('num_best', 10)
+        method = job.get('method', 'random')
+        if method == 'random':
+            feasible_results = random_simulation(*model_args, num_simulation, \
+                               result['start_lambda'], neighbourhood, \
+                               rng=random.Random(job.get('search_seed', 0)), \
+                               num_best=num_best, cache=warm_input.cache, \
+                               prune=job.get('prune', False))
+        elif method == 'cross-entropy':
+            feasible_results = cross_entropy_search(*model_args, \
+                               result['start_lambda'], neighbourhood, \
+                               max_samples=num_simulation, num_best=num_best, \
+                               seed=job.get('search_seed', 0))['results']
+        else:
+            raise ValueError("unknown search method {}".format(method))
+        result['best'] = [{'avg_baseloop': avg_baseloop, 'lambda': Lambda} for \
+                          avg_baseloop, Lambda in feasible_results.best()]
+        return result
+
+    def get_metrics(self):
+        '''
+        Returns the latency metrics of each kind of job: the number of jobs,
+        errors and the mean, median, 95th percentile and largest total
+        latency and mean queue wait in seconds, over the last NUM_LATENCIES
+        jobs. Also returns the number of rejected jobs, the warm inputs and
+        the hit rates of their caches.
+        '''
+        with self.metrics_lock:
+            metrics = {'uptime_seconds': time.perf_counter() - self.start_time, \
+                       'num_workers': self.num_workers, \
+                       'max_pending': self.max_pending, \
+                       'max_inputs': self.max_inputs, \
+                       'num_rejected': self.num_rejected, 'jobs': {}}
+            for kind in JOB_KINDS:
+                job_metrics = {'count': self.num_jobs[kind], \
+                               'errors': self.num_errors[kind]}
+                if self.latencies[kind]:
+                    queue_seconds, run_seconds = np.array(self.latencies[kind]).T
+                    total_seconds = queue_seconds + run_seconds
+                    job_metrics.update({'mean_seconds': total_seconds.mean(), \
+                        'p50_seconds': np.percentile(total_seconds, 50), \
+                        'p95_seconds': np.percentile(total_seconds, 95), \
+                        'max_seconds': total_seconds.max(), \
+                        'mean_queue_seconds': queue_seconds.mean()})
+                metrics['jobs'][kind] = job_metrics
+        with self.inputs_lock:
+            metrics['inputs'] = [{'hash': key[0], 'seed': key[1], \
+                                  'model_built': warm_input.model is not None, \
+                                  'cached_evaluations': len(warm_input.cache), \
+                                  'cache_hit_rate': warm_input.cache.hit_rate()} \
+                                 for key, warm_input in self.inputs.items()]
+        return metrics
+
+    def shutdown(self):
+        '''
+        Waits for the running jobs and stops the pool and the solve threads
+        '''
+        self.executor.shutdown(wait=True)
+        with self.inputs_lock:
+            warm_inputs = list(self.inputs.values())
+        for warm_input in warm_inputs:
+            warm_input.solve_executor.shutdown(wait=True)
+
+
+class PlanningRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handles the HTTP requests of the service: POST /evaluate, /solve and
+    /search with a json job, GET /metrics and /health. The PlanningService is
+    the service attribute of the server.
+    '''
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.service.get_metrics())
+        elif self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+
+    def do_POST(self):
+        kind = self.path.strip('/')
+        if kind not in JOB_KINDS:
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length))
+            result = self.server.service.submit(kind, job)
+        except ServiceBusy as error:
+            self.send_json(503, {'error': str(error)})
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            self.send_json(400, {'error': repr(error)})
+        except Exception as error:
+            self.send_json(500, {'error': repr(error)})
+        else:
+            self.send_json(200, result)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, default=to_json).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def start_server(service, port=0, verbose=False):
+    '''
+    Starts the HTTP server of a service on localhost, in a background thread
+
+    PARAMETERS:
+    service := a PlanningService
+    port := the port, 0 for any free port
+    verbose := whether each request is logged
+
+    RETURN:
+    The ThreadingHTTPServer, its server_address holds the port
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), PlanningRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def post_job(url, kind, job, timeout=600):
+    '''
+    Sends a job to a service, as the client of the service
+
+    PARAMETERS:
+    url := the url of the service, e.g. http://127.0.0.1:8765
+    kind := one of JOB_KINDS
+    job := the dictionary of the job
+    timeout := seconds to wait for the result
+
+    RETURN:
+    A tuple of the HTTP status, the result dictionary and the latency in
+    seconds seen by the client
+    '''
+    request = urllib.request.Request(url + '/' + kind, \
+                                     data=json.dumps(job).encode('utf-8'), \
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as error:
+        status, body = error.code, error.read()
+    return status, json.loads(body), time.perf_counter() - start
+
+
+def get_service_metrics(url, timeout=60):
+    '''
+    Reads the metrics of a service
+
+    RETURN:
+    The dictionary of PlanningService.get_metrics
+    '''
+    with urllib.request.urlopen(url + '/metrics', timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_test_client(url, input_filename, num_requests=200, concurrency=8, seed=0):
+    '''
+    Exercises a service with a mix of jobs sent concurrently: mostly
+    evaluations of Lambdas around the cost model solution, solves for a few
+    cost tolerances, and short searches.
+
+    PARAMETERS:
+    url := the url of the service
+    input_filename := the input csv, as seen by the service
+    num_requests := the number of evaluate jobs
+    concurrency := the number of jobs sent at the same time
+    seed := seed of the sampled Lambdas
+
+    RETURN:
+    A dictionary of the latencies seen by the client for each kind of job, the
+    number of failed jobs, and the metrics of the service
+    '''
+    status, solution, latency = post_job(url, 'solve', {'input': input_filename})
+    if status != 200 or solution['lambda'] is None:
+        raise RuntimeError("the cost model was not solved: {}".format(solution))
+    rng = random.Random(seed)
+    jobs = [('evaluate', {'input': input_filename, \
+                          'lambdas': [get_random_lambdas(solution['lambda'], 10, rng) \
+                                      for k in range(100)]}) \
+            for n in range(num_requests)]
+    base_tolerance = BaseLoopInputData(input_filename).cost_tolerance
+    jobs += [('solve', {'input': input_filename, 'max_seconds': 30, \
+                        'cost_tolerance': base_tolerance * scale}) \
+             for scale in (1.0, 1.1, 1.2, 1.0)]
+    jobs += [('solve', {'input': input_filename, 'relax': True})]
+    jobs += [('search', {'input': input_filename, 'lambda': solution['lambda'], \
+                         'num_simulation': 10000, 'prune': True, 'search_seed': k}) \
+             for k in range(4)]
+    rng.shuffle(jobs)
+
+    latencies = {kind: [] for kind in JOB_KINDS}
+    latencies['solve'].append(latency)
+    num_failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for kind, (status, result, latency) in zip([kind for kind, job in jobs], \
+            executor.map(lambda kind_job: post_job(url, *kind_job), jobs)):
+            if status != 200:
+                num_failed += 1
+            latencies[kind].append(latency)
+
+    client_metrics = {kind: {'count': len(values), \
+                             'p50_seconds': float(np.percentile(values, 50)), \
+                             'max_seconds': max(values)} \
+                      for kind, values in latencies.items() if values}
+    return {'client': client_metrics, 'num_failed': num_failed, \
+            'service': get_service_metrics(url)}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Local planning service that "
+                                     "keeps inputs and models warm")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="run the service")
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--workers', type=int, default=4)
+    serve_parser.add_argument('--max-pending', type=int, default=64)
+    serve_parser.add_argument('--max-inputs', type=int, default=8, \
+                              help="number of inputs kept warm")
+    serve_parser.add_argument('--verbose', action='store_true')
+    test_parser = subparsers.add_parser('test', help="exercise a service with "
+                                        "the test client")
+    test_parser.add_argument('--url', default=None, help="url of a running "
+                             "service, by default one is started in this process")
+    test_parser.add_argument('--input', default='Input_Data.csv')
+    test_parser.add_argument('--requests', type=int, default=200)
+    test_parser.add_argument('--concurrency', type=int, default=8)
+    test_parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = PlanningService(args.workers, args.max_pending, \
+                                  max_inputs=args.max_inputs)
+        server = start_server(service, args.port, args.verbose)
+        print("planning service on http://127.0.0.1:{}".format(server.server_address[1]))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+            service.shutdown()
+        return
+
+    service = server = None
+    url = args.url
+    if url is None:
+        service = PlanningService(args.workers)
+        server = start_server(service)
+        url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    try:
+        report = run_test_client(url, args.input, args.requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+            service.shutdown()
+    print(json.dumps(report, indent=1))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Monte Carlo robustness of the skipping model: scores choices of Lambda
+# against many sampled demand scenarios at once.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import warnings
+import numpy as np
+from cost_model import cost_model
+from find_skipping_coeff import get_average_baseloop_time_batch
+from input_reader import BaseLoopInputData
+
+
+def evaluate_robustness(L, J, I0, h, a, trigger_points, scenarios, Lambdas, t, Tau, T, percentiles=(5, 50, 95)):
+    '''
+    This function evaluates each choice of Lambda against every demand
+    scenario in one call of get_average_baseloop_time_batch, and summarizes
+    how often the base loop stays feasible and what it costs.
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    I0: a list of item initial inventories
+    h: inventory cost
+    a: changeover cost
+    trigger_points: a list of item trigger points
+    scenarios: a (K, J, L) array of sampled demand schedules
+    Lambdas: a list of L items, or an (M, L) array of choices of Lambda
+    t: a list of time takes to produce one unit of item
+    Tau: cost tolerance
+    T: the total time available to run the loop in each time period
+    percentiles: the percentiles reported for base loop and cost
+
+    RETURN:
+    A dictionary of arrays, indexed by Lambda in their first axis:
+    feasibility_rate: (M,) fraction of scenarios that are feasible
+    avg_baseloop: (M, K) average Base Loop in each scenario, -1 if infeasible
+    avg_baseloop_mean: (M,) mean average Base Loop over feasible scenarios
+    avg_baseloop_percentiles: (M, P) percentiles of average Base Loop over
+                              feasible scenarios
+    holding_cost_percentiles, changeover_cost_percentiles,
+    total_cost_percentiles: (M, P) percentiles of cost over feasible scenarios
+    percentiles: the percentiles that were computed
+    Statistics over feasible scenarios are nan for a Lambda that is never
+    feasible.
+    '''
+    scenarios = np.asarray(scenarios, dtype=float).reshape(-1, J, L)
+    num_scenarios = scenarios.shape[0]
+    Lambdas = np.asarray(Lambdas, dtype=float).reshape(-1, L)
+    num_lambdas = Lambdas.shape[0]
+
+    # every Lambda is paired with every scenario, scenario index varies fastest
+    avg_baseloop, feasible, holding_cost, changeover_cost, S = \
+        get_average_baseloop_time_batch(L, J, I0, h, a, trigger_points, \
+                                        scenarios, np.repeat(Lambdas, \
+                                        num_scenarios, axis=0), t, Tau, T)
+
+    shape = (num_lambdas, num_scenarios)
+    avg_baseloop = avg_baseloop.reshape(shape)
+    feasible = feasible.reshape(shape)
+    holding_cost = holding_cost.reshape(shape)
+    changeover_cost = changeover_cost.reshape(shape)
+
+    feasible_baseloop = np.where(feasible, avg_baseloop, np.nan)
+    feasible_holding_cost = np.where(feasible, holding_cost, np.nan)
+    feasible_changeover_cost = np.where(feasible, changeover_cost, np.nan)
+
+    # Lambdas that are never feasible only have nan statistics
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        results = {
+            'feasibility_rate': feasible.mean(axis=1),
+            'avg_baseloop': avg_baseloop,
+            'avg_baseloop_mean': np.nanmean(feasible_baseloop, axis=1),
+            'avg_baseloop_percentiles': get_percentiles(feasible_baseloop, percentiles),
+            'holding_cost_percentiles': get_percentiles(feasible_holding_cost, percentiles),
+            'changeover_cost_percentiles': get_percentiles(feasible_changeover_cost, percentiles),
+            'total_cost_percentiles': get_percentiles(feasible_holding_cost + \
+                                      feasible_changeover_cost, percentiles),
+            'percentiles': list(percentiles)}
+
+    return results
+
+
+def get_percentiles(values, percentiles):
+    '''
+    Computes percentiles of each row of values, ignoring nan entries
+
+    PARAMETERS:
+    values := an (M, K) array
+    percentiles := a list of P percentiles between 0 and 100
+
+    RETURN:
+    An (M, P) array of percentiles
+    '''
+    return np.nanpercentile(values, percentiles, axis=1).T.reshape(-1, len(percentiles))
+
+
+def display_robustness_results(results, Lambdas):
+    '''
+    Displays the robustness of each choice of Lambda
+
+    PARAMETERS:
+    results := the dictionary returned by evaluate_robustness
+    Lambdas := the choices of Lambda that were evaluated
+
+    RETURN:
+    None
+    '''
+    Lambdas = np.asarray(Lambdas).reshape(len(results['feasibility_rate']), -1)
+    percentile_labels = ", ".join("p{}".format(p) for p in results['percentiles'])
+    print("***************************")
+    print("Robustness Output:")
+    for m in range(len(Lambdas)):
+        print("Lambdas: {}".format(Lambdas[m].tolist()))
+        print("Feasibility rate: {:.4f}".format(results['feasibility_rate'][m]))
+        print("Average baseloop mean: {}".format(results['avg_baseloop_mean'][m]))
+        print("Average baseloop ({}): {}".format(percentile_labels, \
+              results['avg_baseloop_percentiles'][m].tolist()))
+        print("Total cost ({}): {}".format(percentile_labels, \
+              results['total_cost_percentiles'][m].tolist()))
+        print("***************************")
+
+
+def main():
+
+    num_scenarios = 10000
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    num_items = csv_input.num_items
+    num_periods = csv_input.num_periods
+    trigger_points = np.zeros(num_items)
+    scenarios = csv_input.get_demand_scenarios(num_scenarios, seed=1)
+
+    demand_schedule = csv_input.demand_schedule_array
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    optimal_lambdas = cost_model(num_items, num_periods, \
+                                 csv_input.production_times_array, \
+                                 csv_input.total_time, \
+                                 csv_input.initial_inventories_array, \
+                                 demand_schedule, csv_input.cost_tolerance, \
+                                 csv_input.changeover_cost_array, \
+                                 csv_input.inventory_cost_array, \
+                                 demand_schedule_init)
+    if optimal_lambdas == -1:
+        optimal_lambdas = [1] * num_items
+
+    Lambdas = [optimal_lambdas]
+    results = evaluate_robustness(num_items, num_periods, \
+                                  csv_input.initial_inventories_array, \
+                                  csv_input.inventory_cost_array, \
+                                  csv_input.changeover_cost_array, \
+                                  trigger_points, scenarios, Lambdas, \
+                                  csv_input.production_times_array, \
+                                  csv_input.cost_tolerance, csv_input.total_time)
+    display_robustness_results(results, Lambdas)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Rolling horizon planning: keeps the cost model and the skipping simulation
+# of a plan, and updates both when the demand of a new period arrives.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import math
+import numpy as np
+from mip import LinExpr, GREATER_OR_EQUAL, OptimizationStatus
+from cost_model import build_cost_model, set_cost_tolerance, \
+                       get_period_demand_constraint_coeffs
+from find_skipping_coeff import get_baseloop_skipping
+from input_reader import BaseLoopInputData
+from instrumentation import optimize_model
+
+
+class RollingHorizonPlanner:
+
+    def __init__(self, num_items, unit_production_time, total_time, \
+                 initial_inventory, demand_schedule, cost_tolerance, \
+                 changeover_cost, holding_cost, trigger_points, \
+                 horizon_length=None, verbose=False):
+        '''
+        This class plans the base loop over a horizon that moves by one period
+        each time actual demand arrives. While the horizon grows, the cost
+        model is built once; a new period only adds its demand constraints and
+        replaces the cost constraint, and the model is re-solved starting from
+        the previous Lambdas. Once the horizon has horizon_length periods, a
+        new period drops the oldest one. The horizon then starts from the
+        inventory the simulation had at its first period, and as every demand
+        constraint depends on the start of the horizon, the cost model is
+        rebuilt for it. The skipping simulation keeps the inventory at the end
+        of the simulated periods, so a new period is simulated from that
+        inventory with the Lambdas in force, without replaying the past.
+
+        PARAMETERS:
+        num_items := total number of items
+        unit_production_time := time needed to produce one unit for each item
+        total_time := total time in one period
+        initial_inventory := initial inventory for each item
+        demand_schedule := a matrix of size (J, L) containing demand for each
+                           item in the periods known so far
+        cost_tolerance := total cost tolerance for the year
+        changeover_cost := changeover cost for each item
+        holding_cost := inventory cost for each item
+        trigger_points := trigger point for each item
+        horizon_length := the largest number of periods in the horizon, None
+                          to keep every period
+        verbose := whether the solver prints its progress
+
+        Instance variables:
+        self.num_periods := the number of periods in the horizon
+        self.demand_schedule := the (J, L) demand of the periods in the horizon
+        self.horizon_inventory := the inventory at the start of the horizon
+        self.start_inventories := the inventory at the start of each period in
+                                  the horizon
+        self.Lambda := the Lambdas of the last solved plan, None before the
+                       cost model has a solution
+        self.status := the solver status of the last solve
+        self.cur_inventory := the inventory at the end of the simulated periods
+        self.S := the skipping coefficients of the simulated periods
+        self.demand_met := whether every simulated period met demand
+        '''
+        self.num_items = num_items
+        self.unit_production_time = np.asarray(unit_production_time, dtype=float)
+        self.total_time = total_time
+        self.initial_inventory = np.asarray(initial_inventory, dtype=float)
+        self.demand_schedule = np.asarray(demand_schedule, dtype=float).reshape(\
+                               -1, num_items)
+        self.num_periods = self.demand_schedule.shape[0]
+        self.cumulative_demand = self.demand_schedule.sum(axis=0)
+        self.cost_tolerance = cost_tolerance
+        self.changeover_cost = np.asarray(changeover_cost, dtype=float)
+        self.holding_cost = np.asarray(holding_cost, dtype=float)
+        self.trigger_points = [float(value) for value in trigger_points]
+        self.horizon_length = horizon_length
+        self.verbose = verbose
+
+        self.horizon_inventory = self.initial_inventory
+        self.build_model()
+        self.Lambda = None
+        self.status = None
+        self.solve()
+
+        # simulation state
+        self.cur_inventory = self.initial_inventory.tolist()
+        self.total_baseloop = 0
+        self.total_holding_cost = 0
+        self.total_changeover_cost = 0
+        self.S = []
+        self.demand_met = True
+        self.start_inventories = []
+        for j in range(self.num_periods):
+            self.start_inventories.append(list(self.cur_inventory))
+            if self.Lambda is not None:
+                self.simulate_period(self.demand_schedule[j])
+
+        if horizon_length is not None and self.num_periods > horizon_length:
+            self.drop_oldest_periods(self.num_periods - horizon_length)
+            self.solve()
+
+    def build_model(self):
+        '''
+        Builds the cost model of the periods in the horizon
+        '''
+        self.model, self.Lambda_vars = build_cost_model(self.num_items, \
+                                       self.num_periods, \
+                                       self.unit_production_time, \
+                                       self.total_time, self.horizon_inventory, \
+                                       self.demand_schedule, self.cost_tolerance, \
+                                       self.changeover_cost, self.holding_cost, \
+                                       self.get_demand_schedule_init())
+        self.model.verbose = 1 if self.verbose else 0
+
+    def drop_oldest_periods(self, num_dropped):
+        '''
+        Drops the oldest periods from the horizon and rebuilds the cost model,
+        which then starts from the inventory at the new first period
+
+        PARAMETERS:
+        num_dropped := the number of periods dropped
+        '''
+        self.demand_schedule = self.demand_schedule[num_dropped:]
+        self.start_inventories = self.start_inventories[num_dropped:]
+        self.num_periods = self.demand_schedule.shape[0]
+        self.cumulative_demand = self.demand_schedule.sum(axis=0)
+        self.horizon_inventory = np.asarray(self.start_inventories[0], dtype=float)
+        self.build_model()
+
+    def get_demand_schedule_init(self):
+        '''
+        Returns the demand schedule including the initial time period
+        '''
+        return np.vstack((np.zeros((1, self.num_items)), self.demand_schedule))
+
+    def solve(self):
+        '''
+        Solves the cost model, starting from the previous Lambdas if there are
+        any. The previous Lambdas are kept if the model has no solution.
+
+        RETURN:
+        The Lambdas of the plan, None if the cost model never had a solution
+        '''
+        if self.Lambda is not None:
+            self.model.start = [(self.Lambda_vars[i], self.Lambda[i]) for i in \
+                                range(self.num_items)]
+        self.status = optimize_model(self.model, 'optimize_cost_model')
+        if self.status in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE):
+            self.Lambda = [self.Lambda_vars[i].x for i in range(self.num_items)]
+        return self.Lambda
+
+    def append_period(self, demand):
+        '''
+        Adds the actual demand of the next period. The period is simulated
+        with the Lambdas in force, then the horizon is extended by it, the
+        oldest period is dropped if the horizon is full, and the cost model is
+        re-solved.
+
+        PARAMETERS:
+        demand := the demand of each item in the new period
+
+        RETURN:
+        The Lambdas of the new plan
+        '''
+        demand = np.asarray(demand, dtype=float).reshape(self.num_items)
+        self.start_inventories.append(list(self.cur_inventory))
+        if self.Lambda is not None:
+            self.simulate_period(demand)
+
+        self.demand_schedule = np.vstack((self.demand_schedule, demand))
+        self.num_periods += 1
+        self.cumulative_demand = self.cumulative_demand + demand
+        if self.horizon_length is not None and \
+           self.num_periods > self.horizon_length:
+            self.drop_oldest_periods(self.num_periods - self.horizon_length)
+            return self.solve()
+
+        # only the demand constraints of the new period are added
+        demand_coeff = get_period_demand_constraint_coeffs(self.num_items, \
+                       self.num_periods, self.unit_production_time, \
+                       self.total_time, self.horizon_inventory, \
+                       self.cumulative_demand)
+        for row in demand_coeff.tolist():
+            self.model.add_constr(LinExpr(self.Lambda_vars, row, \
+                                          sense=GREATER_OR_EQUAL))
+        # the cost constraint depends on the whole horizon
+        set_cost_tolerance(self.model, self.Lambda_vars, self.num_periods, \
+                           self.unit_production_time, self.total_time, \
+                           self.horizon_inventory, self.cost_tolerance, \
+                           self.changeover_cost, self.holding_cost, \
+                           self.get_demand_schedule_init())
+
+        return self.solve()
+
+    def simulate_period(self, demand):
+        '''
+        Runs the skipping simulation of get_average_baseloop_time for one
+        period from the stored inventory, with the Lambdas of the current plan.
+        A period that does not meet demand leaves a negative inventory and
+        clears demand_met.
+
+        PARAMETERS:
+        demand := the demand of each item in the period
+
+        RETURN:
+        The Base Loop time of the period
+        '''
+        L = self.num_items
+        Lambda = self.Lambda
+        t = self.unit_production_time.tolist()
+        # determine which items to skip
+        S_j = [0] * L
+        for i in range(L):
+            if self.cur_inventory[i] < max(self.trigger_points[i], demand[i]):
+                S_j[i] = 1
+        self.S.append(S_j)
+        # compute baseloop of the period
+        baseloop = get_baseloop_skipping(Lambda, t, S_j)
+        self.total_baseloop += baseloop
+        for i in range(L):
+            if S_j[i] == 1:
+                # a horizon that starts with enough inventory can plan a lambda
+                # of 0, and items with a lambda of 0 alone run no loop
+                num_baseloop = math.floor(self.total_time / baseloop) \
+                               if baseloop > 0 else 0
+                production = Lambda[i] * num_baseloop
+                if sum(S_j) > 1:
+                    self.total_changeover_cost += self.changeover_cost[i] * num_baseloop
+                if production + self.cur_inventory[i] < demand[i]:
+                    self.demand_met = False
+            else:
+                production = 0
+
+            # update inventory and holding cost
+            self.cur_inventory[i] = production + self.cur_inventory[i] - demand[i]
+            self.total_holding_cost += self.holding_cost[i] * self.cur_inventory[i]
+        return baseloop
+
+    def get_average_baseloop(self):
+        '''
+        Returns the average Base Loop time of the simulated periods, -1 if a
+        period did not meet demand or the cost exceeds the cost tolerance
+        '''
+        if not self.S or not self.demand_met or self.total_holding_cost + \
+           self.total_changeover_cost > self.cost_tolerance:
+            return -1
+        return self.total_baseloop / len(self.S)
+
+
+def main():
+
+    num_initial_periods = 6
+    horizon_length = 6
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    num_items = csv_input.num_items
+    demand_schedule = csv_input.demand_schedule_array
+    trigger_points = np.zeros(num_items)
+
+    planner = RollingHorizonPlanner(num_items, \
+                                    csv_input.production_times_array, \
+                                    csv_input.total_time, \
+                                    csv_input.initial_inventories_array, \
+                                    demand_schedule[:num_initial_periods], \
+                                    csv_input.cost_tolerance, \
+                                    csv_input.changeover_cost_array, \
+                                    csv_input.inventory_cost_array, \
+                                    trigger_points, horizon_length)
+    print("periods: {}, lambdas: {}".format(planner.num_periods, planner.Lambda))
+    for j in range(num_initial_periods, csv_input.num_periods):
+        planner.append_period(demand_schedule[j])
+        print("periods: {}, lambdas: {}, average baseloop so far: {}".format(\
+              planner.num_periods, planner.Lambda, planner.get_average_baseloop()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Collects the results of the skipping simulation: keeps the best feasible
+# Lambdas in a bounded heap, can stream every evaluated Lambda to disk and
+# saves checkpoints of a simulation.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import heapq
+import json
+import os
+import tempfile
+import numpy as np
+
+
+class TopKResults:
+
+    def __init__(self, num_best=10, stream_path=None, num_items=None, state=None):
+        '''
+        This class keeps the num_best feasible Lambdas with the smallest average
+        Base Loop in a heap of fixed size. Among Lambdas with the same average
+        Base Loop, the one added first ranks first and is kept; once the heap is
+        full, later ties with the worst result kept are dropped.
+
+        If stream_path is given, every evaluated Lambda, feasible or not, is
+        also appended to a columnar store in that directory, so that runs with
+        millions of samples keep a constant amount of memory. The store is read
+        back with read_streamed_results.
+
+        If state is given, the collector continues from a state returned by
+        get_state, and evaluations streamed after that state are discarded.
+
+        Instance variables:
+        self.num_best := the number of results kept
+        self.heap := a heap of (-average Base Loop, -order added, Lambda), its
+                     first entry is the worst result kept
+        self.num_added := the number of feasible results added so far
+        self.num_streamed := the number of evaluated Lambdas streamed so far
+        self.pruned_at := a list counting the evaluations pruned in each time
+                          period, None if the search did not prune
+        '''
+        self.num_best = num_best
+        self.heap = []
+        self.num_added = 0
+        self.num_streamed = 0
+        self.pruned_at = None
+        self.stream_path = stream_path
+        if state is not None:
+            self.set_state(state)
+        elif stream_path is not None:
+            open_result_stream(stream_path, num_items)
+
+    def add(self, avg_baseloop, Lambda):
+        '''
+        Adds one feasible result
+
+        PARAMETERS:
+        avg_baseloop := the average Base Loop of Lambda
+        Lambda := a list of L items
+
+        RETURN:
+        True if the result is kept
+        '''
+        # NumPy scalars are stored as Python numbers, so the state is json
+        Lambda = [value.item() if isinstance(value, np.generic) else value \
+                  for value in Lambda]
+        entry = (-float(avg_baseloop), -self.num_added, Lambda)
+        self.num_added += 1
+        if len(self.heap) < self.num_best:
+            heapq.heappush(self.heap, entry)
+            return True
+        if entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+
+    def add_batch(self, avg_baseloop, Lambdas):
+        '''
+        Adds the results of a batch of evaluations, in order. Infeasible
+        results, with an average Base Loop of -1, are only streamed.
+
+        PARAMETERS:
+        avg_baseloop := an (N,) array of average Base Loops
+        Lambdas := an (N, L) array or a list of N Lambdas
+
+        RETURN:
+        None
+        '''
+        avg_baseloop = np.asarray(avg_baseloop, dtype=float)
+        if self.stream_path is not None:
+            append_result_stream(self.stream_path, avg_baseloop, Lambdas)
+            self.num_streamed += len(avg_baseloop)
+
+        candidates = avg_baseloop != -1
+        threshold = self.threshold()
+        if threshold is not None:
+            # results added later only enter if strictly better than the worst
+            candidates &= avg_baseloop < threshold
+        for k in np.flatnonzero(candidates):
+            self.add(avg_baseloop[k], Lambdas[k])
+
+    def threshold(self):
+        '''
+        Returns the average Base Loop a new result has to beat to be kept
+
+        RETURN:
+        The worst kept average Base Loop, or None while fewer than num_best
+        results are kept
+        '''
+        if len(self.heap) < self.num_best or self.num_best == 0:
+            return None
+        return -self.heap[0][0]
+
+    def num_pruned(self):
+        '''
+        Returns the number of pruned evaluations, 0 if the search did not prune
+        '''
+        return sum(self.pruned_at) if self.pruned_at is not None else 0
+
+    def merge(self, other):
+        '''
+        Adds the kept results of another collector, best first, and its counts
+        of pruned evaluations
+
+        PARAMETERS:
+        other := a TopKResults
+
+        RETURN:
+        None
+        '''
+        for avg_baseloop, Lambda in other.best():
+            self.add(avg_baseloop, Lambda)
+        if other.pruned_at is not None:
+            if self.pruned_at is None:
+                self.pruned_at = [0] * len(other.pruned_at)
+            for j in range(len(other.pruned_at)):
+                self.pruned_at[j] += other.pruned_at[j]
+
+    def get_state(self):
+        '''
+        Returns the kept results and counts in a form that can be saved as json
+
+        RETURN:
+        A dictionary
+        '''
+        return {'num_best': self.num_best, 'heap': [list(entry) for entry in self.heap], \
+                'num_added': self.num_added, 'num_streamed': self.num_streamed, \
+                'pruned_at': self.pruned_at}
+
+    def set_state(self, state):
+        '''
+        Restores the kept results and counts of get_state. The result stream
+        is cut back to the evaluations streamed when the state was taken.
+
+        PARAMETERS:
+        state := a dictionary returned by get_state
+
+        RETURN:
+        None
+        '''
+        self.num_best = state['num_best']
+        self.heap = [tuple(entry) for entry in state['heap']]
+        heapq.heapify(self.heap)
+        self.num_added = state['num_added']
+        self.num_streamed = state['num_streamed']
+        self.pruned_at = state['pruned_at']
+        if self.stream_path is not None:
+            truncate_result_stream(self.stream_path, self.num_streamed)
+
+    def best(self):
+        '''
+        Returns the kept results from the best to the worst
+
+        RETURN:
+        A list of (average Base Loop, Lambda) tuples
+        '''
+        return [(-entry[0], entry[2]) for entry in sorted(self.heap, reverse=True)]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def open_result_stream(stream_path, num_items):
+    '''
+    Creates an empty columnar store of evaluated Lambdas. Each column is a raw
+    binary file: avg_baseloop.f8 holds float64 averages (-1 if infeasible) and
+    lambda.i8 holds int64 Lambdas, num_items per row.
+
+    PARAMETERS:
+    stream_path := the directory of the store
+    num_items := the number of items in each Lambda
+
+    RETURN:
+    None
+    '''
+    os.makedirs(stream_path, exist_ok=True)
+    with open(os.path.join(stream_path, 'meta.json'), 'w') as meta_file:
+        json.dump({'num_items': num_items}, meta_file)
+    for column in ('avg_baseloop.f8', 'lambda.i8'):
+        open(os.path.join(stream_path, column), 'wb').close()
+
+
+def append_result_stream(stream_path, avg_baseloop, Lambdas):
+    '''
+    Appends a batch of evaluated Lambdas to a columnar store
+
+    PARAMETERS:
+    stream_path := the directory of the store
+    avg_baseloop := an (N,) array of average Base Loops
+    Lambdas := an (N, L) array or a list of N Lambdas
+
+    RETURN:
+    None
+    '''
+    with open(os.path.join(stream_path, 'avg_baseloop.f8'), 'ab') as column:
+        column.write(np.asarray(avg_baseloop, dtype='<f8').tobytes())
+    with open(os.path.join(stream_path, 'lambda.i8'), 'ab') as column:
+        column.write(np.asarray(Lambdas, dtype='<i8').tobytes())
+
+
+def truncate_result_stream(stream_path, num_streamed):
+    '''
+    Cuts a columnar store back to its first num_streamed evaluated Lambdas
+
+    PARAMETERS:
+    stream_path := the directory of the store
+    num_streamed := the number of evaluated Lambdas kept
+
+    RETURN:
+    None
+    '''
+    with open(os.path.join(stream_path, 'meta.json')) as meta_file:
+        num_items = json.load(meta_file)['num_items']
+    for column, row_size in (('avg_baseloop.f8', 8), ('lambda.i8', 8 * num_items)):
+        with open(os.path.join(stream_path, column), 'r+b') as column_file:
+            column_file.truncate(num_streamed * row_size)
+
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    '''
+    Saves a checkpoint as json. The checkpoint is written to a temporary file
+    in the same directory, which then replaces the previous checkpoint, so
+    the file always holds a complete checkpoint even if the run is killed.
+
+    PARAMETERS:
+    checkpoint_path := the path of the checkpoint file
+    checkpoint := a dictionary that can be saved as json
+
+    RETURN:
+    None
+    '''
+    checkpoint_dir = os.path.dirname(os.path.abspath(checkpoint_path))
+    file_handle, temp_path = tempfile.mkstemp(dir=checkpoint_dir, suffix='.tmp')
+    try:
+        with os.fdopen(file_handle, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, checkpoint_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_checkpoint(checkpoint_path):
+    '''
+    Reads a checkpoint written by write_checkpoint
+
+    PARAMETERS:
+    checkpoint_path := the path of the checkpoint file
+
+    RETURN:
+    The checkpoint dictionary, or None if there is no checkpoint
+    '''
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def get_rng_state(rng):
+    '''
+    Returns the state of a random.Random, or of the random module, in a form
+    that can be saved as json
+    '''
+    version, internal_state, gauss_next = rng.getstate()
+    return [version, list(internal_state), gauss_next]
+
+
+def set_rng_state(rng, state):
+    '''
+    Restores a state returned by get_rng_state
+    '''
+    version, internal_state, gauss_next = state
+    rng.setstate((version, tuple(internal_state), gauss_next))
+
+
+def read_streamed_results(stream_path):
+    '''
+    Memory-maps the columns of a store written by TopKResults
+
+    PARAMETERS:
+    stream_path := the directory of the store
+
+    RETURN:
+    A tuple of an (N,) array of average Base Loops and an (N, L) array of
+    Lambdas
+    '''
+    with open(os.path.join(stream_path, 'meta.json')) as meta_file:
+        num_items = json.load(meta_file)['num_items']
+    if os.path.getsize(os.path.join(stream_path, 'avg_baseloop.f8')) == 0:
+        return np.zeros(0), np.zeros((0, num_items), dtype=np.int64)
+    avg_baseloop = np.memmap(os.path.join(stream_path, 'avg_baseloop.f8'), \
+                             dtype='<f8', mode='r')
+    Lambdas = np.memmap(os.path.join(stream_path, 'lambda.i8'), dtype='<i8', \
+                        mode='r').reshape(-1, num_items)
+    return avg_baseloop, Lambdas
@@ -0,0 +1,383 @@
+# The skipping model as a mixed integer program: solves for the Lambdas and the
+# skip schedule together instead of sampling Lambdas around the cost model.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import math
+import numpy as np
+from mip import Model, xsum, minimize, BINARY, INTEGER, OptimizationStatus
+from cost_model import cost_model
+from find_skipping_coeff import get_average_baseloop_time_batch
+from input_reader import BaseLoopInputData
+from instrumentation import optimize_model
+
+# an item is produced once its inventory is this much below its trigger point
+# or demand. Smaller values are lost in the big-M constants of the model
+INVENTORY_TOLERANCE = 1e-3
+
+
+def skipping_model(L, J, I0, h, a, trigger_points, D, t, Tau, T, max_lambda=200, min_lambda=1, max_loops=None, full_loops=True, initial_lambda=None, max_seconds=None, max_mip_gap=None, threads=None, verbose=False):
+    '''
+    Solves the skipping model exactly. Binary skip coefficients S[j][i] and
+    the Lambdas are decision variables, and inventory is balanced across
+    periods. Production of item i in period j is Lambda[i] * S[j][i] * n[j],
+    where n[j] is the number of base loops run in period j. This product is
+    linearized by writing n[j] in binary and bounding each product of a
+    bounded variable with a binary variable by four linear constraints.
+
+    With full_loops, n[j] is the largest number of base loops that fits in
+    T, as in get_average_baseloop_time. As there, an item is produced exactly
+    when its inventory is below its trigger point or its demand, and every
+    item has to meet demand, so the model follows the skipping heuristic and
+    is not a relaxation of it. Changeover cost is paid for each produced item
+    and loop in periods where more than one item is produced.
+
+    The big-M constants are per item and period. No lambda is above
+    T / t[i], since one loop of the item has to fit in a period, and the
+    loop counts of an item are relaxed by the bound on n[j], as a skipped
+    item does not bound the loops of the period. The skip schedule of the
+    first period only depends on the initial inventory, so it is fixed and
+    bounds n[0] by the items produced.
+
+    PARAM:
+    L: number of items
+    J: number of time periods
+    I0: a list of item initial inventories
+    h: inventory cost
+    a: changeover cost
+    trigger_points: a list of item trigger points
+    D: A list of lists containing all item demands in each time period
+    t: a list of time takes to produce one unit of item
+    Tau: cost tolerance
+    T: the total time available to run the loop in each time period
+    max_lambda: upper bound on each lambda, used in the linearization
+    min_lambda: lower bound on each lambda. A larger bound allows fewer loops
+                in a period, and so tighter constraints
+    max_loops: upper bound on the number of base loops in a period. By default
+               the number of loops of the shortest possible base loop
+    full_loops: whether each period runs as many base loops as fit in T
+    initial_lambda: a list of L items used as a MIP start, through the skip
+                    schedule get_average_baseloop_time finds for them
+    max_seconds: time limit of the solver
+    max_mip_gap: relative optimality gap at which the solver stops
+    threads: number of threads of the solver
+    verbose: whether the solver prints its progress
+
+    RETURN:
+    A dictionary with the solver status, the Lambdas, the skip schedule S, the
+    number of base loops in each period, the average Base Loop (objective),
+    its lower bound, the relative gap, and the holding and changeover cost.
+    Lambdas, S and costs are None if no solution was found.
+    '''
+    t = np.asarray(t, dtype=float)
+    D = np.asarray(D, dtype=float).reshape(J, L)
+    produce_first = get_first_period_schedule(L, I0, trigger_points, D)
+    max_loops = get_max_loops(L, J, t, T, min_lambda, max_loops, produce_first)
+    num_bits = [max(1, max_loops[j].bit_length()) for j in range(J)]
+    # upper bound on each lambda
+    U = [max(min_lambda, min(max_lambda, math.floor(T / t[i]))) for i in range(L)]
+    # upper bound on the inventory at the start of each period
+    max_inventory = get_max_inventory(L, J, I0, D, t, T)
+
+    # initialize model
+    model = Model('skipping model')
+    model.verbose = 1 if verbose else 0
+    if threads is not None:
+        model.threads = threads
+    if max_mip_gap is not None:
+        model.max_mip_gap = max_mip_gap
+
+    # add model variables
+    Lambda = [model.add_var(lb=min_lambda, ub=U[i], var_type=INTEGER) \
+              for i in range(L)]
+    S = [[model.add_var(var_type=BINARY) for i in range(L)] for j in range(J)]
+    # bits of the number of loops in each period
+    y = [[model.add_var(var_type=BINARY) for b in range(num_bits[j])] \
+         for j in range(J)]
+    # Lambda[i] * S[j][i]
+    w = [[model.add_var(ub=U[i]) for i in range(L)] for j in range(J)]
+    # Lambda[i] * S[j][i] * y[j][b]
+    z = [[[model.add_var(ub=U[i]) for b in range(num_bits[j])] for i in range(L)] \
+         for j in range(J)]
+    # inventory at the end of each period
+    inventory = [[model.add_var() for i in range(L)] for j in range(J)]
+    # number of loops in which the item is produced, and in which it pays
+    # changeover because more than one item is produced
+    produced_loops = [[model.add_var() for i in range(L)] for j in range(J)]
+    changeover_loops = [[model.add_var() for i in range(L)] for j in range(J)]
+    multiple_items = [model.add_var(var_type=BINARY) for j in range(J)]
+    any_item = [model.add_var(var_type=BINARY) for j in range(J)]
+
+    # set model objective: average Base Loop
+    model.objective = minimize(xsum(t[i] * w[j][i] for j in range(J) \
+                                    for i in range(L)) / J)
+
+    holding_cost = []
+    changeover_cost = []
+    for j in range(J):
+        num_loops = xsum(2**b * y[j][b] for b in range(num_bits[j]))
+        model += num_loops <= max_loops[j]
+
+        for i in range(L):
+            # w = Lambda * S
+            model += w[j][i] <= U[i] * S[j][i]
+            model += w[j][i] <= Lambda[i]
+            model += w[j][i] >= Lambda[i] - U[i] * (1 - S[j][i])
+            # z = w * y
+            for b in range(num_bits[j]):
+                model += z[j][i][b] <= U[i] * y[j][b]
+                model += z[j][i][b] <= w[j][i]
+                model += z[j][i][b] >= w[j][i] - U[i] * (1 - y[j][b])
+
+        production = [xsum(2**b * z[j][i][b] for b in range(num_bits[j])) \
+                      for i in range(L)]
+
+        # all loops fit in the period, and one more would not
+        model += xsum(t[i] * production[i] for i in range(L)) <= T
+        for i in range(L):
+            model += S[j][i] <= any_item[j]
+        if full_loops:
+            model += xsum(t[i] * (production[i] + w[j][i]) for i in range(L)) \
+                     >= (T + 1e-6) * any_item[j]
+
+        for i in range(L):
+            start_inventory = I0[i] if j == 0 else inventory[j-1][i]
+            # inventory balance, inventory is non-negative so demand is met
+            model += inventory[j][i] == start_inventory + production[i] - D[j][i]
+            # skip only at or above the trigger point, and produce only below
+            # the trigger point or the demand
+            reorder_point = max(trigger_points[i], D[j][i])
+            if j == 0:
+                model += S[j][i] == produce_first[i]
+            else:
+                model += start_inventory >= trigger_points[i] * (1 - S[j][i])
+                model += start_inventory <= reorder_point - INVENTORY_TOLERANCE + \
+                         (max_inventory[j][i] - reorder_point + \
+                          INVENTORY_TOLERANCE) * (1 - S[j][i])
+            # loops in which the item is produced and pays changeover
+            model += produced_loops[j][i] >= num_loops - \
+                     max_loops[j] * (1 - S[j][i])
+            model += changeover_loops[j][i] >= produced_loops[j][i] - \
+                     max_loops[j] * (1 - multiple_items[j])
+
+            holding_cost.append(h[i] * inventory[j][i])
+            changeover_cost.append(a[i] * changeover_loops[j][i])
+
+        model += xsum(S[j][i] for i in range(L)) <= 1 + (L - 1) * multiple_items[j]
+
+    # feasibility: cost tolerance in a year
+    model += xsum(holding_cost) + xsum(changeover_cost) <= Tau
+
+    if initial_lambda is not None:
+        start = get_mip_start(L, J, I0, h, a, trigger_points, D, t, Tau, T, \
+                              initial_lambda, U, min_lambda, max_loops)
+        if start is not None:
+            Lambda_start, S_start, loops_start = start
+            model.start = get_mip_start_values(L, J, num_bits, Lambda, S, y, \
+                          Lambda_start, S_start, loops_start)
+
+    # solve for model
+    if max_seconds is None:
+        status = optimize_model(model, 'optimize_skipping_model')
+    else:
+        status = optimize_model(model, 'optimize_skipping_model', \
+                                max_seconds=max_seconds)
+
+    result = {'status': status.name, 'lambda': None, 'S': None, \
+              'num_loops': None, 'avg_baseloop': None, \
+              'objective_bound': model.objective_bound, 'gap': None, \
+              'holding_cost': None, 'changeover_cost': None}
+    if status in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE):
+        result['lambda'] = [int(round(Lambda[i].x)) for i in range(L)]
+        result['S'] = [[int(round(S[j][i].x)) for i in range(L)] for j in range(J)]
+        result['num_loops'] = [int(round(sum(2**b * y[j][b].x for b in \
+                               range(num_bits[j])))) for j in range(J)]
+        result['avg_baseloop'] = model.objective_value
+        result['gap'] = model.gap
+        result['holding_cost'] = float(sum(h[i] * inventory[j][i].x for j in \
+                                           range(J) for i in range(L)))
+        # changeover_loops is only bounded from below, recompute it exactly
+        result['changeover_cost'] = float(sum(a[i] * result['num_loops'][j] * \
+                                    result['S'][j][i] for j in range(J) for i \
+                                    in range(L) if sum(result['S'][j]) > 1))
+    return result
+
+
+def get_first_period_schedule(L, I0, trigger_points, D):
+    '''
+    Finds the items produced in the first period, which only depend on the
+    initial inventory
+
+    PARAM:
+    L: number of items
+    I0: a list of item initial inventories
+    trigger_points: a list of item trigger points
+    D: a J by L array of item demands
+
+    RETURN:
+    A list of L skipping coefficients
+    '''
+    return [1 if I0[i] < max(trigger_points[i], D[0][i]) else 0 for i in range(L)]
+
+
+def get_max_loops(L, J, t, T, min_lambda, max_loops, produce_first):
+    '''
+    Bounds the number of base loops in each period by the loops of the
+    shortest base loop. In the first period, the base loop has every item
+    that is produced.
+
+    PARAM:
+    L, J, t, T, min_lambda, max_loops: same as skipping_model
+    produce_first: the skipping coefficients of the first period
+
+    RETURN:
+    A list of J upper bounds
+    '''
+    shortest_loop = [min_lambda * t.min()] * J
+    shortest_loop[0] = sum(min_lambda * t[i] for i in range(L) if produce_first[i])
+    bounds = []
+    for j in range(J):
+        bound = math.floor(T / shortest_loop[j]) if shortest_loop[j] > 0 else 0
+        if max_loops is not None:
+            bound = min(bound, int(max_loops))
+        bounds.append(bound)
+    return bounds
+
+
+def get_max_inventory(L, J, I0, D, t, T):
+    '''
+    Bounds the inventory at the start of each period by the initial inventory
+    plus the most that can be produced, less the demand so far. An item is
+    produced for at most T in a period.
+
+    PARAM:
+    L, J, I0, t, T: same as skipping_model
+    D: a J by L array of item demands
+
+    RETURN:
+    A J by L list of upper bounds
+    '''
+    max_inventory = [list(I0)]
+    for j in range(1, J):
+        max_inventory.append([max_inventory[j-1][i] + T / t[i] - D[j-1][i] \
+                              for i in range(L)])
+    return max_inventory
+
+
+def get_mip_start(L, J, I0, h, a, trigger_points, D, t, Tau, T, initial_lambda, max_lambda, min_lambda, max_loops):
+    '''
+    Simulates the skipping heuristic of get_average_baseloop_time for the given
+    Lambdas, to start the solver from its skip schedule
+
+    PARAM:
+    L, J, I0, h, a, trigger_points, D, t, Tau, T: same as skipping_model
+    initial_lambda: a list of L items
+    max_lambda: a list of upper bounds on each lambda
+    min_lambda: lower bound on each lambda
+    max_loops: a list of upper bounds on the number of base loops in a period
+
+    RETURN:
+    A tuple of the Lambdas, the skip schedule and the number of loops in each
+    period, or None if the Lambdas are infeasible or out of bounds
+    '''
+    Lambda = [int(round(value)) for value in initial_lambda]
+    if min(Lambda) < min_lambda or \
+       any(Lambda[i] > max_lambda[i] for i in range(L)):
+        return None
+
+    avg_baseloop, feasible, holding_cost, changeover_cost, S = \
+        get_average_baseloop_time_batch(L, J, I0, h, a, trigger_points, D, \
+                                        [Lambda], t, Tau, T)
+    if not feasible[0]:
+        return None
+
+    S = S[0].tolist()
+    num_loops = []
+    for j in range(J):
+        baseloop = sum(Lambda[i] * t[i] * S[j][i] for i in range(L))
+        num_loops.append(math.floor(T / baseloop) if baseloop > 0 else 0)
+    if any(num_loops[j] > max_loops[j] for j in range(J)):
+        return None
+
+    return Lambda, S, num_loops
+
+
+def get_mip_start_values(L, J, num_bits, Lambda, S, y, Lambda_start, S_start, loops_start):
+    '''
+    Pairs the decision variables with their values in a MIP start. The solver
+    completes the values of the continuous variables.
+
+    PARAM:
+    L, J: the dimensions of the model
+    num_bits: a list of the number of loop bits in each period
+    Lambda, S, y: the Lambda, skip and loop bit variables of the model
+    Lambda_start, S_start, loops_start: the values returned by get_mip_start
+
+    RETURN:
+    A list of (variable, value) tuples
+    '''
+    start = [(Lambda[i], Lambda_start[i]) for i in range(L)]
+    for j in range(J):
+        start += [(S[j][i], S_start[j][i]) for i in range(L)]
+        start += [(y[j][b], (loops_start[j] >> b) & 1) for b in range(num_bits[j])]
+    return start
+
+
+def display_skipping_model_results(result):
+    '''
+    Displays the solution of the skipping model
+
+    PARAMETERS:
+    result := the dictionary returned by skipping_model
+
+    RETURN:
+    None
+    '''
+    print("***************************")
+    print("Skipping Model Output:")
+    print("Status: {}".format(result['status']))
+    if result['lambda'] is not None:
+        print("Optimal Choice of Lambdas: {}".format(result['lambda']))
+        print("Optimal average baseloop: {}".format(result['avg_baseloop']))
+        print("Lower bound: {}, gap: {}".format(result['objective_bound'], \
+                                                result['gap']))
+        print("Skipping coefficients: {}".format(result['S']))
+        print("Holding cost: {}, changeover cost: {}".format(\
+              result['holding_cost'], result['changeover_cost']))
+    else:
+        print("No feasible solution found")
+    print("***************************")
+
+
+def main():
+
+    csv_input = BaseLoopInputData('Input_Data.csv')
+    num_items = csv_input.num_items
+    demand_schedule = csv_input.demand_schedule_array
+    demand_schedule_init = np.vstack((np.zeros((1, num_items)), demand_schedule))
+    trigger_points = np.zeros(num_items)
+
+    # start from the Lambdas of the cost model
+    optimal_lambdas = cost_model(num_items, csv_input.num_periods, \
+                                 csv_input.production_times_array, \
+                                 csv_input.total_time, \
+                                 csv_input.initial_inventories_array, \
+                                 demand_schedule, csv_input.cost_tolerance, \
+                                 csv_input.changeover_cost_array, \
+                                 csv_input.inventory_cost_array, \
+                                 demand_schedule_init)
+    if optimal_lambdas == -1:
+        optimal_lambdas = None
+
+    result = skipping_model(num_items, csv_input.num_periods, \
+                            csv_input.initial_inventories, \
+                            csv_input.inventory_cost, csv_input.changeover_cost, \
+                            trigger_points, csv_input.demand_schedule_array, \
+                            csv_input.production_times_array, \
+                            csv_input.cost_tolerance, csv_input.total_time, \
+                            initial_lambda=optimal_lambdas, \
+                            max_seconds=60)
+    display_skipping_model_results(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Tests of the skipping model against the skipping heuristic on instances
+# small enough to try every Lambda.
+# @author Rosa Zhou
+# @author Will Thompson
+
+import itertools
+import math
+import unittest
+from find_skipping_coeff import get_average_baseloop_time
+from skipping_mip import skipping_model
+
+
+def get_best_heuristic_lambda(L, J, I0, h, a, trigger_points, D, t, Tau, T):
+    '''
+    Evaluates every Lambda with get_average_baseloop_time, each lambda from 1
+    to the most units of the item that fit in a period
+
+    PARAM:
+    L, J, I0, h, a, trigger_points, D, t, Tau, T: same as skipping_model
+
+    RETURN:
+    A tuple of the smallest average Base Loop, -1 if no Lambda is feasible,
+    and a Lambda that reaches it
+    '''
+    best_avg_baseloop, best_lambda = -1, None
+    ranges = [range(1, math.floor(T / t[i]) + 1) for i in range(L)]
+    for Lambda in itertools.product(*ranges):
+        avg_baseloop = get_average_baseloop_time(L, J, list(I0), h, a, \
+                       trigger_points, D, list(Lambda), t, Tau, T, False)
+        if avg_baseloop != -1 and (best_lambda is None or \
+                                   avg_baseloop < best_avg_baseloop):
+            best_avg_baseloop, best_lambda = avg_baseloop, list(Lambda)
+    return best_avg_baseloop, best_lambda
+
+
+class SkippingModelTest(unittest.TestCase):
+
+    def assert_matches_heuristic(self, L, J, I0, h, a, trigger_points, D, t, Tau, T):
+        best_avg_baseloop, best_lambda = get_best_heuristic_lambda(L, J, I0, h, \
+                                         a, trigger_points, D, t, Tau, T)
+        result = skipping_model(L, J, I0, h, a, trigger_points, D, t, Tau, T)
+        if best_lambda is None:
+            self.assertIsNone(result['lambda'])
+            return
+        self.assertEqual(result['status'], 'OPTIMAL')
+        self.assertAlmostEqual(result['avg_baseloop'], best_avg_baseloop, places=6)
+        # the Lambdas of the model are accepted by the heuristic
+        self.assertAlmostEqual(get_average_baseloop_time(L, J, list(I0), h, a, \
+                               trigger_points, D, result['lambda'], t, Tau, T, \
+                               False), best_avg_baseloop, places=6)
+
+    def test_skipped_item_pays_no_changeover(self):
+        # the second item is never produced, so the first one runs alone
+        self.assert_matches_heuristic(2, 2, [0, 1000], [0, 0.001], [1, 1], \
+                                      [0, 0], [[30, 0], [30, 0]], [1, 3], 2, 30)
+
+    def test_two_produced_items(self):
+        self.assert_matches_heuristic(2, 3, [0, 5], [0.01, 0.01], [0.1, 0.1], \
+                                      [0, 0], [[10, 4], [10, 4], [10, 4]], \
+                                      [1, 2], 20, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()